@@ -0,0 +1,203 @@
+import re
+import json
+import time
+import threading
+import numpy as np
+from pathlib import Path
+from collections import OrderedDict
+
+class AnswerCache:
+    """Two-tier cache of /api/ responses.
+
+    The exact tier matches questions after normalizing case, whitespace and
+    trailing punctuation. The semantic tier returns the answer of a cached
+    question whose embedding has cosine similarity >= threshold with the new
+    one. Entries are evicted least-recently-used beyond max_entries and
+    expire after ttl seconds. If path is set, entries persist across restarts
+    (an npz file: question embeddings as an array, the rest as UTF-8 JSON); every
+    save_every puts they are saved, in executor when one is given so the
+    caller (the event loop) only pays for copying the entries.
+    """
+
+    def __init__(self, max_entries=1000, ttl=24 * 3600, threshold=0.95, path=None, save_every=20,
+                 executor=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.path = Path(path) if path else None
+        self.save_every = save_every
+        self.executor = executor
+        self.entries = OrderedDict()  # normalized question -> entry
+        self.vectors = None  # max_entries x dim matrix of unit question embeddings
+        self.slot_created = None  # created_at per slot, to skip expired entries
+        self.free_slots = []
+        self.slot_keys = {}  # slot -> normalized question
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+        self.unsaved = 0
+        # Snapshots are numbered so a slow write never replaces a newer one
+        self.snapshots = 0
+        self.written = 0
+        self.write_lock = threading.Lock()
+        if self.path and self.path.exists():
+            self.load()
+
+    @staticmethod
+    def normalize(text):
+        text = re.sub(r"\s+", " ", text.lower()).strip()
+        return text.rstrip("?!. ")
+
+    def get_exact(self, question):
+        """Return the cached response for an identical question, or None.
+
+        Misses are not counted here: a lookup that misses both tiers is
+        counted once by the caller with record_miss().
+        """
+        key = self.normalize(question)
+        entry = self.entries.get(key)
+        if entry is None or self._expired(entry):
+            if entry is not None:
+                self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        self.hits["exact"] += 1
+        return self._response(entry)
+
+    def get_semantic(self, embedding):
+        """Return the cached response of the most similar live question above the threshold, or None."""
+        if not self.entries:
+            return None
+        slots = np.fromiter(self.slot_keys, dtype=np.int64)
+        if self.ttl > 0:
+            # Evict expired entries first, so they cannot shadow a live match
+            expired = time.time() - self.slot_created[slots] > self.ttl
+            for slot in slots[expired]:
+                self._remove(self.slot_keys[int(slot)])
+            slots = slots[~expired]
+            if len(slots) == 0:
+                return None
+        scores = self.vectors[slots] @ self._unit(embedding)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        key = self.slot_keys[int(slots[best])]
+        entry = self.entries[key]
+        self.entries.move_to_end(key)
+        self.hits["semantic"] += 1
+        return self._response(entry)
+
+    def put(self, question, embedding, response):
+        """Cache response for question, evicting the least recently used entry if full."""
+        if self.max_entries <= 0:
+            return
+        key = self.normalize(question)
+        if key in self.entries:
+            self._remove(key)
+        while len(self.entries) >= self.max_entries:
+            self._remove(next(iter(self.entries)))
+        self._insert(key, embedding, response, time.time())
+
+        self.unsaved += 1
+        if self.path and self.unsaved >= self.save_every:
+            self.save()
+
+    def record_miss(self):
+        """Count a lookup that missed every tier."""
+        self.misses += 1
+
+    def stats(self):
+        lookups = self.hits["exact"] + self.hits["semantic"] + self.misses
+        return {
+            "entries": len(self.entries),
+            "exact_hits": self.hits["exact"],
+            "semantic_hits": self.hits["semantic"],
+            "misses": self.misses,
+            "hit_rate": (lookups - self.misses) / lookups if lookups else 0.0
+        }
+
+    def save(self, block=False):
+        """Persist non-expired entries (in the executor, if any, unless block)."""
+        if not self.path:
+            return
+        snapshot = self.snapshot()
+        self.unsaved = 0
+        if self.executor is None or block:
+            self.write(snapshot)
+        else:
+            self.executor.submit(self.write, snapshot)
+
+    def snapshot(self):
+        """Copy of the non-expired entries and their embeddings, for write()."""
+        live = [(key, entry) for key, entry in self.entries.items() if not self._expired(entry)]
+        items = [{"question": key, "answer": entry["answer"], "links": entry["links"],
+                  "created_at": entry["created_at"]} for key, entry in live]
+        if live:
+            vectors = self.vectors[[entry["slot"] for _, entry in live]]
+        else:
+            vectors = np.zeros((0, 0 if self.vectors is None else self.vectors.shape[1]), dtype=np.float32)
+        self.snapshots += 1
+        return self.snapshots, items, vectors
+
+    def write(self, snapshot):
+        """Write a snapshot to the persistence file (blocking; safe from worker threads)."""
+        number, items, vectors = snapshot
+        with self.write_lock:
+            if number < self.written:
+                return  # a newer snapshot is already on disk
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                entries = np.frombuffer(json.dumps(items, ensure_ascii=False).encode("utf-8"), dtype=np.uint8)
+                np.savez(f, vectors=vectors, entries=entries)
+            tmp_path.replace(self.path)
+            self.written = number
+
+    def load(self):
+        try:
+            with np.load(self.path) as data:
+                items = json.loads(data["entries"].tobytes().decode("utf-8"))
+                vectors = data["vectors"]
+        except ValueError:
+            # JSON file of earlier versions, with each embedding as a list
+            with open(self.path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+            vectors = [item["embedding"] for item in items]
+        start = max(len(items) - self.max_entries, 0)
+        for item, vector in zip(items[start:], vectors[start:]) if self.max_entries > 0 else []:
+            entry = {"answer": item["answer"], "links": item["links"], "created_at": item["created_at"]}
+            if not self._expired(entry):
+                self._insert(item["question"], vector, entry, item["created_at"])
+
+    def _insert(self, key, embedding, response, created_at):
+        vector = self._unit(embedding)
+        if self.vectors is None:
+            self.vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            self.slot_created = np.zeros(self.max_entries, dtype=np.float64)
+            self.free_slots = list(range(self.max_entries - 1, -1, -1))
+        slot = self.free_slots.pop()
+        self.vectors[slot] = vector
+        self.slot_created[slot] = created_at
+        self.slot_keys[slot] = key
+        self.entries[key] = {
+            "answer": response["answer"],
+            "links": response["links"],
+            "created_at": created_at,
+            "slot": slot
+        }
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        del self.slot_keys[entry["slot"]]
+        self.free_slots.append(entry["slot"])
+
+    def _expired(self, entry):
+        return self.ttl > 0 and time.time() - entry["created_at"] > self.ttl
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    @staticmethod
+    def _response(entry):
+        return {"answer": entry["answer"], "links": [dict(link) for link in entry["links"]]}
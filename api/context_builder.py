@@ -0,0 +1,101 @@
+import os
+import re
+
+# Estimated prompt tokens allowed for the retrieved context (0 = whole chunks)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "600"))
+# Characters per token of Gemini's tokenizer on English text (an estimate;
+# the exact counts are reported by the API as llm_tokens_total)
+CHARS_PER_TOKEN = 4
+# Marks sentences left out between kept ones
+GAP = "…"
+
+# Markup that costs tokens without adding meaning: HTML tags left in window
+# chunks, Markdown images, link targets, emphasis and heading marks
+MARKUP = [
+    (re.compile(r"<[^>\n]+>"), " "),
+    (re.compile(r"!\[[^\]]*\]\([^)]*\)"), ""),
+    (re.compile(r"\[([^\]]+)\]\([^)]*\)"), r"\1"),
+    (re.compile(r"(\*\*|__)(.+?)\1"), r"\2"),
+    (re.compile(r"^#{1,6}\s+", re.MULTILINE), ""),
+    (re.compile(r"[ \t]+"), " "),
+]
+
+def strip_markup(text):
+    for pattern, replacement in MARKUP:
+        text = pattern.sub(replacement, text)
+    return text.strip()
+
+def estimate_tokens(text):
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def sentence_key(sentence):
+    """Normalized sentence text, so copies match despite spacing and punctuation."""
+    return re.sub(r"\W+", " ", sentence.lower()).strip()
+
+def truncate(text, tokens):
+    """Cut text to about `tokens` tokens at a word boundary."""
+    if estimate_tokens(text) <= tokens:
+        return text
+    cut = text[:max(tokens - 1, 0) * CHARS_PER_TOKEN].rsplit(" ", 1)[0]
+    return f"{cut} {GAP}" if cut else ""
+
+def build_context(chunk_sentences, budget=CONTEXT_TOKEN_BUDGET):
+    """Assemble prompt context from retrieved chunks within a token budget.
+
+    chunk_sentences holds (sentences, similarities with the question) per
+    chunk, best chunk first, sentences in text order (see
+    RAGSystem.sentence_scores); leftover markup is stripped here.
+
+    - A sentence already in a better-ranked chunk is dropped, which removes
+      the overlap between adjacent window chunks and quoted posts.
+    - Each chunk first gets its most relevant sentence (cut to an equal
+      share of the budget if longer), then the remaining sentences are
+      added by similarity while they fit.
+    - Kept sentences stay in text order; GAP marks left-out stretches.
+    """
+    chunks = []
+    seen = set()
+    for sentences, scores in chunk_sentences:
+        kept = []
+        for position, (sentence, score) in enumerate(zip(sentences, scores)):
+            sentence = strip_markup(sentence)
+            key = sentence_key(sentence)
+            if key and key not in seen:
+                seen.add(key)
+                kept.append((position, sentence, float(score)))
+        if kept:
+            chunks.append(kept)
+    if not chunks:
+        return ""
+
+    chosen = [{} for _ in chunks]  # per chunk: position -> text
+    used = 0
+    share = budget // len(chunks) if budget else 0
+    for rank, kept in enumerate(chunks):
+        position, sentence, _ = max(kept, key=lambda item: item[2])
+        text = truncate(sentence, share) if budget else sentence
+        if text:
+            chosen[rank][position] = text
+            used += estimate_tokens(text) + 1
+    rest = sorted(((score, rank, position, sentence) for rank, kept in enumerate(chunks)
+                   for position, sentence, score in kept if position not in chosen[rank]), reverse=True)
+    for _, rank, position, sentence in rest:
+        cost = estimate_tokens(sentence) + 1
+        if budget and used + cost > budget:
+            continue  # a shorter sentence may still fit
+        chosen[rank][position] = sentence
+        used += cost
+
+    parts = []
+    for rank, kept in enumerate(chunks):
+        if not chosen[rank]:
+            continue
+        words = []
+        previous = None
+        for position in sorted(chosen[rank]):
+            if previous is not None and position != previous + 1:
+                words.append(GAP)
+            words.append(chosen[rank][position])
+            previous = position
+        parts.append(" ".join(words))
+    return "\n\n".join(parts)
@@ -0,0 +1,80 @@
+import os
+import numpy as np
+from pathlib import Path
+from api.vector_index import normalize_rows
+
+# Sentence-transformers model used for the corpus (MUST match embed_all_data.py)
+MODEL_NAME = "all-MiniLM-L6-v2"
+# Query embedding backend: "torch" (sentence-transformers) or "onnx" (onnxruntime)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# Model exported by python_scripts/export_onnx.py; tokenizer.json must sit next to it
+ONNX_MODEL = os.getenv("ONNX_MODEL", "data/models/all-MiniLM-L6-v2/model_int8.onnx")
+# onnxruntime intra-op threads; 0 lets onnxruntime decide
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+# all-MiniLM-L6-v2 truncates inputs to 256 tokens
+MAX_SEQ_LENGTH = 256
+
+class TorchBackend:
+    """sentence-transformers on PyTorch, the model the corpus was embedded with."""
+
+    def __init__(self, model_name=MODEL_NAME):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts, batch_size=32):
+        """Embed texts as unit-length float32 vectors."""
+        return self.model.encode(list(texts), batch_size=batch_size, convert_to_numpy=True,
+                                 normalize_embeddings=True)
+
+class OnnxBackend:
+    """The same transformer exported to ONNX (optionally int8), run by onnxruntime.
+
+    Reproduces the sentence-transformers pipeline (tokenize, transformer,
+    mean pooling over real tokens, L2 normalize) without importing torch.
+    """
+
+    def __init__(self, model_path=ONNX_MODEL, threads=ONNX_THREADS):
+        import onnxruntime
+        from tokenizers import Tokenizer
+        model_path = Path(model_path)
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+        self.dim = self.session.get_outputs()[0].shape[-1]
+
+        self.tokenizer = Tokenizer.from_file(str(model_path.parent / "tokenizer.json"))
+        self.tokenizer.enable_truncation(MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding()  # pad to the longest text of each batch
+
+    def encode(self, texts, batch_size=32):
+        """Embed texts as unit-length float32 vectors."""
+        texts = list(texts)
+        embeddings = [np.zeros((0, self.dim), dtype=np.float32)]
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": attention_mask
+            }
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+            hidden = self.session.run(None, feeds)[0]
+
+            # Mean pooling over real (non-padding) tokens
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            embeddings.append(normalize_rows(pooled))
+        return np.concatenate(embeddings)
+
+def get_embedding_backend(backend=None):
+    """Create the query embedding backend selected by EMBEDDING_BACKEND."""
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "torch":
+        return TorchBackend()
+    if backend == "onnx":
+        return OnnxBackend()
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
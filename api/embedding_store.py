@@ -0,0 +1,413 @@
+"""On-disk embedding store shared by embed_all_data.py (writer) and RAGSystem (reader).
+
+A store is a directory of raw little-endian arrays described by manifest.json:
+
+    embeddings.bin            count x dim matrix (float32, float16 or int8)
+    embedding_scales.bin      float32 scale per row (int8 stores only)
+    chunks.bin                UTF-8 chunk texts, back to back
+    chunk_offsets.bin         int64 byte offsets into chunks.bin (count + 1)
+    chunk_hashes.bin          SHA-1 digest of each chunk text (count x 20 bytes)
+    meta_<field>.codes        int32 per-chunk code into the field's values
+    meta_<field>.bin          UTF-8 distinct values of the field
+    meta_<field>.offsets      int64 byte offsets into meta_<field>.bin
+    sentences.bin             UTF-8 cleaned sentences (for link snippets)
+    sentence_offsets.bin      int64 byte offsets into sentences.bin
+    sentence_embeddings.bin   normalized sentence vectors
+    sentence_scales.bin       float32 scale per sentence vector (int8 stores only)
+    chunk_sentences.bin       int64 sentence offsets per chunk (count + 1)
+
+Everything is opened with np.memmap, so worker processes share pages through
+the OS cache instead of each decompressing and unpickling its own copy.
+"""
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from pathlib import Path
+from api.vector_index import quantize_int8
+
+STORE_VERSION = 1
+MANIFEST = "manifest.json"
+HASH_SIZE = 20
+
+# Directory holding the store and its indexes; EMBEDDINGS_DIR (relative to the
+# repository root) selects another one, e.g. one per chunking setup
+EMBED_DIR = Path(__file__).resolve().parent.parent / os.getenv("EMBEDDINGS_DIR", "data/embeddings")
+STORE_DIR = EMBED_DIR / "store"
+# New stores are built here and swapped into STORE_DIR when complete
+BUILD_DIR = EMBED_DIR / "store.tmp"
+LEGACY_EMBED_FILE = EMBED_DIR / "context_embeddings.npz"
+LEGACY_SENTENCE_INDEX_FILE = EMBED_DIR / "sentence_index.npz"
+IVF_INDEX_FILE = EMBED_DIR / "ivf_index.npz"
+LEXICAL_INDEX_FILE = EMBED_DIR / "lexical_index.npz"
+PQ_INDEX_FILE = EMBED_DIR / "pq_index.npz"
+
+def chunk_hash(text):
+    """Content hash identifying a chunk's text (and so its vectors)."""
+    return hashlib.sha1(text.encode("utf-8")).digest()
+
+def _memmap(path, dtype, shape):
+    """Read-only memmap that tolerates empty files."""
+    if int(np.prod(shape)) == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+class TextColumn:
+    """Sequence of strings backed by a UTF-8 blob and byte offsets."""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def open(cls, blob_path, offsets_path):
+        offsets = np.fromfile(offsets_path, dtype=np.int64)
+        blob = _memmap(blob_path, np.uint8, (int(offsets[-1]),))
+        return cls(blob, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return bytes(self.blob[start:end]).decode("utf-8")
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+class MetadataColumns:
+    """Per-chunk metadata dicts backed by dictionary-encoded columns."""
+
+    def __init__(self, codes, values):
+        self.codes = codes  # field -> int32 array of codes
+        self.values = values  # field -> TextColumn of distinct values
+
+    def __len__(self):
+        return len(next(iter(self.codes.values()))) if self.codes else 0
+
+    def __getitem__(self, idx):
+        return {field: self.values[field][int(codes[idx])] for field, codes in self.codes.items()}
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+class EmbeddingStore:
+    """Read-only, memory-mapped view of a store directory."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / MANIFEST, "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest["version"] != STORE_VERSION:
+            raise ValueError(f"Unsupported store version {self.manifest['version']} in {self.path}")
+
+        count, dim = self.manifest["count"], self.manifest["dim"]
+        dtype = np.dtype(self.manifest["dtype"])
+        self.normalized = self.manifest["normalized"]
+        self.embeddings = _memmap(self.path / "embeddings.bin", dtype, (count, dim))
+        # int8 rows are codes; a row's vector is codes * scale
+        self.embedding_scales = None
+        if dtype == np.int8:
+            self.embedding_scales = _memmap(self.path / "embedding_scales.bin", np.float32, (count,))
+        self.chunks = TextColumn.open(self.path / "chunks.bin", self.path / "chunk_offsets.bin")
+        self.chunk_hashes = None
+        if self.manifest.get("chunk_hashes"):
+            self.chunk_hashes = _memmap(self.path / "chunk_hashes.bin", np.uint8, (count, HASH_SIZE))
+        self.metadata = MetadataColumns(
+            {field: _memmap(self.path / f"meta_{field}.codes", np.int32, (count,))
+             for field in self.manifest["metadata_fields"]},
+            {field: TextColumn.open(self.path / f"meta_{field}.bin", self.path / f"meta_{field}.offsets")
+             for field in self.manifest["metadata_fields"]}
+        )
+
+        self.sentences = None
+        self.sentence_scales = None
+        if self.manifest.get("sentence_count") is not None:
+            self.sentences = TextColumn.open(self.path / "sentences.bin", self.path / "sentence_offsets.bin")
+            self.sentence_embeddings = _memmap(
+                self.path / "sentence_embeddings.bin", dtype, (self.manifest["sentence_count"], dim)
+            )
+            if dtype == np.int8:
+                self.sentence_scales = _memmap(self.path / "sentence_scales.bin", np.float32,
+                                               (self.manifest["sentence_count"],))
+            self.chunk_sentence_offsets = np.fromfile(self.path / "chunk_sentences.bin", dtype=np.int64)
+
+class LegacyStore:
+    """Store loaded from the old context_embeddings.npz (+ sentence_index.npz)."""
+
+    def __init__(self, path, sentence_index_path=None):
+        data = np.load(path, allow_pickle=True)
+        self.path = Path(path)
+        self.normalized = False
+        self.embeddings = data["embeddings"]
+        self.embedding_scales = None
+        self.chunks = data["chunks"]
+        self.chunk_hashes = None
+        self.metadata = data["metadata"]
+
+        self.sentences = None
+        self.sentence_scales = None
+        if sentence_index_path and Path(sentence_index_path).exists():
+            sentence_data = np.load(sentence_index_path)
+            if len(sentence_data["offsets"]) == len(self.chunks) + 1:
+                self.sentences = TextColumn(sentence_data["text"], sentence_data["text_offsets"])
+                self.sentence_embeddings = sentence_data["embeddings"]
+                self.chunk_sentence_offsets = sentence_data["offsets"]
+            else:
+                print("⚠️ Sentence index does not match embeddings, ignoring it")
+
+def load_store(store_dir, legacy_file, legacy_sentence_file=None):
+    """Open the memory-mapped store, falling back to the legacy npz file."""
+    if (Path(store_dir) / MANIFEST).exists():
+        return EmbeddingStore(store_dir)
+    return LegacyStore(legacy_file, legacy_sentence_file)
+
+def swap_in(build_dir, store_dir):
+    """Replace store_dir with the finished store in build_dir.
+
+    The previous store may still be memory-mapped (by the caller or a running
+    server), which is fine once it is unlinked.
+    """
+    store_dir, build_dir = Path(store_dir), Path(build_dir)
+    old_dir = store_dir.with_name(store_dir.name + ".old")
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if store_dir.exists():
+        store_dir.rename(old_dir)
+    build_dir.rename(store_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+def _offsets_tail(path):
+    """Last int64 in an offsets file."""
+    with open(path, "rb") as f:
+        f.seek(-8, 2)
+        return int(np.frombuffer(f.read(8), dtype=np.int64)[0])
+
+class _TextWriter:
+    """Appends strings to a UTF-8 blob and their end offsets to an offsets file.
+
+    Both files are append-only, so a writer can be resumed after truncating
+    them to a checkpoint.
+    """
+
+    def __init__(self, blob_path, offsets_path, resume=False):
+        mode = "ab" if resume else "wb"
+        self.blob = open(blob_path, mode)
+        self.offsets = open(offsets_path, mode)
+        self.count = 0
+        self.end = 0
+        if resume:
+            self.end = _offsets_tail(offsets_path)
+            self.count = self.offsets.tell() // 8 - 1
+        else:
+            self.offsets.write(np.int64(0).tobytes())
+
+    def append(self, text):
+        data = text.encode("utf-8")
+        self.blob.write(data)
+        self.end += len(data)
+        self.count += 1
+        self.offsets.write(np.int64(self.end).tobytes())
+
+    def flush(self):
+        self.blob.flush()
+        self.offsets.flush()
+
+    def close(self):
+        self.blob.close()
+        self.offsets.close()
+
+class StoreWriter:
+    """Writes a store directory incrementally; call close() to finish it.
+
+    Every file is append-only and the manifest is written last, so a
+    half-written store is never loaded. checkpoint() returns the state needed
+    to resume() an interrupted build from the last appended batch.
+    """
+
+    def __init__(self, path, dim, dtype="float32", normalized=True, with_sentences=True,
+                 metadata_fields=None, resume=False):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        (self.path / MANIFEST).unlink(missing_ok=True)
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.normalized = normalized
+        mode = "ab" if resume else "wb"
+
+        self.embeddings = open(self.path / "embeddings.bin", mode)
+        self.embedding_scales = None
+        if self.dtype == np.int8:
+            self.embedding_scales = open(self.path / "embedding_scales.bin", mode)
+        self.chunks = _TextWriter(self.path / "chunks.bin", self.path / "chunk_offsets.bin", resume)
+        self.chunk_hashes = open(self.path / "chunk_hashes.bin", mode)
+        self.metadata_codes = {}  # field -> open codes file
+        self.metadata_values = {}  # field -> {value: code}
+        self.metadata_writers = {}  # field -> _TextWriter of distinct values
+        for field in metadata_fields or []:
+            self._add_field(field, resume)
+
+        self.sentences = None
+        if with_sentences:
+            self.sentences = _TextWriter(self.path / "sentences.bin", self.path / "sentence_offsets.bin", resume)
+            self.sentence_embeddings = open(self.path / "sentence_embeddings.bin", mode)
+            self.sentence_scales = None
+            if self.dtype == np.int8:
+                self.sentence_scales = open(self.path / "sentence_scales.bin", mode)
+            self.chunk_sentences = open(self.path / "chunk_sentences.bin", mode)
+            if resume:
+                self.sentence_total = _offsets_tail(self.path / "chunk_sentences.bin")
+            else:
+                self.sentence_total = 0
+                self.chunk_sentences.write(np.int64(0).tobytes())
+
+    @property
+    def count(self):
+        return self.chunks.count
+
+    @classmethod
+    def resume(cls, path, state):
+        """Reopen a store being written, discarding anything after the checkpoint state."""
+        path = Path(path)
+        for name, size in state["sizes"].items():
+            os.truncate(path / name, size)
+        return cls(path, state["dim"], state["dtype"], state["normalized"], state["with_sentences"],
+                   metadata_fields=state["metadata_fields"], resume=True)
+
+    def checkpoint(self):
+        """Flush everything and return a JSON-serializable resume state."""
+        files = [self.embeddings, self.chunk_hashes, *self.metadata_codes.values()]
+        if self.embedding_scales is not None:
+            files.append(self.embedding_scales)
+        for writer in [self.chunks, *self.metadata_writers.values()]:
+            writer.flush()
+            files += [writer.blob, writer.offsets]
+        if self.sentences is not None:
+            self.sentences.flush()
+            files += [self.sentence_embeddings, self.chunk_sentences, self.sentences.blob, self.sentences.offsets]
+            if self.sentence_scales is not None:
+                files.append(self.sentence_scales)
+        for f in files:
+            f.flush()
+        return {
+            "dim": self.dim,
+            "dtype": self.dtype.name,
+            "normalized": self.normalized,
+            "with_sentences": self.sentences is not None,
+            "metadata_fields": list(self.metadata_codes),
+            "count": self.count,
+            "sizes": {Path(f.name).name: f.tell() for f in files}
+        }
+
+    def append(self, embeddings, chunks, metadata, sentences=None, sentence_embeddings=None):
+        """Append a batch of chunks.
+
+        sentences is a list (one per chunk) of sentence lists, and
+        sentence_embeddings holds the vectors of all of them in order. The
+        whole batch is checked before anything is written, so a bad batch
+        never leaves a partial one on disk for checkpoint() to keep.
+        """
+        embeddings = np.asarray(embeddings)
+        if embeddings.shape != (len(chunks), self.dim):
+            raise ValueError(f"Expected embeddings of shape {(len(chunks), self.dim)}, got {embeddings.shape}")
+
+        fields = list(self.metadata_codes)
+        if metadata and self.count == 0 and not fields:
+            fields = list(metadata[0])
+        if fields and len(metadata) != len(chunks):
+            raise ValueError(f"Expected metadata for {len(chunks)} chunks, got {len(metadata)}")
+        for item in metadata:
+            if set(item) != set(fields):
+                raise ValueError(f"Metadata fields {sorted(item)} differ from {sorted(fields)}")
+
+        if self.sentences is not None:
+            if sentences is None or len(sentences) != len(chunks):
+                raise ValueError("Sentences are required for every chunk in a store with a sentence index")
+            sentence_embeddings = np.asarray(sentence_embeddings, dtype=np.float32).reshape(-1, self.dim)
+            if len(sentence_embeddings) != sum(len(s) for s in sentences):
+                raise ValueError("Expected one sentence embedding per sentence")
+
+        self._write_vectors(embeddings, self.embeddings, self.embedding_scales)
+        for chunk in chunks:
+            self.chunks.append(chunk)
+            self.chunk_hashes.write(chunk_hash(chunk))
+
+        for field in fields:
+            if field not in self.metadata_codes:
+                self._add_field(field)
+        batch_codes = {field: [] for field in fields}
+        for item in metadata:
+            for field, value in item.items():
+                batch_codes[field].append(self._code(field, str(value)))
+        for field, codes in batch_codes.items():
+            np.asarray(codes, dtype=np.int32).tofile(self.metadata_codes[field])
+
+        if self.sentences is not None:
+            for chunk_sentences in sentences:
+                for sentence in chunk_sentences:
+                    self.sentences.append(sentence)
+                self.sentence_total += len(chunk_sentences)
+                self.chunk_sentences.write(np.int64(self.sentence_total).tobytes())
+            self._write_vectors(sentence_embeddings, self.sentence_embeddings, self.sentence_scales)
+
+    def _write_vectors(self, vectors, vectors_file, scales_file):
+        """Write float vectors in the store dtype (int8: codes plus per-row scales)."""
+        if scales_file is None:
+            np.asarray(vectors).astype(self.dtype).tofile(vectors_file)
+            return
+        codes, scales = quantize_int8(vectors)
+        codes.reshape(-1, self.dim).tofile(vectors_file)
+        scales.tofile(scales_file)
+
+    def _add_field(self, field, resume=False):
+        mode = "ab" if resume else "wb"
+        self.metadata_codes[field] = open(self.path / f"meta_{field}.codes", mode)
+        self.metadata_writers[field] = _TextWriter(
+            self.path / f"meta_{field}.bin", self.path / f"meta_{field}.offsets", resume
+        )
+        values = {}
+        if resume:
+            existing = TextColumn.open(self.path / f"meta_{field}.bin", self.path / f"meta_{field}.offsets")
+            values = {value: code for code, value in enumerate(existing)}
+        self.metadata_values[field] = values
+
+    def _code(self, field, value):
+        values = self.metadata_values[field]
+        if value not in values:
+            values[value] = len(values)
+            self.metadata_writers[field].append(value)
+        return values[value]
+
+    def close(self):
+        self.embeddings.close()
+        if self.embedding_scales is not None:
+            self.embedding_scales.close()
+        self.chunks.close()
+        self.chunk_hashes.close()
+        for field in self.metadata_codes:
+            self.metadata_codes[field].close()
+            self.metadata_writers[field].close()
+
+        sentence_count = None
+        if self.sentences is not None:
+            self.sentences.close()
+            self.sentence_embeddings.close()
+            if self.sentence_scales is not None:
+                self.sentence_scales.close()
+            self.chunk_sentences.close()
+            sentence_count = self.sentence_total
+
+        manifest = {
+            "version": STORE_VERSION,
+            "count": self.count,
+            "dim": self.dim,
+            "dtype": self.dtype.name,
+            "normalized": self.normalized,
+            "chunk_hashes": True,
+            "metadata_fields": list(self.metadata_codes),
+            "sentence_count": sentence_count
+        }
+        with open(self.path / MANIFEST, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
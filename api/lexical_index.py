@@ -0,0 +1,113 @@
+import re
+import numpy as np
+from api.vector_index import top_k_indices
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do for from has have how i if in is it its "
+    "me my of on or so that the their then there these this to was we what when "
+    "where which who will with you your".split()
+)
+
+def tokenize(text):
+    """Lowercase alphanumeric tokens without stopwords ("GA5 Q8" -> ["ga5", "q8"])."""
+    return [token for token in TOKEN_RE.findall(str(text).lower()) if token not in STOPWORDS]
+
+class LexicalIndex:
+    """BM25 keyword search over an inverted index stored as flat arrays.
+
+    Postings are in CSR layout: the documents containing term t are
+    doc_ids[term_offsets[t]:term_offsets[t + 1]], with their precomputed
+    BM25 weights in the same slice of weights. A query only adds up the
+    weight slices of its terms.
+    """
+
+    def __init__(self, vocabulary, term_offsets, doc_ids, weights, n_docs):
+        self.vocabulary = vocabulary  # term -> term id
+        self.term_offsets = np.asarray(term_offsets, dtype=np.int64)
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.n_docs = int(n_docs)
+
+    @classmethod
+    def load(cls, path, n_docs):
+        data = np.load(path)
+        if int(data["n_docs"]) != n_docs:
+            raise ValueError(f"Lexical index {path} was built for {int(data['n_docs'])} chunks, got {n_docs}")
+        terms = data["vocabulary"].tobytes().decode("utf-8").split("\n")
+        vocabulary = {term: i for i, term in enumerate(terms)}
+        return cls(vocabulary, data["term_offsets"], data["doc_ids"], data["weights"], n_docs)
+
+    def search(self, query_text, top_k=5, ids=None):
+        """Return (indices, scores) of the top_k chunks by BM25 (among ids, if given);
+        only chunks sharing a term match."""
+        term_ids = [self.vocabulary[t] for t in set(tokenize(query_text)) if t in self.vocabulary]
+        if not term_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for t in term_ids:
+            start, end = self.term_offsets[t], self.term_offsets[t + 1]
+            # A term lists each document once, so fancy-index += is safe
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+        if ids is None:
+            indices = top_k_indices(scores, top_k)
+        else:
+            indices = ids[top_k_indices(scores[ids], top_k)]
+        indices = indices[scores[indices] > 0]
+        return indices, scores[indices]
+
+def build_lexical_index(chunks, k1=1.2, b=0.75):
+    """Tokenize chunks and compute BM25 postings.
+
+    Returns (terms, term_offsets, doc_ids, weights) where weights holds the
+    BM25 score of each (term, document) posting.
+    """
+    term_ids = {}
+    posting_terms, posting_docs, posting_tfs = [], [], []
+    doc_lengths = np.zeros(len(chunks), dtype=np.float32)
+    for doc, text in enumerate(chunks):
+        tokens = tokenize(text)
+        doc_lengths[doc] = len(tokens)
+        terms, counts = np.unique([term_ids.setdefault(t, len(term_ids)) for t in tokens], return_counts=True)
+        posting_terms.append(terms)
+        posting_docs.append(np.full(len(terms), doc, dtype=np.int32))
+        posting_tfs.append(counts)
+
+    posting_terms = np.concatenate(posting_terms or [np.empty(0, dtype=np.int64)]).astype(np.int64)
+    posting_docs = np.concatenate(posting_docs or [np.empty(0, dtype=np.int32)])
+    tf = np.concatenate(posting_tfs or [np.empty(0)]).astype(np.float32)
+
+    # Group postings by term; a stable sort keeps documents in ascending order
+    order = np.argsort(posting_terms, kind="stable")
+    posting_terms, posting_docs, tf = posting_terms[order], posting_docs[order], tf[order]
+    doc_freq = np.bincount(posting_terms, minlength=len(term_ids))
+    term_offsets = np.zeros(len(term_ids) + 1, dtype=np.int64)
+    term_offsets[1:] = np.cumsum(doc_freq)
+
+    n_docs = len(chunks)
+    idf = np.log(1 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+    avg_length = max(float(doc_lengths.mean()), 1.0) if n_docs else 1.0
+    length_norm = 1 - b + b * doc_lengths / avg_length
+    weights = idf[posting_terms] * tf * (k1 + 1) / (tf + k1 * length_norm[posting_docs])
+    return list(term_ids), term_offsets, posting_docs, weights.astype(np.float32)
+
+def save_lexical_index(path, chunks):
+    """Build a BM25 index for chunks and write it to path (.npz); returns the vocabulary size."""
+    terms, term_offsets, doc_ids, weights = build_lexical_index(chunks)
+    # Tokens never contain newlines, so the vocabulary is one UTF-8 blob
+    vocabulary = np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8)
+    np.savez(
+        path,
+        vocabulary=vocabulary,
+        term_offsets=term_offsets,
+        doc_ids=doc_ids,
+        weights=weights,
+        n_docs=np.int64(len(chunks))
+    )
+    return len(terms)
+
+def lexical_index_from_chunks(chunks):
+    """Build an in-memory LexicalIndex (e.g. when no saved index exists)."""
+    terms, term_offsets, doc_ids, weights = build_lexical_index(chunks)
+    vocabulary = {term: i for i, term in enumerate(terms)}
+    return LexicalIndex(vocabulary, term_offsets, doc_ids, weights, len(chunks))
@@ -0,0 +1,87 @@
+import os
+import asyncio
+from python_scripts.utils.gemini_client import generative_model
+from python_scripts.utils.image_description import describe_image_from_base64_async
+from api import tracing
+
+# "gemini" for the real model, "stub" for offline load tests
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+# Simulated latency of the stub LLM, in seconds
+STUB_LLM_DELAY = float(os.getenv("STUB_LLM_DELAY", "0.5"))
+
+class GeminiLLM:
+    """Gemini client using the async API, so calls never block the event loop.
+
+    The SDK is imported and configured on the first call, not at startup.
+    """
+
+    def __init__(self, model_name=GEMINI_MODEL):
+        self.model_name = model_name
+        self.model = None
+
+    def get_model(self):
+        if self.model is None:
+            self.model = generative_model(self.model_name)
+        return self.model
+
+    async def generate(self, contents):
+        response = await self.get_model().generate_content_async(contents)
+        self.record_usage(response)
+        return response.text.strip()
+
+    async def stream(self, contents):
+        """Yield the answer text in pieces as Gemini generates it."""
+        response = await self.get_model().generate_content_async(contents, stream=True)
+        async for chunk in response:
+            if chunk.parts:
+                yield chunk.text
+        self.record_usage(response)
+
+    @staticmethod
+    def record_usage(response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            tracing.inc("llm_tokens_total", usage.prompt_token_count, kind="prompt")
+            tracing.inc("llm_tokens_total", usage.candidates_token_count, kind="completion")
+
+    async def describe_image(self, base64_str, mime_type):
+        return await describe_image_from_base64_async(base64_str, mime_type)
+
+class StubLLM:
+    """Offline stand-in that only waits, like a remote call would."""
+
+    def __init__(self, delay=STUB_LLM_DELAY):
+        self.delay = delay
+
+    async def generate(self, contents):
+        await asyncio.sleep(self.delay)
+        return self.answer(contents)
+
+    async def stream(self, contents):
+        """Yield the stub answer word by word, spread over the same delay."""
+        words = self.answer(contents).split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(self.delay / len(words))
+            yield word if i == 0 else " " + word
+
+    @staticmethod
+    def answer(contents):
+        answer = f"Stub answer to: {contents[-1]}"
+        # Whitespace-separated words stand in for tokens
+        prompt_tokens = sum(len(part.split()) for part in contents if isinstance(part, str))
+        tracing.inc("llm_tokens_total", prompt_tokens, kind="prompt")
+        tracing.inc("llm_tokens_total", len(answer.split()), kind="completion")
+        return answer
+
+    async def describe_image(self, base64_str, mime_type):
+        await asyncio.sleep(self.delay)
+        return f"Stub description of a {mime_type} image"
+
+def get_llm():
+    """Create the LLM client selected by LLM_BACKEND."""
+    if LLM_BACKEND == "gemini":
+        return GeminiLLM()
+    if LLM_BACKEND == "stub":
+        return StubLLM()
+    raise ValueError(f"Unknown LLM_BACKEND: {LLM_BACKEND}")
@@ -1,21 +1,76 @@
-from fastapi import FastAPI, HTTPException
+import time
+_import_start = time.perf_counter()
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError, field_validator
 import numpy as np
-from api.rag_logic import RAGSystem
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
-from python_scripts.utils.image_description import describe_image_from_base64
-import google.generativeai as genai
+import asyncio
 import base64
+import json
+import contextvars
+from datetime import datetime, timezone
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
-# Load environment variables and configure Gemini
+# Load environment variables (before the api modules read their settings).
+# Gemini is configured on first use (python_scripts/utils/gemini_client.py).
 load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-gemini_model = genai.GenerativeModel("gemini-2.0-flash")  # Or "gemini-1.5-flash"
+from api.rag_logic import RAGSystem
+from api.llm import get_llm
+from api.answer_cache import AnswerCache
+from api.micro_batcher import MicroBatcher
+from api.context_builder import build_context, estimate_tokens, CONTEXT_TOKEN_BUDGET
+from api import tracing
+from api.tracing import stage, traced
+from python_scripts.utils.rate_limit import TokenBucket
+llm = get_llm()
+
+# Bounded pool for CPU-bound work (query encoding, vector search) so it never
+# blocks the event loop. Threads suffice: torch and numpy release the GIL.
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", "2"))
+cpu_pool = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="cpu")
+
+# Response cache for repeated questions (ANSWER_CACHE_SIZE=0 disables it);
+# with ANSWER_CACHE_FILE it is saved in the CPU pool, off the event loop
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600))),
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+    path=os.getenv("ANSWER_CACHE_FILE") or None,
+    executor=cpu_pool
+)
+
+# Concurrent requests share one batched encode and one batched vector search:
+# up to MICRO_BATCH_SIZE queries, waiting at most MICRO_BATCH_WAIT_MS for
+# company when idle. MICRO_BATCH_SIZE=1 disables batching (single queries
+# are already cheap with EMBEDDING_BACKEND=onnx and an int8 model).
+MICRO_BATCH_SIZE = int(os.getenv("MICRO_BATCH_SIZE", "32"))
+MICRO_BATCH_WAIT_MS = float(os.getenv("MICRO_BATCH_WAIT_MS", "2"))
+
+# /api/batch: LLM calls in flight at once and started per second (the
+# Gemini quota; 0 = unlimited), and the most questions accepted per batch
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_RATE_LIMIT = float(os.getenv("BATCH_RATE_LIMIT", "4"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+
+# Print the estimated prompt tokens of each /api/ request (totals are in /metrics)
+PROMPT_TOKEN_LOG = os.getenv("PROMPT_TOKEN_LOG", "1") == "1"
+
+# How the RAG system (store, indexes, embedding model) is loaded:
+#   "background" - warm up in a thread at import; FAQ, out-of-scope and
+#                  cached answers are served while it loads
+#   "lazy"       - load on the first request that needs retrieval
+#   "eager"      - load during import (slowest cold start)
+STARTUP_MODE = os.getenv("STARTUP_MODE", "background")
+
+# Seconds since the start of this module's import, reported by /api/status
+startup_timings = {}
 
 app = FastAPI()
 
@@ -27,51 +82,301 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load RAG system
-rag = RAGSystem()
+if tracing.SERVER_TIMING:
+    @app.middleware("http")
+    async def add_server_timing(request: Request, call_next):
+        """Report the stage durations of each response in a Server-Timing header."""
+        trace = tracing.start_trace()
+        response = await call_next(request)
+        if trace:
+            response.headers["Server-Timing"] = tracing.server_timing_header(trace)
+        return response
+
+# RAG system, set once loaded (see load_rag)
+rag = None
+rag_lock = threading.Lock()
+
+def load_rag():
+    """Load the RAG system, its embedding model and reranker once (blocking)."""
+    global rag
+    with rag_lock:
+        if rag is None:
+            system = RAGSystem()
+            system.embedding_model  # load the embedding backend now
+            system.reranker  # and the cross-encoder, if RERANKER is set
+            rag = system
+            startup_timings["ready_s"] = time.perf_counter() - _import_start
+    return rag
+
+def warm_up():
+    try:
+        load_rag()
+        print(f"✅ RAG system ready after {startup_timings['ready_s']:.2f}s")
+    except Exception as e:
+        # Requests retry the load and report the error
+        print(f"⚠️ Warm-up failed: {e}")
+
+async def run_in_cpu_pool(func, *args):
+    """Run blocking work in the CPU pool; its stages still count toward the request's trace."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_pool, contextvars.copy_context().run, func, *args)
+
+async def get_rag():
+    """The loaded RAG system, waiting (off the event loop) for the warm-up if needed."""
+    if rag is not None:
+        return rag
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, load_rag)
+
+if STARTUP_MODE == "eager":
+    load_rag()
+elif STARTUP_MODE == "background":
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+elif STARTUP_MODE != "lazy":
+    raise ValueError(f"Unknown STARTUP_MODE: {STARTUP_MODE}")
+
+@traced("encode_batch")
+def encode_batch(texts):
+    """Embed a batch of queries (blocking; runs in the CPU pool)."""
+    return list(rag.embedding_model.encode(texts))
+
+@traced("search_batch")
+def search_batch(queries):
+    """Top-k chunks for a batch of (embedding, text, top_k, filters) queries (blocking; runs in the CPU pool)."""
+    top_k = max(k for _, _, k, _ in queries)
+    results = rag.get_relevant_chunks_batch(
+        np.stack([embedding for embedding, _, _, _ in queries]), top_k,
+        [text for _, text, _, _ in queries], [filters for _, _, _, filters in queries]
+    )
+    return [chunks[:k] for chunks, (_, _, k, _) in zip(results, queries)]
+
+encode_batcher = MicroBatcher(encode_batch, MICRO_BATCH_SIZE, MICRO_BATCH_WAIT_MS / 1000, cpu_pool, CPU_WORKERS)
+search_batcher = MicroBatcher(search_batch, MICRO_BATCH_SIZE, MICRO_BATCH_WAIT_MS / 1000, cpu_pool, CPU_WORKERS)
+
+async def encode(text):
+    """Embed a single query (micro-batched with concurrent requests)."""
+    with stage("encode"):
+        return await encode_batcher.submit(text)
+
+async def search(embedding, text, top_k=3, filters=None):
+    """Fetch the top-k chunks for a query (micro-batched with concurrent requests)."""
+    with stage("retrieve"):
+        return await search_batcher.submit((embedding, text, top_k, filters))
+
+async def describe_image(base64_str, mime_type):
+    with stage("describe_image"):
+        return await llm.describe_image(base64_str, mime_type)
+
+async def retrieve(text, top_k=3, filters=None):
+    """Encode text and fetch its top-k chunks."""
+    embedding = await encode(text)
+    return embedding, await search(embedding, text, top_k, filters)
+
+def merge_chunks(chunk_lists, top_k=3):
+    """Merge retrieval results, keeping each chunk's best score.
+
+    Scores are compared across lists: cosine, RRF or, with RERANKER,
+    cross-encoder logits (first-stage scores only where a query fell back
+    within its budget, see Reranker.rerank).
+    """
+    best = {}
+    for chunks in chunk_lists:
+        for chunk in chunks:
+            if chunk["index"] not in best or chunk["score"] > best[chunk["index"]]["score"]:
+                best[chunk["index"]] = chunk
+    return sorted(best.values(), key=lambda chunk: chunk["score"], reverse=True)[:top_k]
+
+class SearchFilters(BaseModel):
+    """Restrict retrieval to matching chunks; empty fields do not filter."""
+    source: str = ""  # "course" or "discourse"
+    role: str = ""  # Discourse author: "staff" or "student"
+    module: str = ""  # course page, e.g. "docker"
+    topic_id: str = ""  # Discourse topic
+    after: str = ""  # ISO date, inclusive (Discourse posts only have dates)
+    before: str = ""  # ISO date, exclusive
+
+    @field_validator("after", "before")
+    @classmethod
+    def check_date(cls, value):
+        """Accept any ISO date or timestamp; normalized to naive UTC for MetadataIndex."""
+        if value:
+            parsed = datetime.fromisoformat(value)
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+            value = parsed.isoformat()
+        return value
+
+def unsupported_filters(filters):
+    """Error message for filters on metadata the loaded store lacks (e.g. the
+    legacy npz only has source), or None."""
+    fields = rag.metadata_index.unsupported(filters) if filters else []
+    if not fields:
+        return None
+    return (f"Cannot filter on {', '.join(fields)}: the loaded store has no such metadata "
+            f"(filterable: {', '.join(rag.metadata_index.fields()) or 'nothing'})")
+
+# Answer when filters select no chunks: nothing to ground an answer in, so no LLM call
+NO_MATCH_ANSWER = ("No course material or forum posts match these filters, so I cannot answer from them. "
+                   "Try removing or widening the filters.")
+
+def matches_nothing(filters):
+    """True when the filters select no chunks at all."""
+    ids = rag.metadata_index.select(filters) if filters else None
+    return ids is not None and len(ids) == 0
+
+def check_filters(filters):
+    """Reject filters the loaded store cannot apply with a 400."""
+    error = unsupported_filters(filters)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
 
 class QuestionRequest(BaseModel):
     question: str
     image: str = ""  # Base64 string, default to empty string
     mime_type: str = ""  # e.g. "image/png", default to empty string
+    stream: bool = False  # Send links, then answer tokens, as server-sent events
+    filters: SearchFilters = SearchFilters()
 
 @app.post("/api/")
 async def answer_question(request: QuestionRequest):
-    try:
-        # --- System prompt defining the TA's persona ---
-        system_prompt = (
-            "You are a Virtual Teaching Assistant (Virtual TA) for the Tools in Data Science (TDS) course at IITM. "
-            "Your job is to help students with course content and forum discussions from Jan 1 to April 14, 2025. "
-            "If you don't know something, say so honestly. Do not make up information."
-        )
-        contents = [system_prompt]
-
-        # --- Check for common FAQ questions ---
-        FAQ = {
-            "who are you": "I am the Virtual TA for the Tools in Data Science (TDS) course at IITM. I help students with course-related questions using data from Jan 1 to April 14, 2025.",
-            "what is tds": "TDS stands for Tools in Data Science, a course covering essential data science tools and concepts, it's one of the diploma level courses in the BS degree programme in Data Science and it's application at IIT Madras.",
-            "what is your knowledge range": "I have knowledge of the TDS course and forum discussions from January 1 to April 14, 2025. I cannot answer questions outside this period."
+    if request.stream:
+        # Retrieval runs before the response starts, so its errors are still
+        # plain HTTP errors; generation errors become an "error" event
+        prepared = await prepare_answer(request)
+        return StreamingResponse(stream_answer(request, prepared), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    with stage("request"):
+        prepared = await prepare_answer(request)
+        if "response" in prepared:
+            return prepared["response"]
+        try:
+            # --- Gemini answer generation ---
+            with stage("generate"):
+                answer = await llm.generate(prepared["contents"])
+        except Exception as e:
+            tracing.inc("requests_total", outcome="error")
+            raise HTTPException(status_code=500, detail=str(e))
+        response = {"answer": answer, "links": prepared["links"]}
+        finish_answer(request, prepared, response)
+        return response
+
+# --- System prompt defining the TA's persona ---
+SYSTEM_PROMPT = (
+    "You are a Virtual Teaching Assistant (Virtual TA) for the Tools in Data Science (TDS) course at IITM. "
+    "Your job is to help students with course content and forum discussions from Jan 1 to April 14, 2025. "
+    "If you don't know something, say so honestly. Do not make up information."
+)
+# Identical at the start of every prompt, so provider-side prompt caching
+# can reuse it; the per-request context and question follow
+PROMPT_PREFIX = (
+    f"{SYSTEM_PROMPT}\n\n"
+    "Answer the question using the context that follows. If unsure, say so. "
+    "Answer in plain text, no markdown."
+)
+
+# --- Common FAQ questions ---
+FAQ = {
+    "who are you": "I am the Virtual TA for the Tools in Data Science (TDS) course at IITM. I help students with course-related questions using data from Jan 1 to April 14, 2025.",
+    "what is tds": "TDS stands for Tools in Data Science, a course covering essential data science tools and concepts, it's one of the diploma level courses in the BS degree programme in Data Science and it's application at IIT Madras.",
+    "what is your knowledge range": "I have knowledge of the TDS course and forum discussions from January 1 to April 14, 2025. I cannot answer questions outside this period."
+}
+
+def canned_answer(question):
+    """(outcome, response) for FAQ and out-of-scope questions, answered without retrieval; else None."""
+    with stage("faq"):
+        user_question = question.lower().strip()
+        faq_answer = next((FAQ[key] for key in FAQ if key in user_question), None)
+        out_of_scope = any(year in user_question for year in ["2022", "2023", "2024", "2026"])
+    if faq_answer:
+        return "faq", {"answer": faq_answer, "links": []}
+
+    # --- Check for out-of-scope dates ---
+    if out_of_scope:
+        return "out_of_scope", {
+            "answer": "I only have knowledge of the TDS course from Jan 1 to April 14, 2025. I cannot answer questions outside this period.",
+            "links": []
         }
-        user_question = request.question.lower().strip()
-        for key in FAQ:
-            if key in user_question:
-                return {"answer": FAQ[key], "links": []}
-
-        # --- Check for out-of-scope dates ---
-        if any(year in user_question for year in ["2022", "2023", "2024", "2026"]):
-            return {
-                "answer": "I only have knowledge of the TDS course from Jan 1 to April 14, 2025. I cannot answer questions outside this period.",
-                "links": []
-            }
+    return None
+
+@traced("sentence_scores")
+def chunk_sentence_scores(relevant_chunks, question_embedding):
+    """(sentences, similarities with the question) of each chunk, shared by the
+    context and the links (encodes the sentences when the store has no sentence index)."""
+    return [rag.sentence_scores(chunk["index"], question_embedding) for chunk in relevant_chunks]
+
+def prompt_contents(question, relevant_chunks, chunk_sentences, image_part=None):
+    """Gemini contents [prefix, context, (image), question] and their estimated tokens.
+
+    The context holds the chunks' most relevant sentences within
+    CONTEXT_TOKEN_BUDGET (api/context_builder.py; 0 sends whole chunks).
+    Token counts by part, and of the retrieved versus sent context, are
+    added to /metrics.
+    """
+    with stage("context"):
+        if CONTEXT_TOKEN_BUDGET:
+            context = build_context(chunk_sentences)
+        else:
+            context = "\n\n".join([chunk["text"] for chunk in relevant_chunks])
+    question_part = f"Question: {question}"
+    contents = [PROMPT_PREFIX, f"Context:\n{context}"] + ([image_part] if image_part else []) + [question_part]
+
+    tokens = {"prefix": estimate_tokens(PROMPT_PREFIX), "context": estimate_tokens(context),
+              "question": estimate_tokens(question_part)}
+    for part, count in tokens.items():
+        tracing.inc("prompt_tokens_total", count, part=part)
+    tokens["retrieved_context"] = sum(estimate_tokens(chunk["text"]) for chunk in relevant_chunks)
+    tracing.inc("context_tokens_total", tokens["retrieved_context"], kind="retrieved")
+    tracing.inc("context_tokens_total", tokens["context"], kind="sent")
+    return contents, tokens
+
+def reference_links(relevant_chunks, chunk_sentences):
+    """Link and most relevant sentence of each chunk."""
+    links = []
+    with stage("links"):
+        for chunk, (sentences, scores) in zip(relevant_chunks, chunk_sentences):
+            if sentences:
+                relevant_sentence = sentences[int(scores.argmax())].strip()
+            else:
+                relevant_sentence = str(chunk["text"])[:200] + "..."  # Fallback
+            links.append({
+                "url": chunk["url"],
+                "text": relevant_sentence[:250] + ("..." if len(relevant_sentence) > 250 else "")
+            })
+    return links
+
+def prompt_and_links(question, relevant_chunks, question_embedding, image_part=None):
+    """Prompt contents, their estimated tokens and the reference links (blocking; runs in the CPU pool)."""
+    chunk_sentences = chunk_sentence_scores(relevant_chunks, question_embedding)
+    contents, prompt_tokens = prompt_contents(question, relevant_chunks, chunk_sentences, image_part)
+    return contents, prompt_tokens, reference_links(relevant_chunks, chunk_sentences)
+
+async def prepare_answer(request):
+    """Everything before generation: FAQ, cache, retrieval, prompt and links.
+
+    Returns {"response": ...} when the question is answered without the
+    LLM, else {"contents", "links", "question_embedding", "prompt_tokens"}.
+    """
+    filters = request.filters.model_dump(exclude_defaults=True) or None
+    try:
+        image_part = None
+        question_text = request.question
+
+        canned = canned_answer(request.question)
+        if canned:
+            outcome, response = canned
+            tracing.inc("requests_total", outcome=outcome)
+            return {"response": response}
 
         # --- Handle image input ---
         if request.image and request.mime_type:
             try:
-                image_bytes = base64.b64decode(request.image)
-                contents.append({
+                with stage("image_decode"):
+                    image_bytes = base64.b64decode(request.image)
+                image_part = {
                     "mime_type": request.mime_type,
                     "data": image_bytes
-                })
+                }
             except Exception as e:
                 raise HTTPException(status_code=400, detail=f"Invalid image data: {e}")
             # Use explicit prompt for image-only questions
@@ -80,44 +385,329 @@ async def answer_question(request: QuestionRequest):
                     "This image contains a question. Carefully read all visible text, "
                     "transcribe the question, and answer it in detail. If unclear, explain what you can see."
                 )
+
+            # Describe the image while the text-only retrieval runs, then
+            # retrieve on the description and merge both result lists
+            image_task = asyncio.create_task(describe_image(request.image, request.mime_type))
+            try:
+                await get_rag()
+                check_filters(filters)
+                if matches_nothing(filters):
+                    tracing.inc("requests_total", outcome="no_match")
+                    return {"response": {"answer": NO_MATCH_ANSWER, "links": []}}
+                if request.question.strip():
+                    question_embedding, text_chunks = await retrieve(request.question, filters=filters)
+                image_desc = await image_task
+            finally:
+                # Retrieval failed: do not leave the description running unobserved
+                if not image_task.done():
+                    image_task.cancel()
+            image_embedding, image_chunks = await retrieve(image_desc, filters=filters)
+            if request.question.strip():
+                relevant_chunks = merge_chunks([text_chunks, image_chunks])
             else:
-                question_text = request.question
-            contents.append(question_text)
-            # For RAG retrieval
-            image_desc = describe_image_from_base64(request.image, request.mime_type)
-            full_question = image_desc if not request.question.strip() else request.question + f"\nImage context: {image_desc}"
+                question_embedding, relevant_chunks = image_embedding, image_chunks
         else:
-            full_question = request.question
-            contents.append(request.question)
-
-        # --- RAG retrieval ---
-        question_embedding = rag.embedding_model.encode([full_question])[0]
-        relevant_chunks = rag.get_relevant_chunks(question_embedding, top_k=3)
-        context = "\n\n".join([chunk["text"] for chunk in relevant_chunks])
-        contents.append(
-            f"""Use the following context to answer the question. If unsure, say so.
-
-Context:
-{context}
-
-Answer (plain text, no markdown):"""
-        )
-
-        # --- Gemini answer generation ---
-        response = gemini_model.generate_content(contents)
-        answer = response.text.strip()
-
-        # --- Reference links ---
-        links = []
-        for chunk in relevant_chunks:
-            clean_text = rag.clean_html(chunk["text"])
-            relevant_sentence = rag.get_most_relevant_sentence(clean_text, question_embedding)
-            links.append({
-                "url": chunk["url"],
-                "text": relevant_sentence[:250] + ("..." if len(relevant_sentence) > 250 else "")
-            })
+            # --- Answer cache: exact text, then semantically similar questions ---
+            # (cached answers were retrieved unfiltered, so filtered questions skip it)
+            if not filters:
+                with stage("cache"):
+                    cached = answer_cache.get_exact(request.question)
+                if cached:
+                    tracing.inc("requests_total", outcome="cache_exact")
+                    return {"response": cached}
+            await get_rag()
+            check_filters(filters)
+            if matches_nothing(filters):
+                tracing.inc("requests_total", outcome="no_match")
+                return {"response": {"answer": NO_MATCH_ANSWER, "links": []}}
+            question_embedding = await encode(request.question)
+            if not filters:
+                with stage("cache"):
+                    cached = answer_cache.get_semantic(question_embedding)
+                if cached:
+                    tracing.inc("requests_total", outcome="cache_semantic")
+                    return {"response": cached}
+                answer_cache.record_miss()
 
-        return {"answer": answer, "links": links}
+            # --- RAG retrieval ---
+            relevant_chunks = await search(question_embedding, request.question, 3, filters)
 
+        # --- Prompt and reference links (off the event loop) ---
+        contents, prompt_tokens, links = await run_in_cpu_pool(
+            prompt_and_links, question_text, relevant_chunks, question_embedding, image_part)
+        if PROMPT_TOKEN_LOG:
+            print(f"📝 Prompt ~{prompt_tokens['prefix'] + prompt_tokens['context'] + prompt_tokens['question']} "
+                  f"tokens: prefix {prompt_tokens['prefix']}, context {prompt_tokens['context']} "
+                  f"(of {prompt_tokens['retrieved_context']} retrieved), question {prompt_tokens['question']}")
+        return {"contents": contents, "links": links, "question_embedding": question_embedding,
+                "prompt_tokens": prompt_tokens}
+
+    except HTTPException:
+        tracing.inc("requests_total", outcome="invalid")
+        raise
     except Exception as e:
+        tracing.inc("requests_total", outcome="error")
         raise HTTPException(status_code=500, detail=str(e))
+def finish_answer(request, prepared, response):
+    """Cache a generated answer (unfiltered text-only questions) and count it."""
+    if not (request.image and request.mime_type) and not request.filters.model_dump(exclude_defaults=True):
+        answer_cache.put(request.question, prepared["question_embedding"], response)
+    tracing.inc("requests_total", outcome="generated")
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_answer(request, prepared):
+    """Server-sent events: "links" first, then "token" events as the answer is
+    generated, then "done" with the same JSON as the non-streaming endpoint."""
+    if "response" in prepared:
+        response = prepared["response"]
+        yield sse_event("links", response["links"])
+        yield sse_event("token", {"text": response["answer"]})
+        yield sse_event("done", response)
+        return
+
+    yield sse_event("links", prepared["links"])
+    parts = []
+    try:
+        with stage("generate"):
+            async for text in llm.stream(prepared["contents"]):
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+    except Exception as e:
+        tracing.inc("requests_total", outcome="error")
+        yield sse_event("error", {"detail": str(e)})
+        return
+    response = {"answer": "".join(parts).strip(), "links": prepared["links"]}
+    finish_answer(request, prepared, response)
+    yield sse_event("done", response)
+
+class BatchQuestion(BaseModel):
+    id: str | int | None = None  # echoed in the result (default: line number)
+    question: str
+    filters: SearchFilters = SearchFilters()
+
+def parse_batch(lines):
+    """Parse JSONL questions into (questions, error results for invalid lines)."""
+    questions, errors = [], []
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            question = BatchQuestion.model_validate_json(line)
+        except ValidationError as e:
+            detail = "; ".join(f"{'.'.join(map(str, error['loc'])) or 'line'}: {error['msg']}" for error in e.errors())
+            errors.append({"id": number, "error": detail, "outcome": "error"})
+            continue
+        if question.id is None:
+            question.id = number
+        questions.append(question)
+    return questions, errors
+
+@traced("batch_retrieve")
+def retrieve_batch(texts, filters):
+    """Embed all questions in one batch and fetch their top chunks (blocking; runs in the CPU pool)."""
+    with stage("encode"):
+        embeddings = np.asarray(rag.embedding_model.encode(texts))
+    with stage("retrieve"):
+        return embeddings, rag.get_relevant_chunks_batch(embeddings, 3, texts, filters)
+
+async def answer_batch(questions, concurrency=BATCH_CONCURRENCY, rate=BATCH_RATE_LIMIT):
+    """Answer BatchQuestions, yielding one result dict per question as it completes.
+
+    FAQ and cached answers come first. The other questions are embedded in
+    one batch and retrieved with one batched search; identical questions
+    (and filters) are retrieved once, and identical prompts (question plus
+    context) are generated once. LLM calls run concurrently, at most
+    `concurrency` at a time and `rate` started per second. Each result has
+    the same answer/links as /api/ plus "outcome" and "timing_ms" (from
+    the start of the batch, and the item's rate-limit wait and generation);
+    generated ones also have the estimated "prompt_tokens" by part.
+    """
+    start = time.perf_counter()
+
+    def result(question, outcome, response=None, error=None, **timing):
+        tracing.inc("requests_total", outcome=outcome)
+        timing["total"] = time.perf_counter() - start
+        item = {"id": question.id, "question": question.question}
+        item.update(response if response is not None else {"error": error})
+        item["outcome"] = outcome
+        item["timing_ms"] = {name: round(seconds * 1000, 1) for name, seconds in timing.items()}
+        return item
+
+    pending = []
+    for question in questions:
+        canned = canned_answer(question.question)
+        filters = question.filters.model_dump(exclude_defaults=True) or None
+        cached = None if canned or filters else answer_cache.get_exact(question.question)
+        if canned:
+            yield result(question, canned[0], canned[1])
+        elif cached:
+            yield result(question, "cache_exact", cached)
+        else:
+            pending.append((question, filters))
+    if not pending:
+        return
+
+    try:
+        await get_rag()
+    except Exception as e:
+        for question, _ in pending:
+            yield result(question, "error", error=str(e))
+        return
+    # Filters on metadata the store lacks would fail the whole batched search,
+    # and filters matching no chunks leave nothing to answer from
+    supported = []
+    for question, filters in pending:
+        error = unsupported_filters(filters)
+        if error:
+            yield result(question, "invalid", error=error)
+        elif matches_nothing(filters):
+            yield result(question, "no_match", {"answer": NO_MATCH_ANSWER, "links": []})
+        else:
+            supported.append((question, filters))
+    pending = supported
+    if not pending:
+        return
+
+    # --- One batched encode and search for the distinct queries ---
+    queries = {}
+    for question, filters in pending:
+        queries.setdefault((question.question, json.dumps(filters, sort_keys=True)), filters)
+    try:
+        loop = asyncio.get_running_loop()
+        embeddings, chunk_lists = await loop.run_in_executor(
+            cpu_pool, retrieve_batch, [text for text, _ in queries], list(queries.values()))
+    except Exception as e:
+        for question, _ in pending:
+            yield result(question, "error", error=str(e))
+        return
+    retrieved = dict(zip(queries, zip(embeddings, chunk_lists)))
+    retrieve_s = time.perf_counter() - start
+
+    # --- Distinct prompts, generated concurrently under the rate limit ---
+    prompt_inputs = {}  # (question text, chunk ids) -> (question text, chunks, embedding)
+    waiting = {}  # same key -> [(question, embedding, filters)]
+    for question, filters in pending:
+        embedding, chunks = retrieved[(question.question, json.dumps(filters, sort_keys=True))]
+        cached = None if filters else answer_cache.get_semantic(embedding)
+        if cached:
+            yield result(question, "cache_semantic", cached, retrieve=retrieve_s)
+            continue
+        if not filters:
+            answer_cache.record_miss()
+        key = (question.question, tuple(chunk["index"] for chunk in chunks))
+        prompt_inputs.setdefault(key, (question.question, chunks, embedding))
+        waiting.setdefault(key, []).append((question, embedding, filters))
+    try:
+        built = await run_in_cpu_pool(lambda: [prompt_and_links(*inputs) for inputs in prompt_inputs.values()])
+    except Exception as e:
+        for questions_waiting in waiting.values():
+            for question, _, _ in questions_waiting:
+                yield result(question, "error", error=str(e), retrieve=retrieve_s)
+        return
+    # key -> (contents, prompt tokens, links, [(question, embedding, filters)])
+    prompts = {key: (*prompt, waiting[key]) for key, prompt in zip(prompt_inputs, built)}
+
+    # A one-token bucket spaces the starts 1/rate apart, so no second sees more than rate
+    limiter = TokenBucket(rate, capacity=1) if rate > 0 else None
+    slots = asyncio.Semaphore(concurrency)
+
+    async def generate(key, contents):
+        async with slots:
+            queued = time.perf_counter()
+            if limiter is not None:
+                await limiter.acquire_async()
+            started = time.perf_counter()
+            try:
+                with stage("generate"):
+                    answer = await llm.generate(contents)
+            except Exception as e:
+                return key, None, str(e), started - queued, time.perf_counter() - started
+            return key, answer, None, started - queued, time.perf_counter() - started
+
+    tasks = [generate(key, contents) for key, (contents, _, _, _) in prompts.items()]
+    for task in asyncio.as_completed(tasks):
+        key, answer, error, wait_s, generate_s = await task
+        _, prompt_tokens, links, waiting = prompts[key]
+        for question, embedding, filters in waiting:
+            timing = {"retrieve": retrieve_s, "rate_limit_wait": wait_s, "generate": generate_s}
+            if error is not None:
+                yield result(question, "error", error=error, **timing)
+                continue
+            response = {"answer": answer, "links": links}
+            if not filters:
+                answer_cache.put(question.question, embedding, response)
+            item = result(question, "generated", response, **timing)
+            item["prompt_tokens"] = prompt_tokens
+            yield item
+
+@app.post("/api/batch")
+async def batch_answers(request: Request):
+    """Answer a JSONL body of {"id", "question", "filters"} lines (text only).
+
+    Results stream back as JSONL in completion order, matched by "id";
+    see answer_batch() and python_scripts/batch_answer.py.
+    """
+    questions, errors = parse_batch((await request.body()).decode("utf-8").splitlines())
+    if len(questions) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} questions per batch")
+
+    async def lines():
+        for error in errors:
+            yield json.dumps(error, ensure_ascii=False) + "\n"
+        async for item in answer_batch(questions):
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/api/status")
+async def status():
+    """Readiness and cold-start timings (seconds) of this process."""
+    timings = dict(startup_timings)
+    if rag is not None:
+        timings.update(rag.timings)
+    return {"ready": rag is not None, "startup_mode": STARTUP_MODE, "timings": timings}
+
+@app.get("/api/batching")
+async def batching_stats():
+    """Queue depth, batch sizes and added wait of the micro-batchers."""
+    return {"encode": encode_batcher.stats(), "search": search_batcher.stats()}
+
+def collect_cache_and_batching_metrics():
+    """Answer cache and micro-batcher values for /metrics, read at scrape time."""
+    cache = answer_cache.stats()
+    samples = [
+        ("answer_cache_lookups_total", "counter", "Answer cache lookups by result", {"result": "exact_hit"}, cache["exact_hits"]),
+        ("answer_cache_lookups_total", "counter", "Answer cache lookups by result", {"result": "semantic_hit"}, cache["semantic_hits"]),
+        ("answer_cache_lookups_total", "counter", "Answer cache lookups by result", {"result": "miss"}, cache["misses"]),
+        ("answer_cache_hit_rate", "gauge", "Fraction of answer cache lookups that hit", {}, cache["hit_rate"]),
+        ("answer_cache_entries", "gauge", "Entries in the answer cache", {}, cache["entries"]),
+    ]
+    for name, batcher in [("encode", encode_batcher), ("search", search_batcher)]:
+        stats = batcher.stats()
+        samples += [
+            ("batcher_queue_depth", "gauge", "Items waiting in the micro-batcher queue", {"batcher": name}, stats["queue_depth"]),
+            ("batcher_batches_total", "counter", "Batches run by the micro-batcher", {"batcher": name}, stats["batches"]),
+            ("batcher_mean_batch_size", "gauge", "Mean micro-batch size", {"batcher": name}, stats["mean_batch_size"]),
+            ("batcher_wait_p95_seconds", "gauge", "95th percentile added wait before a batch starts", {"batcher": name}, stats["wait_ms_p95"] / 1000),
+        ]
+    return samples
+
+tracing.registry.add_collector(collect_cache_and_batching_metrics)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage latency histograms, LLM tokens, request outcomes, cache and batching."""
+    return PlainTextResponse(tracing.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/cache")
+async def cache_stats():
+    return answer_cache.stats()
+
+@app.on_event("shutdown")
+def save_answer_cache():
+    answer_cache.save(block=True)
+
+startup_timings["import_s"] = time.perf_counter() - _import_start
@@ -0,0 +1,103 @@
+import numpy as np
+
+# Metadata fields that can be filtered on by exact value
+PARTITION_FIELDS = ("source", "role", "module", "topic_id")
+DATE_FIELD = "created_at"
+
+def parse_dates(values):
+    """ISO timestamps ("2025-01-01T16:04:48.996Z" or "2025-02-01") as datetime64[ms]; "" is NaT."""
+    return np.array([value.rstrip("Z") if value else "NaT" for value in values], dtype="datetime64[ms]")
+
+def field_codes(metadata, field):
+    """(codes, values) of a metadata field, or None if the chunks do not have it.
+
+    Store metadata is already dictionary-encoded; a legacy list of dicts is
+    encoded here.
+    """
+    if hasattr(metadata, "codes"):
+        if field not in metadata.codes:
+            return None
+        return np.asarray(metadata.codes[field]), list(metadata.values[field])
+    if len(metadata) == 0 or field not in metadata[0]:
+        return None
+    values, codes = np.unique([str(item[field]) for item in metadata], return_inverse=True)
+    return codes, list(values)
+
+class MetadataIndex:
+    """Precomputed partitions of the chunks by metadata value.
+
+    For each field in PARTITION_FIELDS the chunk ids are grouped by value
+    (CSR layout, ids ascending within a value), and for created_at they are
+    sorted by date. select() turns filters into the sorted ids of the
+    matching chunks, so a filtered query scores only that subset instead of
+    post-filtering a global top-k.
+    """
+
+    def __init__(self, metadata):
+        self.partitions = {}  # field -> (value -> code, offsets, ids)
+        for field in PARTITION_FIELDS:
+            encoded = field_codes(metadata, field)
+            if encoded is None:
+                continue
+            codes, values = encoded
+            ids = np.argsort(codes, kind="stable").astype(np.int64)
+            offsets = np.zeros(len(values) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum(np.bincount(codes, minlength=len(values)))
+            self.partitions[field] = ({value: code for code, value in enumerate(values)}, offsets, ids)
+
+        self.dates = None
+        encoded = field_codes(metadata, DATE_FIELD)
+        if encoded is not None:
+            codes, values = encoded
+            dates = parse_dates(values)[codes]
+            # NaT (chunks without a date) sorts last and never matches a range
+            self.date_ids = np.argsort(dates, kind="stable").astype(np.int64)
+            self.dates = dates[self.date_ids]
+
+    def fields(self):
+        return list(self.partitions) + ([DATE_FIELD] if self.dates is not None else [])
+
+    def unsupported(self, filters):
+        """Fields of filters that this store's chunks have no metadata for."""
+        fields = set(self.fields())
+        return [field for field, value in filters.items() if value not in (None, "", [])
+                and (DATE_FIELD if field in ("after", "before") else field) not in fields]
+
+    def partition(self, field, value):
+        """Sorted ids of the chunks whose field equals value (any of them, for a list)."""
+        if field not in self.partitions:
+            raise ValueError(f"Cannot filter on {field!r}: the store has no such metadata "
+                             f"(filterable: {', '.join(self.fields())}); rebuild it with embed_all_data.py")
+        value_codes, offsets, ids = self.partitions[field]
+        values = value if isinstance(value, (list, tuple)) else [value]
+        codes = [value_codes[str(v)] for v in values if str(v) in value_codes]
+        if not codes:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate([ids[offsets[code]:offsets[code + 1]] for code in codes]))
+
+    def date_range(self, after=None, before=None):
+        """Sorted ids of the chunks created on or after `after` and before `before` (ISO dates)."""
+        if self.dates is None:
+            raise ValueError(f"Cannot filter on {DATE_FIELD!r}: the store has no such metadata; "
+                             "rebuild it with embed_all_data.py")
+        valid = len(self.dates) - int(np.isnat(self.dates).sum())
+        start = np.searchsorted(self.dates[:valid], parse_dates([after])[0]) if after else 0
+        end = np.searchsorted(self.dates[:valid], parse_dates([before])[0]) if before else valid
+        return np.sort(self.date_ids[start:end])
+
+    def select(self, filters):
+        """Sorted ids of the chunks matching all filters, or None when nothing is filtered.
+
+        filters maps a PARTITION_FIELDS field to a value (or list of values),
+        plus optional "after"/"before" ISO dates on created_at.
+        """
+        matches = [self.partition(field, value) for field, value in filters.items()
+                   if field not in ("after", "before") and value not in (None, "", [])]
+        if filters.get("after") or filters.get("before"):
+            matches.append(self.date_range(filters.get("after"), filters.get("before")))
+        if not matches:
+            return None
+        selected = matches[0]
+        for ids in matches[1:]:
+            selected = np.intersect1d(selected, ids, assume_unique=True)
+        return selected
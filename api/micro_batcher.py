@@ -0,0 +1,101 @@
+import time
+import asyncio
+from collections import Counter, deque
+import numpy as np
+
+class MicroBatcher:
+    """Groups concurrent single-item calls into batched calls.
+
+    submit(item) queues the item and awaits its result. A worker takes the
+    first queued item, waits up to max_wait seconds (from that item's
+    arrival) for more, up to max_batch_size items, and runs
+    process_batch(items) -> results in the executor. At most max_in_flight
+    batches run at once (match it to the executor's workers); requests
+    arriving while all are busy form the next batch, so under load batches
+    fill up without any added wait. max_batch_size <= 1 disables batching.
+    """
+
+    def __init__(self, process_batch, max_batch_size=32, max_wait=0.002, executor=None, max_in_flight=1):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.executor = executor
+        self.max_in_flight = max_in_flight
+        self.queue = None
+        self.loop = None
+        self.batch_sizes = Counter()
+        self.waits = deque(maxlen=1000)  # seconds from submit to batch start
+        self.max_queue_depth = 0
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        if self.max_batch_size <= 1:
+            self.batch_sizes[1] += 1
+            return (await loop.run_in_executor(self.executor, self.process_batch, [item]))[0]
+        if self.loop is not loop:
+            # First call (or a new event loop): start the worker on this loop
+            self.loop = loop
+            self.queue = asyncio.Queue()
+            loop.create_task(self._run(self.queue))
+        future = loop.create_future()
+        self.queue.put_nowait((item, future, time.perf_counter()))
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return await future
+
+    async def _collect(self, queue):
+        """Wait for the first item, then gather a batch until it is full or max_wait passes."""
+        batch = [await queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+                continue
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self, queue):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.max_in_flight)
+        while True:
+            await slots.acquire()
+            batch = await self._collect(queue)
+            start = time.perf_counter()
+            self.batch_sizes[len(batch)] += 1
+            self.waits.extend(start - submitted for _, _, submitted in batch)
+            loop.create_task(self._dispatch(batch, slots))
+
+    async def _dispatch(self, batch, slots):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, self.process_batch,
+                                                 [item for item, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            slots.release()
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        waits_ms = np.array(self.waits) * 1000 if self.waits else np.zeros(1)
+        batches = sum(self.batch_sizes.values())
+        return {
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "batches": batches,
+            "mean_batch_size": sum(size * n for size, n in self.batch_sizes.items()) / batches if batches else 0.0,
+            "batch_size_histogram": {str(size): n for size, n in sorted(self.batch_sizes.items())},
+            "wait_ms_p50": float(np.percentile(waits_ms, 50)),
+            "wait_ms_p95": float(np.percentile(waits_ms, 95)),
+            "wait_ms_max": float(waits_ms.max())
+        }
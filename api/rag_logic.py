@@ -1,57 +1,281 @@
+import os
+import time
+import threading
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-from bs4 import BeautifulSoup
-import re
+from pathlib import Path
+from python_scripts.utils.text_processing import clean_html, split_sentences
+from api.vector_index import ExactIndex, IVFIndex, PQIndex, normalize_rows, dequantize
+from api.lexical_index import LexicalIndex
+from api.metadata_index import MetadataIndex
+from api.embedding_backends import get_embedding_backend
+from api.reranker import get_reranker, RERANKER, RERANK_CANDIDATES
+from api.embedding_store import (load_store, STORE_DIR, LEGACY_EMBED_FILE, LEGACY_SENTENCE_INDEX_FILE,
+                                 IVF_INDEX_FILE, LEXICAL_INDEX_FILE, PQ_INDEX_FILE)
+from api import tracing
+from api.tracing import stage, traced
+
+# Vector index backend: "exact" (brute force), "ivf" (approximate) or
+# "pq" (product-quantized codes, see python_scripts/quantize_store.py)
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "exact")
+# Number of IVF lists scanned per query; higher means better recall, more latency
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+# PQ candidates re-scored against the stored vectors; 0 keeps only the codes in use
+PQ_RERANK = int(os.getenv("PQ_RERANK", "100"))
+# Retrieval mode: "hybrid" (dense + BM25 fused by reciprocal rank) or "dense"
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Candidates taken from each retriever before fusion
+FUSION_CANDIDATES = int(os.getenv("FUSION_CANDIDATES", "50"))
+# Reciprocal rank fusion constant; larger values flatten the rank weights
+RRF_K = 60
+
+def reciprocal_rank_fusion(rankings, top_k=5, k=RRF_K):
+    """Fuse ranked index lists: each list adds 1 / (k + rank) to its items.
+
+    Returns (indices, fused scores) of the top_k items, best first.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, idx in enumerate(ranking, start=1):
+            fused[int(idx)] = fused.get(int(idx), 0.0) + 1.0 / (k + rank)
+    best = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return [idx for idx, _ in best], [score for _, score in best]
 
 class RAGSystem:
     def __init__(self):
-        # Load embeddings and metadata
-        self.data = np.load("data/embeddings/context_embeddings.npz", allow_pickle=True)
-        self.embeddings = self.data["embeddings"]
-        self.chunks = self.data["chunks"]
-        self.metadata = self.data["metadata"]
-        
-        # Load embedding model (MUST match the one used for data)
-        self.embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
-    
-    def get_relevant_chunks(self, query_embedding, top_k=5):
-        # Compute similarity scores
-        similarities = cosine_similarity([query_embedding], self.embeddings)[0]
-        
-        # Get top-k indices
-        top_indices = similarities.argsort()[-top_k:][::-1]
-        
+        # Seconds spent in each loading step, reported by /api/status
+        self.timings = {}
+        start = time.perf_counter()
+
+        # Load embeddings and metadata (memory-mapped store, or the legacy npz)
+        self.store = load_store(STORE_DIR, LEGACY_EMBED_FILE, LEGACY_SENTENCE_INDEX_FILE)
+        self.embeddings = self.store.embeddings
+        self.chunks = self.store.chunks
+        self.metadata = self.store.metadata
+        self.index = self.load_index()
+        self.lexical_index = self.load_lexical_index()
+        # Chunk ids by source, role, module, topic and date, for filtered search
+        self.metadata_index = MetadataIndex(self.metadata)
+
+        # Precomputed sentence index for link snippets (None if unavailable)
+        self.sentences = self.store.sentences
+        if self.sentences is not None:
+            self.sentence_embeddings = self.store.sentence_embeddings
+            self.sentence_offsets = self.store.chunk_sentence_offsets
+
+        self.timings["store_load_s"] = time.perf_counter() - start
+
+        # The embedding model and reranker are loaded on first use (see embedding_model)
+        self._embedding_model = None
+        self._reranker = None
+        self._model_lock = threading.Lock()
+
+    @property
+    def embedding_model(self):
+        """Query embedding backend (EMBEDDING_BACKEND), loaded on first use.
+
+        Importing sentence_transformers (and torch) or onnxruntime and loading
+        the model takes seconds, so it is kept off the import path; concurrent
+        first callers wait for one load.
+        """
+        if self._embedding_model is None:
+            with self._model_lock:
+                if self._embedding_model is None:
+                    start = time.perf_counter()
+                    backend = get_embedding_backend()
+                    self.timings["model_load_s"] = time.perf_counter() - start
+                    self._embedding_model = backend
+        return self._embedding_model
+
+    @property
+    def reranker(self):
+        """Cross-encoder reranker (RERANKER), loaded and warmed up on first use; None when off."""
+        if RERANKER and self._reranker is None:
+            with self._model_lock:
+                if self._reranker is None:
+                    start = time.perf_counter()
+                    reranker = get_reranker()
+                    reranker.warm_up()
+                    self.timings["reranker_load_s"] = time.perf_counter() - start
+                    self._reranker = reranker
+        return self._reranker
+
+    def load_index(self):
+        """Build the configured vector index over the chunk embeddings."""
+        scales = self.store.embedding_scales
+        if VECTOR_INDEX == "ivf":
+            if Path(IVF_INDEX_FILE).exists():
+                return IVFIndex.load(IVF_INDEX_FILE, self.embeddings, nprobe=IVF_NPROBE,
+                                     normalized=self.store.normalized, scales=scales)
+            print(f"⚠️ {IVF_INDEX_FILE} not found, falling back to exact search")
+        elif VECTOR_INDEX == "pq":
+            if Path(PQ_INDEX_FILE).exists():
+                if not self.store.normalized:
+                    raise ValueError("VECTOR_INDEX=pq needs a store with normalized vectors")
+                return PQIndex.load(PQ_INDEX_FILE, self.embeddings, scales=scales, rerank=PQ_RERANK)
+            print(f"⚠️ {PQ_INDEX_FILE} not found, falling back to exact search")
+        elif VECTOR_INDEX != "exact":
+            raise ValueError(f"Unknown VECTOR_INDEX: {VECTOR_INDEX}")
+        return ExactIndex(self.embeddings, normalized=self.store.normalized, scales=scales)
+
+    def load_lexical_index(self):
+        """Load the BM25 index for hybrid retrieval, or None for dense-only search."""
+        if RETRIEVAL_MODE == "dense":
+            return None
+        if RETRIEVAL_MODE != "hybrid":
+            raise ValueError(f"Unknown RETRIEVAL_MODE: {RETRIEVAL_MODE}")
+        if not Path(LEXICAL_INDEX_FILE).exists():
+            print(f"⚠️ {LEXICAL_INDEX_FILE} not found, falling back to dense retrieval")
+            return None
+        return LexicalIndex.load(LEXICAL_INDEX_FILE, len(self.embeddings))
+
+    def search(self, query_embedding, top_k=5, query_text=None, filters=None):
+        """Return (indices, scores) of the top_k chunks, re-ranked by the
+        cross-encoder (RERANKER) when one is configured."""
+        if self.reranker is None or not query_text:
+            return self.candidate_search(query_embedding, top_k, query_text, filters)
+        indices, scores = self.candidate_search(query_embedding, max(top_k, RERANK_CANDIDATES), query_text, filters)
+        return self.rerank(query_text, indices, scores, top_k)
+
+    @traced("rag.rerank")
+    def rerank(self, query_text, indices, scores, top_k, budget=None):
+        """Re-order a shortlist by cross-encoder score, within RERANK_BUDGET_MS (or budget seconds)."""
+        return self.reranker.rerank(query_text, indices, scores, [self.chunks[i] for i in indices], top_k, budget)
+
+    def rerank_batch(self, query_texts, shortlists, top_k):
+        """Re-rank the (indices, scores) shortlists of a batch of queries within
+        one RERANK_BUDGET_MS, so a micro-batch takes no longer than a single
+        request. Each query gets an equal share of the time left, but at least
+        enough to re-rank at all while time remains; queries after that keep
+        their first-stage order."""
+        deadline = time.perf_counter() + self.reranker.budget
+        left = sum(1 for query_text in query_texts if query_text)
+        results = []
+        for query_text, (indices, scores) in zip(query_texts, shortlists):
+            if not query_text:
+                results.append((indices[:top_k], scores[:top_k]))
+                continue
+            remaining = max(deadline - time.perf_counter(), 0.0)
+            left -= 1
+            if remaining < self.reranker.min_budget():
+                tracing.inc("rerank_total", outcome="fallback")
+                results.append((indices[:top_k], scores[:top_k]))
+                continue
+            budget = min(remaining, max(remaining / (left + 1), self.reranker.min_budget()))
+            results.append(self.rerank(query_text, indices, scores, top_k, budget))
+        return results
+
+    def candidate_search(self, query_embedding, top_k=5, query_text=None, filters=None):
+        """Return (indices, scores) of the first-stage top_k chunks.
+
+        With a lexical index and query text, the dense and BM25 rankings are
+        fused by reciprocal rank, so exact terms ("GA5 Q8", "uv run") can
+        surface chunks the embedding model ranks low. Scores are then RRF
+        scores rather than cosine similarities.
+
+        filters (see MetadataIndex.select), e.g. {"source": "discourse",
+        "role": "staff", "after": "2025-02-01"}, restrict both retrievers to
+        the matching chunks before ranking.
+        """
+        ids = None
+        if filters:
+            with stage("rag.filter"):
+                ids = self.metadata_index.select(filters)
+            if ids is not None and len(ids) == 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if self.lexical_index is None or not query_text:
+            with stage("rag.dense"):
+                return self.index.search(query_embedding, top_k, ids)
+        with stage("rag.dense"):
+            dense_indices, _ = self.index.search(query_embedding, FUSION_CANDIDATES, ids)
+        with stage("rag.lexical"):
+            lexical_indices, _ = self.lexical_index.search(query_text, FUSION_CANDIDATES, ids)
+        return reciprocal_rank_fusion([dense_indices, lexical_indices], top_k)
+
+    def search_batch(self, query_embeddings, top_k=5, query_texts=None, filters=None):
+        """search() for a batch of queries; dense scores of the unfiltered ones
+        are one matrix multiply, and re-ranking shares one budget (rerank_batch)."""
+        if query_texts is None:
+            query_texts = [None] * len(query_embeddings)
+        if filters is None:
+            filters = [None] * len(query_embeddings)
+        k = top_k if self.reranker is None else max(top_k, RERANK_CANDIDATES)
+        results = [None] * len(query_embeddings)
+        unfiltered = [i for i, query_filters in enumerate(filters) if not query_filters]
+        if unfiltered:
+            batch = self.candidate_search_batch(np.asarray(query_embeddings)[unfiltered], k,
+                                                [query_texts[i] for i in unfiltered])
+            for i, result in zip(unfiltered, batch):
+                results[i] = result
+        for i, query_filters in enumerate(filters):
+            if query_filters:
+                results[i] = self.candidate_search(query_embeddings[i], k, query_texts[i], query_filters)
+        if self.reranker is None:
+            return results
+        return self.rerank_batch(query_texts, results, top_k)
+
+    def candidate_search_batch(self, query_embeddings, top_k, query_texts):
+        if self.lexical_index is None:
+            with stage("rag.dense_batch"):
+                return self.index.search_batch(query_embeddings, top_k)
+        with stage("rag.dense_batch"):
+            dense_results = self.index.search_batch(query_embeddings, FUSION_CANDIDATES)
+        results = []
+        for (dense_indices, scores), query_text in zip(dense_results, query_texts):
+            if not query_text:
+                results.append((dense_indices[:top_k], scores[:top_k]))
+                continue
+            with stage("rag.lexical"):
+                lexical_indices, _ = self.lexical_index.search(query_text, FUSION_CANDIDATES)
+            results.append(reciprocal_rank_fusion([dense_indices, lexical_indices], top_k))
+        return results
+
+    def get_relevant_chunks(self, query_embedding, top_k=5, query_text=None, filters=None):
+        top_indices, scores = self.search(query_embedding, top_k, query_text, filters)
+        return self.chunk_results(top_indices, scores)
+
+    def get_relevant_chunks_batch(self, query_embeddings, top_k=5, query_texts=None, filters=None):
+        """get_relevant_chunks() for a batch of queries (filters: one dict or None per query)."""
+        return [self.chunk_results(indices, scores)
+                for indices, scores in self.search_batch(query_embeddings, top_k, query_texts, filters)]
+
+    def chunk_results(self, top_indices, scores):
         # Collect results
         results = []
-        for idx in top_indices:
+        for idx, score in zip(top_indices, scores):
             results.append({
+                "index": int(idx),
                 "text": self.chunks[idx],
                 "url": self.metadata[idx]["url"],
-                "score": similarities[idx]
+                "score": float(score)
             })
         return results
+
     def clean_html(self, html):
         """Convert HTML to clean plain text."""
-        soup = BeautifulSoup(html, "html.parser")
-        # Remove code blocks and images (already processed)
-        for elem in soup.find_all(['pre', 'code', 'img']):
-            elem.decompose()
-        return soup.get_text(separator=" ", strip=True)
-
-    def get_most_relevant_sentence(self, text, question_embedding):
-        """Extract the sentence most relevant to the question."""
-        # Split into sentences (simple regex-based approach)
-        sentences = re.split(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?)\s', text)
-        
-        if not sentences:
-            return text[:200] + "..."  # Fallback
-        
-        # Embed all sentences
-        sentence_embeddings = self.embedding_model.encode(sentences)
-        
-        # Find most similar sentence to the question
-        similarities = cosine_similarity([question_embedding], sentence_embeddings)[0]
-        best_idx = similarities.argmax()
-        
-        return sentences[best_idx].strip()
\ No newline at end of file
+        return clean_html(html)
+
+    def score_sentences(self, sentences, question_embedding):
+        """Cosine similarity of each sentence with the question (encodes the sentences)."""
+        sentence_embeddings = normalize_rows(self.embedding_model.encode(sentences))
+        return sentence_embeddings @ normalize_rows(question_embedding)
+
+    def sentence_scores(self, chunk_index, question_embedding):
+        """(sentences, similarities with the question) of a chunk, in text order.
+
+        Uses the precomputed sentence index (no model calls, no HTML parsing)
+        and falls back to splitting and encoding the cleaned chunk text.
+        """
+        if self.sentences is None:
+            sentences = split_sentences(self.clean_html(self.chunks[chunk_index]))
+            if not sentences:
+                return [], np.empty(0, dtype=np.float32)
+            return sentences, self.score_sentences(sentences, question_embedding)
+
+        start = self.sentence_offsets[chunk_index]
+        end = self.sentence_offsets[chunk_index + 1]
+        # Sentence embeddings are stored normalized, so a dot product is cosine
+        query = np.asarray(question_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scales = self.store.sentence_scales
+        vectors = dequantize(self.sentence_embeddings[start:end], None if scales is None else scales[start:end])
+        return [self.sentences[i] for i in range(start, end)], vectors @ query
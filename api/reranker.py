@@ -0,0 +1,193 @@
+import os
+import time
+import threading
+import numpy as np
+from pathlib import Path
+from api import tracing
+
+# Cross-encoder re-ranking of the first-stage shortlist: "" (off), "torch"
+# (sentence-transformers CrossEncoder) or "onnx" (onnxruntime)
+RERANKER = os.getenv("RERANKER", "")
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Model exported by python_scripts/export_onnx.py --reranker; tokenizer.json must sit next to it
+RERANKER_ONNX_MODEL = os.getenv("RERANKER_ONNX_MODEL", "data/models/ms-marco-MiniLM-L-6-v2/model_int8.onnx")
+# Shortlist scored per query, and (query, chunk) pairs per forward pass
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "30"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "8"))
+# Time allowed for re-ranking one query; candidates that do not fit keep
+# their first-stage order
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+# Query plus chunk are truncated to this many tokens
+RERANK_MAX_TOKENS = int(os.getenv("RERANK_MAX_TOKENS", "256"))
+# Weight of the latest batch in the running seconds-per-unit estimate
+ESTIMATE_WEIGHT = 0.2
+# Sequence length at which attention costs as much as the rest of the model
+ATTENTION_TOKENS = 128
+
+def batch_cost(size, longest):
+    """Relative cost of scoring size pairs padded to longest tokens (linear
+    layers grow with tokens, attention with tokens squared)."""
+    return size * longest * (1 + longest / ATTENTION_TOKENS)
+
+class TorchCrossEncoder:
+    """sentence-transformers CrossEncoder on PyTorch."""
+
+    def __init__(self, model_name=RERANKER_MODEL):
+        import torch
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name, max_length=RERANK_MAX_TOKENS)
+        # Raw logits, not the default sigmoid, so scores match OnnxCrossEncoder
+        self.activation = torch.nn.Identity()
+
+    def lengths(self, query, texts):
+        """Tokens of each (query, text) pair after truncation."""
+        encoded = self.model.tokenizer([query] * len(texts), list(texts), truncation=True,
+                                       max_length=RERANK_MAX_TOKENS)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def score(self, query, texts):
+        """Relevance logits of (query, text) pairs; higher is more relevant."""
+        scores = self.model.predict([(query, text) for text in texts], batch_size=len(texts),
+                                    activation_fct=self.activation, show_progress_bar=False,
+                                    convert_to_numpy=True)
+        return np.asarray(scores, dtype=np.float32).reshape(len(texts), -1)[:, -1]
+
+class OnnxCrossEncoder:
+    """The same cross-encoder exported to ONNX (optionally int8), run by onnxruntime."""
+
+    def __init__(self, model_path=RERANKER_ONNX_MODEL, threads=None):
+        import onnxruntime
+        from tokenizers import Tokenizer
+        from api.embedding_backends import ONNX_THREADS
+        threads = ONNX_THREADS if threads is None else threads
+        model_path = Path(model_path)
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(str(model_path.parent / "tokenizer.json"))
+        self.tokenizer.enable_truncation(RERANK_MAX_TOKENS)
+        self.tokenizer.enable_padding()
+        # Unpadded copy for lengths()
+        self.length_tokenizer = Tokenizer.from_file(str(model_path.parent / "tokenizer.json"))
+        self.length_tokenizer.enable_truncation(RERANK_MAX_TOKENS)
+
+    def lengths(self, query, texts):
+        """Tokens of each (query, text) pair after truncation."""
+        return [len(e.ids) for e in self.length_tokenizer.encode_batch([(query, text) for text in texts])]
+
+    def score(self, query, texts):
+        """Relevance logits of (query, text) pairs; higher is more relevant."""
+        encodings = self.tokenizer.encode_batch([(query, text) for text in texts])
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        }
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        logits = self.session.run(None, feeds)[0]
+        return logits.reshape(len(texts), -1)[:, -1].astype(np.float32)
+
+class Reranker:
+    """Re-orders a first-stage shortlist by cross-encoder score within a latency budget.
+
+    Candidates are scored best-first in batches, each sized to fit the
+    remaining budget: batch_cost() of its size and longest pair (batches
+    are padded) times a running seconds-per-unit estimate. Scored
+    candidates are ordered by cross-encoder score and the rest follow in
+    their first-stage order; if not even two fit (e.g. a slow host), the
+    first-stage order is kept, so the budget is never traded for latency.
+    """
+
+    def __init__(self, model, budget_ms=RERANK_BUDGET_MS, batch_size=RERANK_BATCH_SIZE):
+        self.model = model
+        self.budget = budget_ms / 1000
+        self.batch_size = batch_size
+        self.seconds_per_unit = 0.0
+        self.lock = threading.Lock()
+
+    def warm_up(self):
+        """Score one batch of full-length pairs, so the first request neither
+        pays for lazy initialization nor starts from an unmeasured estimate."""
+        texts = [" ".join(["warm up"] * RERANK_MAX_TOKENS)] * self.batch_size
+        self.model.score("warm up", texts)
+        start = time.perf_counter()
+        self.model.score("warm up", texts)
+        cost = batch_cost(self.batch_size, max(self.model.lengths("warm up", texts)))
+        self.seconds_per_unit = (time.perf_counter() - start) / cost
+
+    def min_budget(self):
+        """Estimated seconds to re-rank at all: two full-length pairs."""
+        return batch_cost(2, RERANK_MAX_TOKENS) * self.seconds_per_unit
+
+    def next_batch(self, lengths, remaining):
+        """Number of the next candidates (lengths: their tokens) that fit in `remaining` seconds."""
+        size, longest = 0, 0
+        for length in lengths[:self.batch_size]:
+            longest = max(longest, length)
+            if batch_cost(size + 1, longest) * self.seconds_per_unit > remaining:
+                break
+            size += 1
+        return size
+
+    def rerank(self, query, indices, scores, texts, top_k, budget=None):
+        """Return (indices, scores) of the top_k candidates after re-ranking.
+
+        indices/scores are the first-stage results (best first) and texts
+        their chunk texts. Returned scores are cross-encoder logits, in
+        descending order: candidates the budget left unscored get scores
+        below the lowest logit (1 apart, in first-stage order). Only on a
+        fallback are the first-stage scores returned unchanged.
+
+        budget (seconds) overrides the per-query budget, e.g. with a share
+        of one budget for a batch of queries.
+        """
+        budget = self.budget if budget is None else budget
+        start = time.perf_counter()
+        # Tokenize the rest only if the first two fit (tokenizing a whole
+        # shortlist is not free when a batch share is small)
+        lengths = self.model.lengths(query, texts[:2])
+        if len(texts) > 2 and self.next_batch(lengths, budget - (time.perf_counter() - start)) >= 2:
+            lengths += self.model.lengths(query, texts[2:])
+        scored = []
+        while len(scored) < len(indices):
+            size = self.next_batch(lengths[len(scored):], budget - (time.perf_counter() - start))
+            if size < 1 or len(scored) + size < 2:
+                break
+            batch_start = time.perf_counter()
+            scored.extend(self.model.score(query, texts[len(scored):len(scored) + size]))
+            cost = batch_cost(size, max(lengths[len(scored) - size:len(scored)]))
+            per_unit = (time.perf_counter() - batch_start) / cost
+            with self.lock:
+                self.seconds_per_unit += ESTIMATE_WEIGHT * (per_unit - self.seconds_per_unit)
+
+        if len(scored) < min(2, len(indices)):
+            # Not even two candidates fit: keep the first-stage order. Lower
+            # the estimate so a transient slowdown is probed again later
+            # (a probe scores just two pairs) - unless only a small share of
+            # the budget was given, which says nothing about the host.
+            if budget >= self.budget:
+                with self.lock:
+                    self.seconds_per_unit *= 1 - ESTIMATE_WEIGHT
+            tracing.inc("rerank_total", outcome="fallback")
+            return indices[:top_k], scores[:top_k]
+        tracing.inc("rerank_total", outcome="full" if len(scored) == len(indices) else "partial")
+        order = np.argsort(-np.asarray(scored), kind="stable")
+        reranked = [indices[i] for i in order] + list(indices[len(scored):])
+        floor = float(min(scored))
+        reranked_scores = ([float(scored[i]) for i in order] +
+                           [floor - 1 - i for i in range(len(indices) - len(scored))])
+        return reranked[:top_k], reranked_scores[:top_k]
+
+def get_reranker(backend=None):
+    """Create the reranker selected by RERANKER, or None when re-ranking is off."""
+    backend = RERANKER if backend is None else backend
+    if not backend:
+        return None
+    if backend == "torch":
+        return Reranker(TorchCrossEncoder())
+    if backend == "onnx":
+        return Reranker(OnnxCrossEncoder())
+    raise ValueError(f"Unknown RERANKER: {backend}")
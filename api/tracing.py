@@ -0,0 +1,155 @@
+import os
+import time
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import nullcontext
+from functools import wraps
+
+# TRACING=0 makes stage() a shared no-op and traced() return functions unwrapped
+TRACING = os.getenv("TRACING", "1") == "1"
+# Add a Server-Timing header with each response's stage durations
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+METRIC_PREFIX = "tds_"
+# Latency histogram buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    "stage_seconds": ("histogram", "Time spent in each stage of /api/ requests and RAG methods"),
+    "llm_tokens_total": ("counter", "LLM tokens by kind (prompt, completion)"),
+    "requests_total": ("counter", "/api/ requests by how they were answered"),
+    "prompt_tokens_total": ("counter", "Estimated prompt tokens by part (prefix, context, question)"),
+    "context_tokens_total": ("counter", "Estimated context tokens retrieved and sent after trimming to the budget"),
+    "rerank_total": ("counter", "Cross-encoder re-ranks by outcome (full, partial or fallback within the budget)"),
+}
+
+class Histogram:
+    """Prometheus-style histogram: per-bucket counts, sum and count."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Registry:
+    """Thread-safe store of histograms and counters, rendered in Prometheus text format.
+
+    Collectors are callables returning [(name, type, help, labels, value)]
+    that are read at scrape time, for values kept elsewhere (cache stats,
+    batcher queues).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.counters = {}  # (name, labels) -> value
+        self.collectors = []
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        samples = {}  # name -> (type, help, [(suffix, labels, value)])
+
+        def add(name, kind, help_text, suffix, labels, value):
+            samples.setdefault(name, (kind, help_text, []))[2].append((suffix, labels, value))
+
+        with self.lock:
+            for (name, labels), histogram in self.histograms.items():
+                kind, help_text = HELP.get(name, ("histogram", name))
+                cumulative = 0
+                for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    add(name, kind, help_text, "_bucket", labels + (("le", str(bound)),), cumulative)
+                add(name, kind, help_text, "_sum", labels, histogram.sum)
+                add(name, kind, help_text, "_count", labels, histogram.count)
+            for (name, labels), value in self.counters.items():
+                kind, help_text = HELP.get(name, ("counter", name))
+                add(name, kind, help_text, "", labels, value)
+        for collector in self.collectors:
+            for name, kind, help_text, labels, value in collector():
+                add(name, kind, help_text, "", tuple(sorted(labels.items())), value)
+
+        lines = []
+        for name, (kind, help_text, values) in samples.items():
+            lines.append(f"# HELP {METRIC_PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+            for suffix, labels, value in values:
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+                lines.append(f"{METRIC_PREFIX}{name}{suffix}{{{label_text}}} {value}" if label_text
+                             else f"{METRIC_PREFIX}{name}{suffix} {value}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# Stage durations of the current request, for the Server-Timing header
+_trace = contextvars.ContextVar("trace", default=None)
+_NOOP = nullcontext()
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        registry.observe("stage_seconds", elapsed, stage=self.name)
+        trace = _trace.get()
+        if trace is not None:
+            trace[self.name] = trace.get(self.name, 0.0) + elapsed
+
+def stage(name):
+    """Context manager timing a stage into the stage_seconds histogram (and the request trace)."""
+    return _Stage(name) if TRACING else _NOOP
+
+def traced(name):
+    """Decorator timing every call of a function as a stage."""
+    def decorator(func):
+        if not TRACING:
+            return func
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def inc(name, value=1, **labels):
+    if TRACING:
+        registry.inc(name, value, **labels)
+
+def start_trace():
+    """Start collecting stage durations for the current request; returns the trace dict."""
+    trace = {}
+    _trace.set(trace)
+    return trace
+
+def server_timing_header(trace):
+    """Format a trace as a Server-Timing header value (durations in ms)."""
+    return ", ".join(f"{name.replace('.', '-')};dur={seconds * 1000:.1f}" for name, seconds in trace.items())
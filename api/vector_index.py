@@ -0,0 +1,291 @@
+import numpy as np
+
+# Storage types the indexes score in place: float16 and int8 rows are
+# converted to float32 SCORE_BLOCK_ROWS at a time instead of all at once
+STORAGE_DTYPES = ("float32", "float16", "int8")
+SCORE_BLOCK_ROWS = 1024
+
+def normalize_rows(matrix):
+    """Return a float32 copy of matrix with unit-length rows."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def top_k_indices(scores, top_k):
+    """Indices of the top_k highest scores, best first, without a full sort."""
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k < len(scores):
+        candidates = np.argpartition(scores, -top_k)[-top_k:]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+def as_unit_vectors(embeddings, normalized=False, scales=None):
+    """Use embeddings as-is when already unit-length (e.g. a float32, float16
+    or int8 memmap), otherwise make a normalized float32 copy."""
+    if normalized and embeddings.dtype.name in STORAGE_DTYPES:
+        return embeddings
+    return normalize_rows(dequantize(embeddings, scales))
+
+def quantize_int8(matrix):
+    """Scalar int8 quantization with one scale per row: row ~= codes * scale.
+
+    Returns (int8 codes, float32 scales).
+    """
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    scales = np.abs(matrix).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.round(matrix / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def dequantize(rows, scales=None):
+    """float32 copy of stored rows; scales are the per-row int8 scales of the same rows."""
+    rows = np.asarray(rows, dtype=np.float32)
+    return rows if scales is None else rows * np.asarray(scales, dtype=np.float32)[:, None]
+
+def dot(vectors, queries, scales=None):
+    """vectors @ queries, where queries is one vector or a dim x n matrix.
+
+    float32 vectors are multiplied directly; float16 and int8 vectors are
+    converted a block of rows at a time, so scoring never materializes a
+    float32 copy of the whole matrix.
+    """
+    if vectors.dtype == np.float32 and scales is None:
+        return vectors @ queries
+    scores = np.empty((len(vectors),) + queries.shape[1:], dtype=np.float32)
+    for start in range(0, len(vectors), SCORE_BLOCK_ROWS):
+        end = start + SCORE_BLOCK_ROWS
+        scores[start:end] = np.asarray(vectors[start:end], dtype=np.float32) @ queries
+    if scales is not None:
+        scores *= np.asarray(scales, dtype=np.float32).reshape((-1,) + (1,) * (scores.ndim - 1))
+    return scores
+
+def subset_search(vectors, query, ids, top_k, scales=None):
+    """Exact top_k among the rows `ids` of vectors, so a filtered query
+    scores only its subset (a block of rows at a time)."""
+    scores = np.empty(len(ids), dtype=np.float32)
+    for start in range(0, len(ids), SCORE_BLOCK_ROWS):
+        block = ids[start:start + SCORE_BLOCK_ROWS]
+        rows = dequantize(vectors[block], None if scales is None else scales[block])
+        scores[start:start + len(block)] = rows @ query
+    best = top_k_indices(scores, top_k)
+    return ids[best], scores[best]
+
+class ExactIndex:
+    """Brute-force cosine search over pre-normalized vectors.
+
+    Vectors may be stored as float32, float16 or int8 (with per-row scales).
+    """
+
+    def __init__(self, embeddings, normalized=False, scales=None):
+        self.vectors = as_unit_vectors(embeddings, normalized, scales)
+        self.scales = scales if self.vectors is embeddings else None
+
+    def search(self, query_embedding, top_k=5, ids=None):
+        """Return (indices, scores) of the top_k most similar vectors (among ids, if given)."""
+        query = normalize_rows(query_embedding)
+        if ids is not None:
+            return subset_search(self.vectors, query, ids, top_k, self.scales)
+        scores = dot(self.vectors, query, self.scales)
+        indices = top_k_indices(scores, top_k)
+        return indices, scores[indices]
+
+    def search_batch(self, query_embeddings, top_k=5):
+        """search() for a batch of queries, scored with one matrix multiply."""
+        queries = normalize_rows(query_embeddings)
+        scores = dot(self.vectors, queries.T, self.scales).T
+        results = []
+        for row in scores:
+            indices = top_k_indices(row, top_k)
+            results.append((indices, row[indices]))
+        return results
+
+class IVFIndex:
+    """Inverted-file index: vectors are bucketed by their nearest k-means
+    centroid and a query only scans the nprobe closest buckets.
+
+    nprobe is the recall/latency knob: nprobe == n_lists is exact search.
+    """
+
+    def __init__(self, embeddings, centroids, list_offsets, list_ids, nprobe=8, normalized=False, scales=None):
+        self.vectors = as_unit_vectors(embeddings, normalized, scales)
+        self.scales = scales if self.vectors is embeddings else None
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.list_offsets = np.asarray(list_offsets, dtype=np.int64)
+        self.list_ids = np.asarray(list_ids, dtype=np.int64)
+        self.nprobe = nprobe
+
+    @classmethod
+    def load(cls, path, embeddings, nprobe=8, normalized=False, scales=None):
+        data = np.load(path)
+        if int(data["n_vectors"]) != len(embeddings):
+            raise ValueError(f"IVF index {path} was built for {int(data['n_vectors'])} vectors, got {len(embeddings)}")
+        return cls(embeddings, data["centroids"], data["list_offsets"], data["list_ids"],
+                   nprobe=nprobe, normalized=normalized, scales=scales)
+
+    def search(self, query_embedding, top_k=5, ids=None):
+        """Return (indices, scores) of the approximate top_k most similar vectors.
+
+        Among ids, if given, the search is exact: the subset is scanned
+        directly rather than probing lists that may hold none of it.
+        """
+        query = normalize_rows(query_embedding)
+        if ids is not None:
+            return subset_search(self.vectors, query, ids, top_k, self.scales)
+        probes = top_k_indices(self.centroids @ query, self.nprobe)
+        candidates = np.concatenate([
+            self.list_ids[self.list_offsets[p]:self.list_offsets[p + 1]] for p in probes
+        ])
+        scores = dequantize(self.vectors[candidates],
+                            None if self.scales is None else self.scales[candidates]) @ query
+        best = top_k_indices(scores, top_k)
+        return candidates[best], scores[best]
+
+    def search_batch(self, query_embeddings, top_k=5):
+        """search() for a batch of queries (each probes its own lists)."""
+        return [self.search(query, top_k) for query in query_embeddings]
+
+def build_ivf_index(embeddings, n_lists=None, n_iter=20, seed=0):
+    """Cluster embeddings with spherical k-means.
+
+    Returns (centroids, list_offsets, list_ids) where the ids of list i are
+    list_ids[list_offsets[i]:list_offsets[i + 1]].
+    """
+    vectors = normalize_rows(embeddings)
+    if n_lists is None:
+        n_lists = max(1, int(np.sqrt(len(vectors))))
+    n_lists = min(n_lists, len(vectors))
+
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)]
+    for _ in range(n_iter):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for i in range(n_lists):
+            members = vectors[assignments == i]
+            if len(members):
+                centroids[i] = members.sum(axis=0)
+            else:
+                # Re-seed empty lists with a random vector
+                centroids[i] = vectors[rng.integers(len(vectors))]
+        centroids = normalize_rows(centroids)
+
+    assignments = np.argmax(vectors @ centroids.T, axis=1)
+    list_ids = np.argsort(assignments, kind="stable")
+    list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+    list_offsets[1:] = np.cumsum(np.bincount(assignments, minlength=n_lists))
+    return centroids, list_offsets, list_ids
+
+def save_ivf_index(path, embeddings, n_lists=None):
+    """Build an IVF index for embeddings and write it to path (.npz)."""
+    centroids, list_offsets, list_ids = build_ivf_index(embeddings, n_lists=n_lists)
+    np.savez(
+        path,
+        centroids=centroids,
+        list_offsets=list_offsets,
+        list_ids=list_ids,
+        n_vectors=np.int64(len(embeddings))
+    )
+    return len(centroids)
+
+class PQIndex:
+    """Product-quantized index: each vector is split into n_subspaces parts
+    and each part stored as the 1-byte id of its nearest codebook centroid,
+    so a 384-d float32 vector (1536 bytes) takes n_subspaces bytes.
+
+    A query is scored against every code through per-subspace lookup tables
+    (asymmetric distance), then the best `rerank` candidates are re-scored
+    exactly against the stored vectors, when given; rerank=0 or no vectors
+    returns the approximate scores.
+    """
+
+    def __init__(self, codebooks, codes, vectors=None, scales=None, rerank=100):
+        self.codebooks = np.asarray(codebooks, dtype=np.float32)  # n_subspaces x n_centroids x sub_dim
+        self.codes = np.asarray(codes, dtype=np.uint8)  # n_vectors x n_subspaces
+        self.vectors = vectors
+        self.scales = scales
+        self.rerank = rerank
+
+    @classmethod
+    def load(cls, path, vectors=None, scales=None, rerank=100):
+        data = np.load(path)
+        if vectors is not None and len(data["codes"]) != len(vectors):
+            raise ValueError(f"PQ index {path} was built for {len(data['codes'])} vectors, got {len(vectors)}")
+        return cls(data["codebooks"], data["codes"], vectors, scales, rerank)
+
+    def approximate_scores(self, query, codes):
+        n_subspaces, _, sub_dim = self.codebooks.shape
+        table = np.einsum("mkd,md->mk", self.codebooks, query.reshape(n_subspaces, sub_dim))
+        subspaces = np.arange(n_subspaces)
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+            end = start + SCORE_BLOCK_ROWS
+            scores[start:end] = table[subspaces, codes[start:end]].sum(axis=1)
+        return scores
+
+    def search(self, query_embedding, top_k=5, ids=None):
+        """Return (indices, scores) of the approximate top_k most similar vectors (among ids, if given)."""
+        query = normalize_rows(query_embedding)
+        scores = self.approximate_scores(query, self.codes if ids is None else self.codes[ids])
+        rerank = self.vectors is not None and self.rerank
+        best = top_k_indices(scores, max(self.rerank, top_k) if rerank else top_k)
+        indices = best if ids is None else ids[best]
+        if not rerank:
+            return indices, scores[best]
+        # Sorted candidates read the memory-mapped vectors in file order
+        candidates = np.sort(indices)
+        exact = dequantize(self.vectors[candidates],
+                           None if self.scales is None else self.scales[candidates]) @ query
+        best = top_k_indices(exact, top_k)
+        return candidates[best], exact[best]
+
+    def search_batch(self, query_embeddings, top_k=5):
+        return [self.search(query, top_k) for query in query_embeddings]
+
+def build_pq_index(embeddings, n_subspaces=48, n_centroids=256, n_iter=20, max_train=65536, seed=0):
+    """Train one k-means codebook per subspace and encode every vector.
+
+    Returns (codebooks, codes). The vector dimension must be divisible by
+    n_subspaces; codebooks are trained on at most max_train vectors.
+    """
+    vectors = normalize_rows(embeddings)
+    n_vectors, dim = vectors.shape
+    if dim % n_subspaces:
+        raise ValueError(f"Dimension {dim} is not divisible by {n_subspaces} subspaces")
+    sub_dim = dim // n_subspaces
+    n_centroids = min(n_centroids, n_vectors, 256)
+
+    rng = np.random.default_rng(seed)
+    train = vectors[rng.choice(n_vectors, min(max_train, n_vectors), replace=False)]
+    codebooks = np.zeros((n_subspaces, n_centroids, sub_dim), dtype=np.float32)
+    codes = np.zeros((n_vectors, n_subspaces), dtype=np.uint8)
+    for m in range(n_subspaces):
+        part = train[:, m * sub_dim:(m + 1) * sub_dim]
+        centroids = part[rng.choice(len(part), n_centroids, replace=False)]
+        for _ in range(n_iter):
+            assignments = nearest_centroids(part, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, part)
+            counts = np.bincount(assignments, minlength=n_centroids)
+            centroids = sums / np.maximum(counts, 1)[:, None]
+            # Re-seed empty clusters with random training vectors
+            empty = counts == 0
+            centroids[empty] = part[rng.integers(len(part), size=int(empty.sum()))]
+        codebooks[m] = centroids
+        for start in range(0, n_vectors, SCORE_BLOCK_ROWS):
+            end = start + SCORE_BLOCK_ROWS
+            codes[start:end, m] = nearest_centroids(vectors[start:end, m * sub_dim:(m + 1) * sub_dim], centroids)
+    return codebooks, codes
+
+def nearest_centroids(vectors, centroids):
+    """Index of the closest centroid (Euclidean) for each vector."""
+    distances = (centroids ** 2).sum(axis=1) - 2 * vectors @ centroids.T
+    return np.argmin(distances, axis=1)
+
+def save_pq_index(path, embeddings, n_subspaces=48):
+    """Build a PQ index for embeddings and write it to path (.npz)."""
+    codebooks, codes = build_pq_index(embeddings, n_subspaces=n_subspaces)
+    np.savez(path, codebooks=codebooks, codes=codes)
+    return codes.nbytes
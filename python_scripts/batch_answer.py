@@ -0,0 +1,101 @@
+"""Answer a JSONL file of questions in one batch.
+
+Each input line is {"id": ..., "question": ..., "filters": {...}} (id and
+filters optional). Questions are embedded in one batch, retrieved with one
+batched search, and sent to the LLM concurrently under a rate limit
+(api/main.py answer_batch). Results are written as JSONL in completion
+order, one per question, with "id", "answer", "links", "outcome" and
+"timing_ms"; a summary goes to stderr.
+
+By default the pipeline runs in this process; with --url the file is sent
+to a running server's /api/batch instead.
+
+Usage: python python_scripts/batch_answer.py questions.jsonl [--output answers.jsonl]
+       python python_scripts/batch_answer.py --promptfoo [--concurrency 8] [--rate 4]
+       python python_scripts/batch_answer.py questions.jsonl --url http://localhost:8000
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+
+def promptfoo_lines():
+    from python_scripts.utils.promptfoo import load_tests
+    return [json.dumps({"id": i, "question": test["question"]}) for i, test in enumerate(load_tests(), start=1)]
+
+async def run_local(lines, concurrency, rate):
+    os.chdir(ROOT)  # RAGSystem uses paths relative to the repo root
+    from api.main import answer_batch, parse_batch, BATCH_CONCURRENCY, BATCH_RATE_LIMIT
+    questions, errors = parse_batch(lines)
+    for item in errors:
+        yield item
+    async for item in answer_batch(questions,
+                                   BATCH_CONCURRENCY if concurrency is None else concurrency,
+                                   BATCH_RATE_LIMIT if rate is None else rate):
+        yield item
+
+def run_remote(lines, url):
+    import requests
+    response = requests.post(f"{url.rstrip('/')}/api/batch", data="\n".join(lines).encode("utf-8"),
+                             headers={"Content-Type": "application/x-ndjson"}, stream=True)
+    response.raise_for_status()
+    for line in response.iter_lines():
+        if line:
+            yield json.loads(line)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", nargs="?", help="JSONL file of questions ('-' for stdin)")
+    parser.add_argument("--promptfoo", action="store_true", help="answer the questions of the promptfoo configs")
+    parser.add_argument("--output", type=Path, help="result JSONL file (default stdout)")
+    parser.add_argument("--concurrency", type=int, help="LLM calls in flight (default BATCH_CONCURRENCY)")
+    parser.add_argument("--rate", type=float, help="LLM calls started per second, 0 = unlimited (default BATCH_RATE_LIMIT)")
+    parser.add_argument("--url", help="send the batch to this server instead of running it here")
+    args = parser.parse_args()
+
+    if args.promptfoo:
+        lines = promptfoo_lines()
+    elif args.input == "-":
+        lines = sys.stdin.read().splitlines()
+    elif args.input:
+        lines = Path(args.input).read_text(encoding="utf-8").splitlines()
+    else:
+        parser.error("pass a JSONL file or --promptfoo")
+
+    start = time.perf_counter()
+    outcomes = Counter()
+    latencies = []
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        def write(item):
+            out.write(json.dumps(item, ensure_ascii=False) + "\n")
+            out.flush()
+            outcomes[item["outcome"]] += 1
+            latencies.append(item.get("timing_ms", {}).get("total", 0))
+
+        if args.url:
+            for item in run_remote(lines, args.url):
+                write(item)
+        else:
+            async for item in run_local(lines, args.concurrency, args.rate):
+                write(item)
+    finally:
+        if args.output:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p95 = latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0
+    print(f"✅ {len(latencies)} results in {elapsed:.1f}s ({len(latencies) / max(elapsed, 1e-9):.1f}/s), "
+          f"p95 {p95:.0f}ms: " + ", ".join(f"{outcome} {n}" for outcome, n in outcomes.most_common()),
+          file=sys.stderr)
+
+if __name__ == "__main__":
+    asyncio.run(main())
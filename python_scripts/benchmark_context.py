@@ -0,0 +1,69 @@
+"""Measure prompt context size and evidence kept by the token-budgeted context builder.
+
+For the promptfoo and synthetic queries of benchmark_retrieval.py, the
+top-3 chunks are retrieved as /api/ does and their context is built with
+each --budgets value (0 = whole chunks, as before). It reports the
+estimated context tokens (mean and p95), the saving against whole chunks,
+the build time, and for synthetic queries the evidence kept: of the
+queries whose source sentence is in the retrieved chunks, the fraction
+whose trimmed context still contains it.
+
+Usage: python python_scripts/benchmark_context.py [--budgets 0,300,600,900] [--synthetic 200]
+"""
+import sys
+import time
+import argparse
+import numpy as np
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+from api.rag_logic import RAGSystem
+from api.context_builder import build_context, estimate_tokens, sentence_key
+from python_scripts.benchmark_retrieval import promptfoo_queries, synthetic_queries
+from python_scripts.utils.text_processing import clean_html
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budgets", default="0,300,600,900", help="comma-separated CONTEXT_TOKEN_BUDGET values")
+    parser.add_argument("--synthetic", type=int, default=200, help="synthetic queries sampled from Discourse")
+    parser.add_argument("--top-k", type=int, default=3, help="chunks per prompt")
+    args = parser.parse_args()
+
+    rag = RAGSystem()
+    queries = [(query, False) for query in promptfoo_queries()]
+    queries += [(query, True) for query in synthetic_queries(args.synthetic)]
+    retrieved = []
+    for query, synthetic in queries:
+        embedding = rag.embedding_model.encode([query["question"]])[0]
+        chunks = rag.get_relevant_chunks(embedding, args.top_k, query["question"])
+        sentences = [rag.sentence_scores(chunk["index"], embedding) for chunk in chunks]
+        # The source sentence of a synthetic query, if retrieval found it
+        evidence = sentence_key(query["question"]) if synthetic else None
+        if evidence and evidence not in sentence_key(" ".join(clean_html(chunk["text"]) for chunk in chunks)):
+            evidence = None
+        retrieved.append((chunks, sentences, evidence))
+    with_evidence = sum(evidence is not None for _, _, evidence in retrieved)
+    print(f"{len(queries)} queries, {with_evidence} synthetic ones with their source sentence retrieved")
+
+    whole = np.array([sum(estimate_tokens(chunk["text"]) for chunk in chunks) for chunks, _, _ in retrieved])
+    print(f"{'budget':>6}  {'mean tokens':>11}  {'p95 tokens':>10}  {'saving':>6}  {'evidence kept':>13}  {'build':>7}")
+    for budget in [int(b) for b in args.budgets.split(",")]:
+        tokens, kept, times = [], 0, []
+        for chunks, sentences, evidence in retrieved:
+            start = time.perf_counter()
+            if budget:
+                context = build_context(sentences, budget)
+            else:
+                context = "\n\n".join(chunk["text"] for chunk in chunks)
+            times.append(time.perf_counter() - start)
+            tokens.append(estimate_tokens(context))
+            if evidence and evidence in sentence_key(clean_html(context) if not budget else context):
+                kept += 1
+        tokens = np.array(tokens)
+        print(f"{budget or 'whole':>6}  {tokens.mean():>11.0f}  {np.percentile(tokens, 95):>10.0f}  "
+              f"{(whole.sum() - tokens.sum()) / max(whole.sum(), 1):>6.0%}  {kept / max(with_evidence, 1):>13.0%}  "
+              f"{np.mean(times) * 1000:>5.2f}ms")
+
+if __name__ == "__main__":
+    main()
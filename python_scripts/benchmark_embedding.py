@@ -0,0 +1,91 @@
+"""Benchmark query embedding backends: torch vs ONNX float32 vs ONNX int8.
+
+Each backend runs in a fresh interpreter so load time and peak RSS are
+measured in isolation. Reports load time, peak RSS, single-query latency
+(p50/p95, as in /api/) and batched sentence throughput.
+
+Usage: python python_scripts/benchmark_embedding.py [--queries 200] [--onnx-dir data/models/all-MiniLM-L6-v2]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+
+QUESTIONS = [
+    "Should I use Docker or Podman for this course?",
+    "How is the GA4 bonus shown on the dashboard?",
+    "Which model should I use for GA5 question 8?",
+    "How do I install uv and run a script with it?",
+    "What is the deadline for project 1?",
+    "How do I deploy a FastAPI app to Vercel?",
+]
+
+def measure(backend, n_queries):
+    """Run in the child process: load the backend and time it."""
+    import numpy as np
+    from api.embedding_backends import get_embedding_backend
+
+    start = time.perf_counter()
+    model = get_embedding_backend(backend)
+    model.encode(QUESTIONS[:1])  # first call initializes kernels
+    load_s = time.perf_counter() - start
+
+    latencies = []
+    for i in range(n_queries):
+        start = time.perf_counter()
+        model.encode([QUESTIONS[i % len(QUESTIONS)]])
+        latencies.append(time.perf_counter() - start)
+
+    sentences = [f"{question} (variant {i})" for i in range(32) for question in QUESTIONS]
+    start = time.perf_counter()
+    model.encode(sentences, batch_size=32)
+    batch_s = time.perf_counter() - start
+
+    return {
+        "load_s": load_s,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "sentences_per_s": len(sentences) / batch_s,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--onnx-dir", type=Path, default=ROOT / "data" / "models" / "all-MiniLM-L6-v2")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.queries)))
+        return
+
+    variants = [("torch", "torch", {})]
+    for file_name in ["model.onnx", "model_int8.onnx"]:
+        if (args.onnx_dir / file_name).exists():
+            variants.append((f"onnx/{file_name}", "onnx", {"ONNX_MODEL": str(args.onnx_dir / file_name)}))
+        else:
+            print(f"⚠️ {args.onnx_dir / file_name} not found, run python_scripts/export_onnx.py")
+
+    print(f"{'backend':>22}  {'load':>7}  {'p50':>8}  {'p95':>8}  {'batch':>12}  {'peak RSS':>9}")
+    for name, backend, env in variants:
+        result = subprocess.run(
+            [sys.executable, __file__, "--child", backend, "--queries", str(args.queries)],
+            cwd=ROOT, env=dict(os.environ, **env), capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            print(f"{name:>22}  failed: {result.stderr.strip().splitlines()[-1]}")
+            continue
+        r = json.loads(result.stdout.strip().splitlines()[-1])
+        print(f"{name:>22}  {r['load_s']:>6.2f}s  {r['p50_ms']:>6.2f}ms  {r['p95_ms']:>6.2f}ms  "
+              f"{r['sentences_per_s']:>8.0f}/s  {r['peak_rss_mb']:>6.0f} MB")
+
+if __name__ == "__main__":
+    main()
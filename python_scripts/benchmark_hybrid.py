@@ -0,0 +1,70 @@
+"""Compare dense, BM25 and hybrid (reciprocal rank fusion) retrieval.
+
+Reports hit rate@k on the promptfoo questions: a question is a hit when
+one of its expected links (same Discourse topic or course page) is among
+the top-k retrieved chunks. Also reports mean per-query latency of each
+retriever, excluding query encoding (EMBEDDING_BACKEND selects the encoder).
+
+Usage: python python_scripts/benchmark_hybrid.py [--k 3]
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+from api.vector_index import ExactIndex
+from api.lexical_index import LexicalIndex, lexical_index_from_chunks
+from api.embedding_store import load_store, STORE_DIR, LEGACY_EMBED_FILE, LEGACY_SENTENCE_INDEX_FILE, LEXICAL_INDEX_FILE
+from api.embedding_backends import get_embedding_backend
+from api.rag_logic import reciprocal_rank_fusion, FUSION_CANDIDATES
+from python_scripts.utils.promptfoo import load_tests, normalize_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    store = load_store(STORE_DIR, LEGACY_EMBED_FILE, LEGACY_SENTENCE_INDEX_FILE)
+    dense = ExactIndex(store.embeddings, normalized=store.normalized, scales=store.embedding_scales)
+    if LEXICAL_INDEX_FILE.exists():
+        lexical = LexicalIndex.load(LEXICAL_INDEX_FILE, len(store.embeddings))
+    else:
+        print(f"⚠️ {LEXICAL_INDEX_FILE} not found, building a temporary lexical index")
+        lexical = lexical_index_from_chunks(store.chunks)
+    model = get_embedding_backend()
+
+    tests = [test for test in load_tests() if test["expected_urls"]]
+    print(f"Corpus: {len(store.embeddings)} chunks, {len(tests)} promptfoo questions with links, k={args.k}")
+
+    retrievers = {
+        "dense": lambda embedding, text: dense.search(embedding, args.k)[0],
+        "bm25": lambda embedding, text: lexical.search(text, args.k)[0],
+        "hybrid": lambda embedding, text: reciprocal_rank_fusion([
+            dense.search(embedding, FUSION_CANDIDATES)[0],
+            lexical.search(text, FUSION_CANDIDATES)[0]
+        ], args.k)[0]
+    }
+    hits = {name: 0 for name in retrievers}
+    elapsed = {name: 0.0 for name in retrievers}
+    for test in tests:
+        embedding = model.encode([test["question"]])[0]
+        expected = {normalize_url(url) for url in test["expected_urls"]}
+        marks = []
+        for name, retrieve in retrievers.items():
+            start = time.perf_counter()
+            indices = retrieve(embedding, test["question"])
+            elapsed[name] += time.perf_counter() - start
+            hit = any(normalize_url(store.metadata[i]["url"]) in expected for i in indices)
+            hits[name] += hit
+            marks.append(f"{name}={'✓' if hit else '✗'}")
+        print(f"  {' '.join(marks)}  {test['question'][:70]}")
+
+    for name in retrievers:
+        print(f"{name:>8}  hit@{args.k}={hits[name] / max(len(tests), 1):.3f}  "
+              f"{elapsed[name] * 1000 / max(len(tests), 1):.3f} ms/query")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Benchmark the approximate (IVF) vector index and compact vector storage
+against exact search.
+
+Reports recall@k relative to exact float32 search, plus mean per-query
+latency, for a range of IVF nprobe values and for each storage mode:
+float16, int8 with per-vector scales, and product quantization (PQ) with
+and without exact re-ranking of a shortlist. Bytes per vector show the
+memory each mode needs. Queries are sentence
+embeddings from the store's sentence index (or perturbed chunk embeddings
+when it is missing), so no model or network access is needed.
+
+Usage: python python_scripts/benchmark_index.py [--k 5] [--queries 500] [--pq 24,48,96]
+"""
+import sys
+import time
+import argparse
+import numpy as np
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+from api.vector_index import (ExactIndex, IVFIndex, PQIndex, build_ivf_index, build_pq_index,
+                              quantize_int8, dequantize, normalize_rows)
+from api.embedding_store import load_store, STORE_DIR, LEGACY_EMBED_FILE, LEGACY_SENTENCE_INDEX_FILE, IVF_INDEX_FILE
+
+
+def load_queries(store, n_queries, seed=0):
+    """Sample query vectors that are similar to, but not in, the corpus."""
+    rng = np.random.default_rng(seed)
+    embeddings = store.embeddings
+    if store.sentences is not None:
+        sentence_embeddings = dequantize(store.sentence_embeddings, store.sentence_scales)
+        picks = rng.choice(len(sentence_embeddings), min(n_queries, len(sentence_embeddings)), replace=False)
+        return sentence_embeddings[picks]
+    picks = rng.choice(len(embeddings), min(n_queries, len(embeddings)), replace=False)
+    noise = rng.normal(scale=0.05, size=(len(picks), embeddings.shape[1]))
+    return (embeddings[picks] + noise).astype(np.float32)
+
+def run(index, queries, k):
+    """Return (results, mean latency in ms) for searching every query."""
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append(index.search(query, k)[0])
+    elapsed = time.perf_counter() - start
+    return results, elapsed * 1000 / len(queries)
+
+def recall_at_k(approx_results, exact_results):
+    hits = sum(len(set(a) & set(e)) for a, e in zip(approx_results, exact_results))
+    return hits / sum(len(e) for e in exact_results)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--pq", default="24,48,96", help="comma-separated PQ subspace counts")
+    parser.add_argument("--rerank", type=int, default=100, help="PQ shortlist re-scored exactly")
+    args = parser.parse_args()
+
+    store = load_store(STORE_DIR, LEGACY_EMBED_FILE, LEGACY_SENTENCE_INDEX_FILE)
+    embeddings = store.embeddings
+    queries = load_queries(store, args.queries)
+    print(f"Corpus: {len(embeddings)} vectors, {len(queries)} queries, k={args.k}")
+
+    # Reference: exact search over float32 vectors
+    vectors = normalize_rows(dequantize(embeddings, store.embedding_scales))
+    dim = vectors.shape[1]
+    exact = ExactIndex(vectors, normalized=True)
+    exact_results, exact_ms = run(exact, queries, args.k)
+    print(f"{'exact':>12}  recall@{args.k}=1.000  {exact_ms:.3f} ms/query  {dim * 4} bytes/vector")
+
+    if IVF_INDEX_FILE.exists():
+        ivf = IVFIndex.load(IVF_INDEX_FILE, vectors, normalized=True)
+    else:
+        print(f"⚠️ {IVF_INDEX_FILE} not found, building a temporary IVF index")
+        ivf = IVFIndex(vectors, *build_ivf_index(vectors), normalized=True)
+
+    n_lists = len(ivf.centroids)
+    for nprobe in sorted({1, 2, 4, 8, 16, 32, n_lists}):
+        if nprobe > n_lists:
+            continue
+        ivf.nprobe = nprobe
+        ivf_results, ivf_ms = run(ivf, queries, args.k)
+        recall = recall_at_k(ivf_results, exact_results)
+        print(f"{'ivf/' + str(nprobe):>12}  recall@{args.k}={recall:.3f}  {ivf_ms:.3f} ms/query")
+
+    codes, scales = quantize_int8(vectors)
+    modes = [
+        ("float16", ExactIndex(vectors.astype(np.float16), normalized=True), dim * 2),
+        ("int8", ExactIndex(codes, normalized=True, scales=scales), dim + 4),
+    ]
+    for n_subspaces in [int(n) for n in args.pq.split(",") if n]:
+        start = time.perf_counter()
+        codebooks, pq_codes = build_pq_index(vectors, n_subspaces=n_subspaces)
+        print(f"ℹ️ PQ with {n_subspaces} subspaces trained in {time.perf_counter() - start:.1f}s")
+        modes.append((f"pq/{n_subspaces}", PQIndex(codebooks, pq_codes), n_subspaces))
+        # Re-ranking reads the shortlist from the (memory-mapped) store vectors
+        modes.append((f"pq/{n_subspaces}+rr", PQIndex(codebooks, pq_codes, vectors, rerank=args.rerank), n_subspaces))
+    for name, index, bytes_per_vector in modes:
+        results, ms = run(index, queries, args.k)
+        recall = recall_at_k(results, exact_results)
+        print(f"{name:>12}  recall@{args.k}={recall:.3f}  {ms:.3f} ms/query  {bytes_per_vector} bytes/vector "
+              f"({dim * 4 / bytes_per_vector:.0f}x smaller)")
+
+if __name__ == "__main__":
+    main()
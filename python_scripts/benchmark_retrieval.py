@@ -0,0 +1,214 @@
+"""Offline retrieval benchmark and regression check.
+
+Runs two query sets through RAGSystem, with no network access:
+
+- promptfoo: the questions of the promptfoo configs that have expected links;
+- synthetic: sentences sampled from discourse_posts.json, whose expected
+  link is the Discourse topic they were taken from.
+
+A query is a hit at k when a chunk from an expected topic or course page
+(promptfoo.normalize_url) is among the top-k chunks. For every retrieval
+configuration (VECTOR_INDEX/RETRIEVAL_MODE, optionally /RERANKER to add
+cross-encoder re-ranking) and embeddings directory (one per chunking
+setup) it reports recall@k, MRR, query encoding and search
+latency (p50/p95/p99), single-threaded QPS, store load time and peak RSS.
+Each configuration runs in a fresh interpreter so memory is measured in
+isolation.
+
+Results are written as JSON (tagged with the git commit). With --baseline,
+recall@k and MRR are compared with an earlier result file and the script
+exits with status 1 if any drops by more than --max-drop.
+
+Usage: python python_scripts/benchmark_retrieval.py [--configs exact/dense,exact/hybrid,exact/hybrid/onnx]
+           [--embeddings-dir data/embeddings ...] [--synthetic 200] [--baseline old.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+
+DISCOURSE_FILE = ROOT / "data" / "discourse-posts" / "discourse_posts.json"
+RESULTS_DIR = ROOT / "data" / "benchmarks"
+K_VALUES = [1, 3, 5, 10]
+# Sentences of this many words make reasonable synthetic queries
+SYNTHETIC_WORDS = (8, 40)
+
+def promptfoo_queries():
+    from python_scripts.utils.promptfoo import load_tests
+    return [{"question": test["question"], "expected_urls": test["expected_urls"]}
+            for test in load_tests() if test["expected_urls"]]
+
+def synthetic_queries(n_queries, seed=0):
+    """Sample one sentence from each of n_queries random Discourse posts."""
+    import numpy as np
+    from python_scripts.utils.text_processing import clean_html, split_sentences
+    with open(DISCOURSE_FILE, "r", encoding="utf-8") as f:
+        posts = json.load(f)
+    rng = np.random.default_rng(seed)
+    queries = []
+    for i in rng.permutation(len(posts)):
+        sentences = [sentence for sentence in split_sentences(clean_html(posts[i]["content"]))
+                     if SYNTHETIC_WORDS[0] <= len(sentence.split()) <= SYNTHETIC_WORDS[1]]
+        if not sentences:
+            continue
+        queries.append({"question": sentences[rng.integers(len(sentences))], "expected_urls": [posts[i]["url"]]})
+        if len(queries) == n_queries:
+            break
+    return queries
+
+def percentiles(values):
+    import numpy as np
+    values = np.array(values) * 1000
+    return {f"p{p}_ms": float(np.percentile(values, p)) for p in (50, 95, 99)}
+
+def measure(query_sets):
+    """Run in the child process: load RAGSystem (configured by env vars) and run the queries."""
+    from api.rag_logic import RAGSystem
+    from api import tracing
+    from python_scripts.utils.promptfoo import normalize_url
+
+    start = time.perf_counter()
+    rag = RAGSystem()
+    rag.embedding_model.encode(["warm up"])
+    rag.reranker  # load the cross-encoder, if RERANKER is set
+    load_s = time.perf_counter() - start
+    result = {"load_s": load_s, "chunks": len(rag.chunks),
+              "load_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "sets": {}}
+
+    top_k = max(K_VALUES)
+    for name, queries in query_sets.items():
+        hits = {k: 0 for k in K_VALUES}
+        reciprocal_ranks = []
+        encode_times, search_times = [], []
+        for query in queries:
+            start = time.perf_counter()
+            embedding = rag.embedding_model.encode([query["question"]])[0]
+            encoded = time.perf_counter()
+            indices, _ = rag.search(embedding, top_k, query["question"])
+            search_times.append(time.perf_counter() - encoded)
+            encode_times.append(encoded - start)
+
+            expected = {normalize_url(url) for url in query["expected_urls"]}
+            ranks = [rank for rank, idx in enumerate(indices, start=1)
+                     if normalize_url(rag.metadata[idx]["url"]) in expected]
+            first = ranks[0] if ranks else None
+            reciprocal_ranks.append(1 / first if first else 0.0)
+            for k in K_VALUES:
+                hits[k] += bool(first and first <= k)
+
+        n = max(len(queries), 1)
+        result["sets"][name] = {
+            "queries": len(queries),
+            **{f"recall@{k}": hits[k] / n for k in K_VALUES},
+            "mrr": sum(reciprocal_ranks) / n,
+            "encode": percentiles(encode_times or [0]),
+            "search": percentiles(search_times or [0]),
+            "qps": len(queries) / max(sum(encode_times) + sum(search_times), 1e-9)
+        }
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    # Re-ranks that fitted the latency budget fully, partly or not at all
+    result["rerank"] = {dict(labels)["outcome"]: count for (name, labels), count in tracing.registry.counters.items()
+                        if name == "rerank_total"}
+    return result
+
+def git_commit():
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    return result.stdout.strip() or "unknown"
+
+def compare(results, baseline_file, max_drop):
+    """Print recall/MRR changes against a baseline result file; return False on a regression."""
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        baseline = {run["name"]: run for run in json.load(f)["runs"]}
+    ok = True
+    changed = False
+    print(f"\nCompared with {baseline_file}:")
+    for run in results["runs"]:
+        old = baseline.get(run["name"])
+        if old is None or "sets" not in run or "sets" not in old:
+            continue
+        for set_name, metrics in run["sets"].items():
+            old_metrics = old["sets"].get(set_name)
+            if old_metrics is None:
+                continue
+            for metric in [f"recall@{k}" for k in K_VALUES] + ["mrr"]:
+                delta = metrics[metric] - old_metrics[metric]
+                changed |= abs(delta) >= 0.001
+                if delta < -max_drop:
+                    ok = False
+                    print(f"❌ {run['name']} {set_name} {metric}: {old_metrics[metric]:.3f} -> {metrics[metric]:.3f}")
+                elif abs(delta) >= 0.001:
+                    print(f"   {run['name']} {set_name} {metric}: {old_metrics[metric]:.3f} -> {metrics[metric]:.3f}")
+    if not changed:
+        print("   no recall or MRR changes")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", default="exact/dense,exact/hybrid,ivf/hybrid",
+                        help="comma-separated VECTOR_INDEX/RETRIEVAL_MODE[/RERANKER] configurations")
+    parser.add_argument("--embeddings-dir", action="append", type=Path,
+                        help="embeddings directory to benchmark (repeat to compare chunking setups)")
+    parser.add_argument("--synthetic", type=int, default=200, help="synthetic queries sampled from Discourse")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="result file (default data/benchmarks/retrieval_<commit>.json)")
+    parser.add_argument("--baseline", type=Path, help="earlier result file to compare with")
+    parser.add_argument("--max-drop", type=float, default=0.02, help="allowed recall/MRR drop against --baseline")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with open(args.child, "r", encoding="utf-8") as f:
+            print(json.dumps(measure(json.load(f))))
+        return
+
+    query_sets = {"promptfoo": promptfoo_queries(), "synthetic": synthetic_queries(args.synthetic, args.seed)}
+    print(", ".join(f"{name}: {len(queries)} queries" for name, queries in query_sets.items()))
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+        json.dump(query_sets, f)
+        queries_file = f.name
+
+    commit = git_commit()
+    results = {"commit": commit, "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+               "embedding_backend": os.getenv("EMBEDDING_BACKEND", "torch"), "k": K_VALUES, "runs": []}
+    print(f"{'run':>36}  {'set':>9}  {'R@1':>5}  {'R@5':>5}  {'MRR':>5}  {'search p95':>10}  "
+          f"{'QPS':>6}  {'chunks':>7}  {'peak RSS':>8}")
+    for embeddings_dir in args.embeddings_dir or [Path("data/embeddings")]:
+        for config in args.configs.split(","):
+            vector_index, retrieval_mode, *reranker = config.split("/")
+            name = f"{embeddings_dir.name}:{config}"
+            env = {"EMBEDDINGS_DIR": str(embeddings_dir), "VECTOR_INDEX": vector_index,
+                   "RETRIEVAL_MODE": retrieval_mode, "RERANKER": "".join(reranker)}
+            process = subprocess.run([sys.executable, __file__, "--child", queries_file],
+                                     cwd=ROOT, env=dict(os.environ, **env), capture_output=True, text=True)
+            if process.returncode != 0:
+                print(f"{name:>36}  failed: {process.stderr.strip().splitlines()[-1]}")
+                results["runs"].append({"name": name, "env": env, "error": process.stderr.strip().splitlines()[-1]})
+                continue
+            run = json.loads(process.stdout.strip().splitlines()[-1])
+            results["runs"].append({"name": name, "env": env, **run})
+            for set_name, m in run["sets"].items():
+                print(f"{name:>36}  {set_name:>9}  {m['recall@1']:.3f}  {m['recall@5']:.3f}  {m['mrr']:.3f}  "
+                      f"{m['search']['p95_ms']:>8.2f}ms  {m['qps']:>6.0f}  {run['chunks']:>7}  "
+                      f"{run['peak_rss_mb']:>5.0f} MB")
+    os.unlink(queries_file)
+
+    output = args.output or RESULTS_DIR / f"retrieval_{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results saved to {output}")
+
+    if args.baseline and not compare(results, args.baseline, args.max_drop):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
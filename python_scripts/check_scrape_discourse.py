@@ -0,0 +1,156 @@
+"""Check scrape_discourse.py against a local fake Discourse server.
+
+Starts a fake forum (two listing pages of topics, two posts each) and runs
+the scraper against it with its output redirected to a temporary
+directory, checking that:
+
+1. the first run fetches every topic;
+2. a second run fetches nothing and leaves the output unchanged;
+3. a run that fails on one topic keeps the previous posts of every topic,
+   including the ones on the failing page that were fetched successfully;
+4. the next run fetches exactly the changed and failed topics.
+
+No credentials or network access are needed.
+
+Usage: python python_scripts/check_scrape_discourse.py
+"""
+import os
+import sys
+import json
+import tempfile
+import threading
+from functools import partial
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+
+N_TOPICS = 45
+PAGE_SIZE = 30
+
+class FakeDiscourse(BaseHTTPRequestHandler):
+    """Category listing (/c/...json?page=N) and topic (/t/ID.json) endpoints."""
+    topics = {}
+    failing = set()  # topic ids answered with a 500
+    fetched = []  # topic ids requested, in order
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith("/c/"):
+            page = int(parse_qs(url.query).get("page", ["0"])[0])
+            ids = sorted(self.topics)[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+            more = (page + 1) * PAGE_SIZE < len(self.topics)
+            self.send_json(200, {"topic_list": {"topics": [self.topics[i] for i in ids],
+                                                "more_topics_url": f"/c/next?page={page + 1}" if more else None}})
+        elif url.path.startswith("/t/"):
+            topic_id = int(url.path.split("/")[2].split(".")[0])
+            self.fetched.append(topic_id)
+            if topic_id in self.failing:
+                self.send_json(500, {"error": "fake failure"})
+                return
+            version = self.topics[topic_id]["last_posted_at"]
+            self.send_json(200, {"post_stream": {"posts": [
+                {"id": topic_id * 10 + n, "topic_id": topic_id, "post_number": n, "username": "student",
+                 "created_at": "2025-02-02T00:00:00Z", "cooked": f"<p>Post {n} as of {version}</p>"}
+                for n in (1, 2)
+            ]}})
+        else:
+            self.send_json(404, {})
+
+def change_topic(topic_id, last_posted_at):
+    FakeDiscourse.topics[topic_id] = dict(FakeDiscourse.topics[topic_id], last_posted_at=last_posted_at,
+                                          bumped_at=last_posted_at)
+
+def load_posts(path):
+    with open(path, "r", encoding="utf-8") as f:
+        posts = json.load(f)
+    by_topic = {}
+    for post in posts:
+        by_topic.setdefault(post["topic_id"], []).append(post["content"])
+    return by_topic
+
+def main():
+    FakeDiscourse.topics = {
+        i: {"id": i, "created_at": f"2025-02-{i % 28 + 1:02d}T00:00:00Z",
+            "last_posted_at": "2025-02-10T00:00:00Z", "bumped_at": "2025-02-10T00:00:00Z"}
+        for i in range(1, N_TOPICS + 1)
+    }
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeDiscourse)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # The scraper reads its settings at import
+    os.environ["DISCOURSE_URL"] = f"http://127.0.0.1:{server.server_port}"
+    os.environ["DISCOURSE_T"] = "fake"
+    os.environ["DISCOURSE_FORUM_SESSION"] = "fake"
+    os.environ.setdefault("GEMINI_API_KEY", "fake")
+    import python_scripts.scrape_discourse as scraper
+    from python_scripts.utils.rate_limit import TokenBucket
+    from python_scripts.utils.image_description_service import ImageDescriptionService, DescriptionCache
+
+    failures = []
+
+    def check(condition, message):
+        print(f"{'✅' if condition else '❌'} {message}")
+        if not condition:
+            failures.append(message)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        scraper.OUTPUT_DIR = tmp
+        scraper.OUTPUT_FILE = tmp / "discourse_posts.json"
+        scraper.STATE_FILE = tmp / "scrape_state.json"
+        scraper.rate_limiter = TokenBucket(1000)
+        scraper.image_service = ImageDescriptionService(scraper.model, cache=DescriptionCache(tmp / "images.sqlite"))
+        scraper.safe_request = partial(scraper.safe_request, max_retries=2, initial_delay=0)
+
+        def run():
+            FakeDiscourse.fetched = []
+            scraper.scrape_discourse()
+            return sorted(FakeDiscourse.fetched)
+
+        fetched = run()
+        first = load_posts(scraper.OUTPUT_FILE)
+        check(fetched == list(range(1, N_TOPICS + 1)), f"first run fetched all {N_TOPICS} topics")
+        check(len(first) == N_TOPICS and all(len(posts) == 2 for posts in first.values()),
+              "first run saved two posts per topic")
+
+        fetched = run()
+        check(fetched == [], "second run fetched no unchanged topics")
+        check(load_posts(scraper.OUTPUT_FILE) == first, "second run kept the posts")
+
+        # Topics 5 and 12 change; 13 (same listing page) changes and fails
+        for topic_id in (5, 12, 13):
+            change_topic(topic_id, "2025-03-01T00:00:00Z")
+        FakeDiscourse.failing = {13}
+        run()
+        check(load_posts(scraper.OUTPUT_FILE) == first,
+              "failed run kept the previous posts of every topic, including fetched ones on the failing page")
+
+        FakeDiscourse.failing = set()
+        fetched = run()
+        after = load_posts(scraper.OUTPUT_FILE)
+        check(fetched == [5, 12, 13], f"run after the failure fetched only the changed topics ({fetched})")
+        check(all("2025-03-01" in content for topic_id in (5, 12, 13) for content in after[topic_id])
+              and len(after) == N_TOPICS and after[1] == first[1],
+              "changed topics were updated and the others kept")
+
+    server.shutdown()
+    if failures:
+        print(f"\n❌ {len(failures)} check(s) failed")
+        sys.exit(1)
+    print("\n✅ All checks passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Convert the legacy context_embeddings.npz into the memory-mapped store format.
+
+Useful for deployments that have the old npz but cannot re-run
+embed_all_data.py. No model is needed: vectors are normalized and copied,
+and the sentence index is carried over when sentence_index.npz exists.
+The IVF and BM25 indexes are built as embed_all_data.py builds them.
+EMBEDDINGS_DIR selects the directory, as for the API and the other scripts.
+
+Usage: python python_scripts/convert_store.py [--dtype float32|float16|int8]
+"""
+import sys
+import shutil
+import argparse
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+from api.embedding_store import (EmbeddingStore, LegacyStore, StoreWriter, swap_in, STORE_DIR, BUILD_DIR,
+                                 LEGACY_EMBED_FILE, LEGACY_SENTENCE_INDEX_FILE)
+from api.vector_index import normalize_rows, STORAGE_DTYPES
+from python_scripts.utils.store_indexes import build_indexes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dtype", default="float32", choices=STORAGE_DTYPES)
+    args = parser.parse_args()
+
+    legacy = LegacyStore(LEGACY_EMBED_FILE, LEGACY_SENTENCE_INDEX_FILE)
+    embeddings = normalize_rows(legacy.embeddings)
+    chunks = [str(chunk) for chunk in legacy.chunks]
+    metadata = [dict(item) for item in legacy.metadata]
+
+    with_sentences = legacy.sentences is not None
+    sentences = None
+    if with_sentences:
+        offsets = legacy.chunk_sentence_offsets
+        sentences = [[legacy.sentences[i] for i in range(offsets[c], offsets[c + 1])]
+                     for c in range(len(chunks))]
+
+    # Build next to the live store and swap it in, so a failed conversion
+    # or a running server never sees half-written files
+    shutil.rmtree(BUILD_DIR, ignore_errors=True)
+    writer = StoreWriter(BUILD_DIR, dim=embeddings.shape[1], dtype=args.dtype, with_sentences=with_sentences)
+    writer.append(embeddings, chunks, metadata, sentences,
+                  legacy.sentence_embeddings if with_sentences else None)
+    writer.close()
+    swap_in(BUILD_DIR, STORE_DIR)
+    print(f"✅ Converted {len(chunks)} chunks from {LEGACY_EMBED_FILE} to {STORE_DIR}")
+
+    build_indexes(EmbeddingStore(STORE_DIR))
+
+if __name__ == "__main__":
+    main()
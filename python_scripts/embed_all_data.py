@@ -1,83 +1,343 @@
 import json
+import sys
+import shutil
+import argparse
 import numpy as np
 from pathlib import Path
+from itertools import islice
 from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 
 # File paths
 ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+from python_scripts.utils.text_processing import clean_html, split_sentences
+from python_scripts.utils.chunking import chunk_text, structured_chunks, NearDuplicateFilter, WINDOW_SIZE, WINDOW_OVERLAP
+from python_scripts.utils.store_indexes import build_indexes
+from api.vector_index import dequantize, STORAGE_DTYPES
+from api.embedding_store import (EmbeddingStore, StoreWriter, MANIFEST, chunk_hash, swap_in,
+                                 EMBED_DIR, STORE_DIR, BUILD_DIR)
+from api.embedding_backends import MODEL_NAME
+
 COURSE_FILE = ROOT / "data" / "course-content" / "course_content.json"
+# Per-file status written by scrape_course_content.py
+COURSE_MANIFEST_FILE = ROOT / "data" / "course-content" / "manifest.json"
 DISCOURSE_FILE = ROOT / "data" / "discourse-posts" / "discourse_posts.json"
-EMBED_DIR = ROOT / "data" / "embeddings"
+# EMBEDDINGS_DIR builds elsewhere, e.g. to compare chunkers with benchmark_retrieval.py
 EMBED_DIR.mkdir(parents=True, exist_ok=True)
-EMBED_FILE = EMBED_DIR / "context_embeddings.npz"
-
-# Chunking parameters
-CHUNK_SIZE = 500  # words (approximate)
-CHUNK_OVERLAP = 100  # words
-
-# Load data
-with open(COURSE_FILE, "r", encoding="utf-8") as f:
-    course_data = json.load(f)
-with open(DISCOURSE_FILE, "r", encoding="utf-8") as f:
-    discourse_data = json.load(f)
-
-# Combine and tag sources
-all_docs = []
-for item in course_data:
-    all_docs.append({
-        "text": item["content"],
-        "source": "course",
-        "url": item["github_url"]
-    })
-for item in discourse_data:
-    all_docs.append({
-        "text": item["content"],
-        "source": "discourse",
-        "url": item["url"]
-    })
-
-# Chunking function
-def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
-    words = text.split()
-    chunks = []
-    start = 0
-    while start < len(words):
-        end = min(start + chunk_size, len(words))
-        chunk = " ".join(words[start:end])
-        chunks.append(chunk)
-        if end == len(words):
-            break
-        start += chunk_size - overlap
-    return chunks
-
-# Prepare chunks and metadata
-all_chunks = []
-all_metadata = []
-
-for doc in tqdm(all_docs, desc="Chunking documents"):
-    chunks = chunk_text(doc["text"])
-    for chunk in chunks:
-        all_chunks.append(chunk)
-        all_metadata.append({
-            "source": doc["source"],
-            "url": doc["url"]
-        })
-
-print(f"Total chunks: {len(all_chunks)}")
-
-# Load embedding model
-model = SentenceTransformer("all-MiniLM-L6-v2")
-
-# Generate embeddings
-embeddings = model.encode(all_chunks, show_progress_bar=True, convert_to_numpy=True)
-
-# Save embeddings and metadata
-np.savez_compressed(
-    EMBED_FILE,
-    embeddings=embeddings,
-    chunks=np.array(all_chunks),
-    metadata=np.array(all_metadata, dtype=object)
-)
-
-print(f"✅ Embeddings saved to {EMBED_FILE}")
+CHECKPOINT_FILE = BUILD_DIR / "checkpoint.json"
+
+# Storage precision of new stores: "float32", "float16" or "int8" (see
+# quantize_store.py); a rebuild keeps the existing store's unless --dtype is given
+STORE_DTYPE = "float32"
+
+# Chunker: "structured" (headings, paragraphs and posts, HTML stripped) or
+# "window" (fixed overlapping word windows over the raw text)
+CHUNKER = "structured"
+
+# Chunks encoded and appended to the store per batch (bounds peak memory)
+BATCH_SIZE = 256
+
+# Metadata stored per chunk (filterable ones: api/metadata_index.py)
+METADATA_FIELDS = ("source", "url", "module", "role", "topic_id", "created_at")
+# Course staff, for posts scraped before scrape_discourse.py recorded the staff flag
+STAFF_USERNAMES = {"s.anand", "carlton", "Jivraj", "Saransh_Saini"}
+
+def iter_json_array(path, buffer_size=1 << 16):
+    """Yield the items of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = f.read(buffer_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} does not contain a JSON array")
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip()
+            if buffer.startswith(","):
+                buffer = buffer[1:].lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                more = f.read(buffer_size)
+                if not more:
+                    raise
+                buffer += more
+                continue
+            yield item
+            buffer = buffer[end:]
+
+def post_role(post):
+    """"staff" or "student" for a Discourse post."""
+    staff = post.get("staff")
+    if staff is None:
+        staff = post.get("username") in STAFF_USERNAMES
+    return "staff" if staff else "student"
+
+def iter_documents():
+    """Stream course and Discourse data as documents tagged with their source
+    and the metadata retrieval can filter on (api/metadata_index.py)."""
+    for item in iter_json_array(COURSE_FILE):
+        yield {
+            "text": item["content"],
+            "source": "course",
+            "format": "markdown",
+            "url": item["github_url"],
+            "module": Path(item.get("file_path") or item["github_url"]).stem,
+            "role": "",
+            "topic_id": "",
+            "created_at": ""
+        }
+    for item in iter_json_array(DISCOURSE_FILE):
+        yield {
+            "text": item["content"],
+            "source": "discourse",
+            "format": "html",
+            "url": item["url"],
+            "module": "",
+            "role": post_role(item),
+            "topic_id": str(item["topic_id"]),
+            "created_at": item["created_at"]
+        }
+
+def iter_chunks(docs, chunker=CHUNKER, dedupe=True, stats=None):
+    """Yield (chunk, metadata) pairs for a stream of documents.
+
+    With dedupe, chunks that nearly repeat an earlier chunk (MinHash) are
+    skipped; course pages come first, so their text wins over copies in
+    posts. stats counts chunks, words and skipped duplicates.
+    """
+    stats = {} if stats is None else stats
+    duplicates = NearDuplicateFilter() if dedupe else None
+    for doc in docs:
+        if chunker == "structured":
+            chunks = structured_chunks(doc["text"], doc["format"])
+        else:
+            chunks = chunk_text(doc["text"])
+        for chunk in chunks:
+            if duplicates is not None and duplicates.is_duplicate(chunk):
+                stats["duplicates"] = stats.get("duplicates", 0) + 1
+                continue
+            stats["chunks"] = stats.get("chunks", 0) + 1
+            stats["words"] = stats.get("words", 0) + len(chunk.split())
+            yield chunk, {field: doc[field] for field in METADATA_FIELDS}
+
+def batched(iterable, size):
+    """Yield lists of up to size items."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+class Encoder:
+    """Embedding model, optionally spread over several CPU worker processes."""
+
+    def __init__(self, workers=1):
+        self.model = SentenceTransformer(MODEL_NAME)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.pool = None
+        if workers > 1:
+            self.pool = self.model.start_multi_process_pool(target_devices=["cpu"] * workers)
+
+    def encode(self, texts):
+        """Embed texts as normalized float32 vectors, so the server can search them as-is."""
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        if self.pool is not None:
+            return self.model.encode_multi_process(texts, self.pool, normalize_embeddings=True)
+        return self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+
+    def close(self):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+
+def encode_chunks(encoder, chunks, html=False):
+    """Embed chunks and their sentences (cleaned first if the chunks hold HTML).
+
+    Returns (embeddings, sentences per chunk, sentence embeddings).
+    """
+    embeddings = encoder.encode(chunks)
+
+    # Split each chunk into sentences for the link-snippet index
+    sentences = [split_sentences(clean_html(chunk) if html else chunk) for chunk in chunks]
+    flat_sentences = [sentence for chunk_sentences in sentences for sentence in chunk_sentences]
+    return embeddings, sentences, encoder.encode(flat_sentences)
+
+def open_previous_store():
+    """Open the existing store for reuse, or None if it has no chunk hashes."""
+    if not (STORE_DIR / MANIFEST).exists():
+        print("ℹ️ No previous store found, encoding everything")
+        return None
+    store = EmbeddingStore(STORE_DIR)
+    if store.chunk_hashes is None or store.sentences is None:
+        print("ℹ️ Previous store has no chunk hashes or sentence index, encoding everything")
+        return None
+    return store
+
+def report_course_changes():
+    """Print which course files the last scrape added, changed or removed; their
+    chunks are the ones an incremental run encodes or drops (besides Discourse)."""
+    if not COURSE_MANIFEST_FILE.exists():
+        return
+    with open(COURSE_MANIFEST_FILE, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    changes = {status: sorted(path for path, entry in manifest["files"].items() if entry["status"] == status)
+               for status in ("added", "changed")}
+    changes["removed"] = manifest.get("removed", [])
+    print(f"📄 Course files in the last scrape ({manifest['generated_at']}): " +
+          ", ".join(f"{len(paths)} {status}" for status, paths in changes.items()))
+    for status, paths in changes.items():
+        for path in paths:
+            print(f"  {status}: {path}")
+
+def scale_rows(scales, start, end):
+    """int8 scales of rows start:end of a previous store (None for float stores)."""
+    return None if scales is None else scales[start:end]
+
+def embed_batch(batch, encoder, previous, previous_index, html=False):
+    """Embed a batch of (chunk, metadata) pairs, reusing vectors from the previous store.
+
+    Returns the arguments for StoreWriter.append and the number of reused chunks.
+    """
+    chunks = [chunk for chunk, _ in batch]
+    metadata = [item for _, item in batch]
+    reuse = [previous_index.get(chunk_hash(chunk)) for chunk in chunks]
+    new_positions = [i for i, old in enumerate(reuse) if old is None]
+
+    # Generate embeddings for new or modified chunks only
+    new_embeddings, new_sentences, new_sentence_embeddings = encode_chunks(
+        encoder, [chunks[i] for i in new_positions], html
+    )
+
+    # Assemble the batch in corpus order from reused and new vectors
+    embeddings = np.zeros((len(chunks), encoder.dim), dtype=np.float32)
+    sentences = [None] * len(chunks)
+    sentence_embeddings = [None] * len(chunks)
+    new_sentence_start = 0
+    for row, i in enumerate(new_positions):
+        embeddings[i] = new_embeddings[row]
+        sentences[i] = new_sentences[row]
+        sentence_embeddings[i] = new_sentence_embeddings[new_sentence_start:new_sentence_start + len(new_sentences[row])]
+        new_sentence_start += len(new_sentences[row])
+    for i, old in enumerate(reuse):
+        if old is None:
+            continue
+        start, end = previous.chunk_sentence_offsets[old], previous.chunk_sentence_offsets[old + 1]
+        embeddings[i] = dequantize(previous.embeddings[old:old + 1], scale_rows(previous.embedding_scales, old, old + 1))[0]
+        sentences[i] = [previous.sentences[s] for s in range(start, end)]
+        sentence_embeddings[i] = dequantize(previous.sentence_embeddings[start:end],
+                                            scale_rows(previous.sentence_scales, start, end))
+
+    sentence_embeddings = np.concatenate([np.zeros((0, encoder.dim), dtype=np.float32)] + sentence_embeddings)
+    return (embeddings, chunks, metadata, sentences, sentence_embeddings), len(chunks) - len(new_positions)
+
+def existing_store_dtype():
+    """Vector dtype of the current store, or STORE_DTYPE when there is none."""
+    if not (STORE_DIR / MANIFEST).exists():
+        return STORE_DTYPE
+    with open(STORE_DIR / MANIFEST, "r", encoding="utf-8") as f:
+        return json.load(f)["dtype"]
+
+def run_fingerprint(chunker, dedupe, dtype):
+    """Settings and input files of a run; a checkpoint is only resumed for the same fingerprint."""
+    return {
+        "inputs": {str(path): [path.stat().st_size, path.stat().st_mtime_ns] for path in [COURSE_FILE, DISCOURSE_FILE]},
+        "chunker": chunker,
+        "chunk_size": WINDOW_SIZE,
+        "chunk_overlap": WINDOW_OVERLAP,
+        "dedupe": dedupe,
+        "dtype": dtype
+    }
+
+def load_checkpoint(fingerprint):
+    """Return the saved checkpoint of an interrupted run with this fingerprint, or None."""
+    if not CHECKPOINT_FILE.exists():
+        print("ℹ️ No checkpoint found, starting from the beginning")
+        return None
+    with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if checkpoint["fingerprint"] != fingerprint:
+        print("ℹ️ Inputs or settings changed since the checkpoint, starting from the beginning")
+        return None
+    return checkpoint
+
+def save_checkpoint(checkpoint):
+    tmp_file = CHECKPOINT_FILE.with_suffix(".tmp")
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    tmp_file.replace(CHECKPOINT_FILE)
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunk and embed course content and Discourse posts.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="reuse vectors of unchanged chunks from the previous store")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted run from its last checkpoint")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="chunks encoded and written per batch")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="encoding processes (e.g. the number of CPU cores)")
+    parser.add_argument("--chunker", choices=["structured", "window"], default=CHUNKER,
+                        help="structure-aware chunks or fixed overlapping word windows")
+    parser.add_argument("--no-dedupe", dest="dedupe", action="store_false",
+                        help="keep near-duplicate chunks")
+    parser.add_argument("--dtype", choices=STORAGE_DTYPES,
+                        help="storage type of the vectors (default: that of the existing store)")
+    args = parser.parse_args()
+    dtype = args.dtype or existing_store_dtype()
+
+    # Look up chunk hashes in the previous store
+    previous = open_previous_store() if args.incremental else None
+    previous_index = {}
+    if previous is not None:
+        for i, digest in enumerate(previous.chunk_hashes):
+            previous_index.setdefault(bytes(digest), i)
+        report_course_changes()
+
+    encoder = Encoder(args.workers)
+
+    fingerprint = run_fingerprint(args.chunker, args.dedupe, dtype)
+    checkpoint = load_checkpoint(fingerprint) if args.resume else None
+    if checkpoint:
+        writer = StoreWriter.resume(BUILD_DIR, checkpoint["writer"])
+        stats = checkpoint["stats"]
+        print(f"⏩ Resuming after {writer.count} chunks")
+    else:
+        shutil.rmtree(BUILD_DIR, ignore_errors=True)
+        writer = StoreWriter(BUILD_DIR, dim=encoder.dim, dtype=dtype)
+        stats = {"reused": 0, "added": 0}
+
+    # Stream documents -> chunks -> batches -> store, checkpointing after each batch
+    chunk_stats = {}
+    chunk_stream = islice(iter_chunks(iter_documents(), args.chunker, args.dedupe, chunk_stats), writer.count, None)
+    progress = tqdm(desc="Embedding chunks", unit="chunk", initial=writer.count)
+    for batch in batched(chunk_stream, args.batch_size):
+        append_args, reused = embed_batch(batch, encoder, previous, previous_index, html=args.chunker == "window")
+        writer.append(*append_args)
+        stats["reused"] += reused
+        stats["added"] += len(batch) - reused
+        save_checkpoint({"fingerprint": fingerprint, "writer": writer.checkpoint(), "stats": stats})
+        progress.update(len(batch))
+    progress.close()
+    encoder.close()
+    writer.close()
+    CHECKPOINT_FILE.unlink(missing_ok=True)
+    print(f"Total chunks: {writer.count} ({dtype} vectors)")
+    print(f"Chunker: {args.chunker}, {chunk_stats.get('words', 0) / max(writer.count, 1):.0f} words per chunk, "
+          f"{chunk_stats.get('duplicates', 0)} near-duplicate chunks skipped")
+
+    if previous is not None:
+        current = set(bytes(digest) for digest in EmbeddingStore(BUILD_DIR).chunk_hashes)
+        removed = sum(1 for digest in previous.chunk_hashes if bytes(digest) not in current)
+
+    swap_in(BUILD_DIR, STORE_DIR)
+
+    print(f"✅ Embedding store saved to {STORE_DIR}")
+    if previous is not None:
+        print(f"♻️ Reused {stats['reused']} chunks, added {stats['added']}, removed {removed}")
+
+    # IVF, BM25 and (if one was built) PQ indexes over the new store
+    build_indexes(EmbeddingStore(STORE_DIR))
+
+if __name__ == "__main__":
+    main()
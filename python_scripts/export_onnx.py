@@ -0,0 +1,159 @@
+"""Export the embedding model to ONNX (float32 and int8) for EMBEDDING_BACKEND=onnx.
+
+Writes model.onnx, model_int8.onnx (dynamic int8 quantization) and
+tokenizer.json to --output, then checks both against the PyTorch model on
+the promptfoo questions and a sample of corpus sentences:
+
+- cosine similarity with the torch vector must be >= 0.9999 (float32) or
+  >= 0.99 (int8) for every text, so queries stay compatible with the
+  stored corpus embeddings, which are always computed with torch;
+- top-5 retrieval against the stored corpus embeddings is reported as the
+  overlap with the torch top-5.
+
+With --reranker, the cross-encoder (RERANKER_MODEL) is exported instead,
+for RERANKER=onnx, and checked by the correlation of its logits with the
+torch ones on promptfoo questions paired with corpus chunks.
+
+Exits with status 1 if a tolerance is not met. Needs torch, onnx and
+onnxruntime; serving with EMBEDDING_BACKEND=onnx only needs onnxruntime
+and tokenizers (requirements-onnx.txt).
+
+Usage: python python_scripts/export_onnx.py [--output data/models/all-MiniLM-L6-v2]
+       python python_scripts/export_onnx.py --reranker [--output data/models/ms-marco-MiniLM-L-6-v2]
+"""
+import sys
+import argparse
+import numpy as np
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+from api.embedding_backends import TorchBackend, OnnxBackend, MODEL_NAME, MAX_SEQ_LENGTH
+from api.reranker import TorchCrossEncoder, OnnxCrossEncoder, RERANKER_MODEL
+from api.embedding_store import load_store, STORE_DIR, LEGACY_EMBED_FILE, LEGACY_SENTENCE_INDEX_FILE
+from api.vector_index import ExactIndex
+
+OUTPUT_DIR = ROOT / "data" / "models" / MODEL_NAME
+
+# Minimum cosine similarity between ONNX and torch vectors of the same text
+TOLERANCE = {"model.onnx": 0.9999, "model_int8.onnx": 0.99}
+# Minimum correlation between ONNX and torch cross-encoder logits
+RERANKER_TOLERANCE = {"model.onnx": 0.9999, "model_int8.onnx": 0.95}
+RERANKER_OUTPUT_DIR = ROOT / "data" / "models" / RERANKER_MODEL.split("/")[-1]
+
+def export(torch_backend, output_dir):
+    """Export the transformer of the sentence-transformers model to output_dir/model.onnx."""
+    if torch_backend.model.max_seq_length != MAX_SEQ_LENGTH:
+        print(f"⚠️ Model truncates at {torch_backend.model.max_seq_length} tokens, "
+              f"OnnxBackend at {MAX_SEQ_LENGTH}")
+    export_transformer(torch_backend.model[0].auto_model, torch_backend.model.tokenizer,
+                       output_dir, "last_hidden_state")
+
+def export_transformer(transformer, tokenizer, output_dir, output_name):
+    """Write output_dir/model.onnx (dynamic batch and sequence axes) and tokenizer.json."""
+    import torch
+    transformer = transformer.eval()
+    tokenizer.backend_tokenizer.save(str(output_dir / "tokenizer.json"))
+
+    sample = tokenizer(["Export this sentence."], return_tensors="pt")
+    input_names = [name for name in ["input_ids", "attention_mask", "token_type_ids"] if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + [output_name]}
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            str(output_dir / "model.onnx"),
+            input_names=input_names,
+            output_names=[output_name],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+            dynamo=False
+        )
+
+def quantize(output_dir):
+    """Write output_dir/model_int8.onnx with int8 weights (dynamic quantization)."""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(str(output_dir / "model.onnx"), str(output_dir / "model_int8.onnx"),
+                     weight_type=QuantType.QInt8)
+
+def sample_texts(store, n_texts, seed=0):
+    """Promptfoo questions plus a random sample of corpus sentences (or chunks)."""
+    from python_scripts.utils.promptfoo import load_tests
+    texts = [test["question"] for test in load_tests()]
+    column = store.sentences if store.sentences is not None else store.chunks
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(column), min(n_texts, len(column)), replace=False)
+    return texts + [str(column[int(i)]) for i in picks]
+
+def export_reranker(model_name, output_dir, n_texts):
+    """Export and check the cross-encoder; returns False if a tolerance is not met."""
+    from python_scripts.utils.promptfoo import load_tests
+    cross_encoder = TorchCrossEncoder(model_name)
+    export_transformer(cross_encoder.model.model, cross_encoder.model.tokenizer, output_dir, "logits")
+    quantize(output_dir)
+    print(f"✅ Exported {model_name} to {output_dir}")
+
+    store = load_store(STORE_DIR, LEGACY_EMBED_FILE, LEGACY_SENTENCE_INDEX_FILE)
+    rng = np.random.default_rng(0)
+    chunks = [str(store.chunks[int(i)]) for i in rng.choice(len(store.chunks), min(n_texts, len(store.chunks)), replace=False)]
+    questions = [test["question"] for test in load_tests()]
+    reference = np.concatenate([cross_encoder.score(question, chunks) for question in questions])
+
+    ok = True
+    for file_name, tolerance in RERANKER_TOLERANCE.items():
+        path = output_dir / file_name
+        onnx_encoder = OnnxCrossEncoder(path)
+        scores = np.concatenate([onnx_encoder.score(question, chunks) for question in questions])
+        correlation = np.corrcoef(scores, reference)[0, 1]
+        top_agreement = np.mean([np.argmax(scores[i:i + len(chunks)]) == np.argmax(reference[i:i + len(chunks)])
+                                 for i in range(0, len(reference), len(chunks))])
+        ok &= correlation >= tolerance
+        print(f"{'✅' if correlation >= tolerance else '❌'} {file_name} ({path.stat().st_size / 2**20:.1f} MB): "
+              f"logit correlation {correlation:.5f} (tolerance {tolerance}), max difference "
+              f"{np.abs(scores - reference).max():.4f}, same top chunk as torch for {top_agreement:.0%} "
+              f"of {len(questions)} questions × {len(chunks)} chunks")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help=f"model name or path (default {MODEL_NAME}, or {RERANKER_MODEL} with --reranker)")
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--texts", type=int, default=200, help="corpus texts used for the check")
+    parser.add_argument("--reranker", action="store_true", help="export the cross-encoder reranker")
+    args = parser.parse_args()
+
+    if args.reranker:
+        output = args.output or RERANKER_OUTPUT_DIR
+        output.mkdir(parents=True, exist_ok=True)
+        sys.exit(0 if export_reranker(args.model or RERANKER_MODEL, output, args.texts) else 1)
+
+    args.model = args.model or MODEL_NAME
+    args.output = args.output or OUTPUT_DIR
+    args.output.mkdir(parents=True, exist_ok=True)
+    torch_backend = TorchBackend(args.model)
+    export(torch_backend, args.output)
+    quantize(args.output)
+    print(f"✅ Exported {MODEL_NAME} to {args.output}")
+
+    store = load_store(STORE_DIR, LEGACY_EMBED_FILE, LEGACY_SENTENCE_INDEX_FILE)
+    corpus = ExactIndex(store.embeddings, normalized=store.normalized, scales=store.embedding_scales)
+    texts = sample_texts(store, args.texts)
+    reference = torch_backend.encode(texts)
+    reference_top = [set(corpus.search(vector, 5)[0]) for vector in reference]
+
+    failed = False
+    for file_name, tolerance in TOLERANCE.items():
+        path = args.output / file_name
+        vectors = OnnxBackend(path).encode(texts)
+        cosine = np.sum(vectors * reference, axis=1)
+        overlap = np.mean([len(set(corpus.search(vector, 5)[0]) & top) / 5
+                           for vector, top in zip(vectors, reference_top)])
+        ok = cosine.min() >= tolerance
+        failed |= not ok
+        print(f"{'✅' if ok else '❌'} {file_name} ({path.stat().st_size / 2**20:.1f} MB): "
+              f"min cosine {cosine.min():.5f}, mean {cosine.mean():.5f} (tolerance {tolerance}), "
+              f"top-5 overlap with torch {overlap:.3f} on {len(texts)} texts")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Load test for the /api/ pipeline using a local stub LLM.
+
+Runs the real retrieval pipeline (encoding, vector search, link snippets)
+with LLM_BACKEND=stub, which only sleeps for STUB_LLM_DELAY seconds instead
+of calling Gemini. The answer cache is disabled so every request is
+retrieved. Throughput should scale with concurrency until the CPU pool
+saturates; if it stays flat, something is blocking the event loop.
+Micro-batching statistics are printed at the end. With --stream, requests
+use the server-sent events variant and time to first token is reported too.
+
+Usage: python python_scripts/load_test.py [--requests 64] [--delay 0.5] [--stream]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+
+QUESTIONS = [
+    "Should I use Docker or Podman for this course?",
+    "How is the GA4 bonus shown on the dashboard?",
+    "Which model should I use for GA5 question 8?",
+    "How do I install uv and run a script with it?",
+    "What is the deadline for project 1?",
+    "How do I deploy a FastAPI app to Vercel?",
+]
+
+async def run_level(answer_question, request_class, concurrency, n_requests, stream=False):
+    """Send n_requests with at most `concurrency` in flight.
+
+    Returns (req/s, mean latency s, mean time to first token s); without
+    streaming the first token arrives with the whole answer.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    first_tokens = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await answer_question(request_class(question=QUESTIONS[i % len(QUESTIONS)], stream=stream))
+            first_token = None
+            if stream:
+                async for event in response.body_iterator:
+                    if first_token is None and event.startswith("event: token"):
+                        first_token = time.perf_counter() - start
+            latencies.append(time.perf_counter() - start)
+            first_tokens.append(first_token or latencies[-1])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_requests)))
+    elapsed = time.perf_counter() - start
+    return n_requests / elapsed, sum(latencies) / len(latencies), sum(first_tokens) / len(first_tokens)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64, help="requests per concurrency level")
+    parser.add_argument("--delay", type=float, default=0.5, help="stub LLM latency in seconds")
+    parser.add_argument("--levels", default="1,2,4,8,16,32", help="comma-separated concurrency levels")
+    parser.add_argument("--stream", action="store_true", help="use server-sent events and report time to first token")
+    args = parser.parse_args()
+
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["STUB_LLM_DELAY"] = str(args.delay)
+    os.environ["ANSWER_CACHE_SIZE"] = "0"
+    os.environ.setdefault("PROMPT_TOKEN_LOG", "0")  # one line per request would flood the report
+    os.chdir(ROOT)  # RAGSystem uses paths relative to the repo root
+    from api.main import answer_question, QuestionRequest, batching_stats
+
+    # Warm up the model and caches
+    await answer_question(QuestionRequest(question=QUESTIONS[0]))
+
+    print(f"Stub LLM delay: {args.delay}s, {args.requests} requests per level")
+    print(f"{'concurrency':>11}  {'req/s':>8}  {'mean latency':>12}  {'first token':>11}")
+    for concurrency in [int(level) for level in args.levels.split(",")]:
+        throughput, latency, first_token = await run_level(answer_question, QuestionRequest, concurrency,
+                                                           args.requests, args.stream)
+        print(f"{concurrency:>11}  {throughput:>8.2f}  {latency * 1000:>10.0f}ms  {first_token * 1000:>9.0f}ms")
+
+    for name, stats in (await batching_stats()).items():
+        print(f"{name}: {stats['batches']} batches, mean size {stats['mean_batch_size']:.1f}, "
+              f"max queue depth {stats['max_queue_depth']}, wait p95 {stats['wait_ms_p95']:.2f}ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
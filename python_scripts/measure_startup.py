@@ -0,0 +1,65 @@
+"""Measure the cold start of api/main.py.
+
+Imports api.main in fresh interpreters with `python -X importtime` and
+reports the slowest modules by cumulative import time, then the time until
+the RAG system is ready (store, indexes and embedding model loaded) with
+the breakdown from /api/status.
+
+Usage: python python_scripts/measure_startup.py [--top 15] [--mode lazy]
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+READY_SNIPPET = """
+import json, time
+start = time.perf_counter()
+import api.main as main
+imported = time.perf_counter() - start
+main.load_rag()
+print(json.dumps({"wall_import_s": imported, "wall_ready_s": time.perf_counter() - start,
+                  **main.startup_timings, **main.rag.timings}))
+"""
+
+def run_python(args, mode):
+    env = dict(os.environ, STARTUP_MODE=mode, LLM_BACKEND=os.getenv("LLM_BACKEND", "stub"))
+    return subprocess.run([sys.executable, *args], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+
+def module_import_times(mode):
+    """Return [(cumulative s, self s, module)] for importing api.main."""
+    result = run_python(["-X", "importtime", "-c", "import api.main"], mode)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        times.append((int(cumulative_us) / 1e6, int(self_us) / 1e6, module.strip()))
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=15, help="number of modules to list")
+    parser.add_argument("--mode", default="lazy", choices=["lazy", "background", "eager"],
+                        help="STARTUP_MODE for the import measurement")
+    args = parser.parse_args()
+
+    times = module_import_times(args.mode)
+    total = sum(self_s for _, self_s, _ in times)
+    print(f"Importing api.main (STARTUP_MODE={args.mode}): {total:.3f}s in {len(times)} modules")
+    print(f"{'cumulative':>10}  {'self':>8}  module")
+    for cumulative, self_s, module in sorted(times, reverse=True)[:args.top]:
+        print(f"{cumulative:>9.3f}s  {self_s:>7.3f}s  {module}")
+
+    ready = json.loads(run_python(["-c", READY_SNIPPET], "lazy").stdout.strip().splitlines()[-1])
+    print("\nCold start until ready (seconds):")
+    for name, seconds in ready.items():
+        print(f"{name:>16}  {seconds:.3f}")
+
+if __name__ == "__main__":
+    main()
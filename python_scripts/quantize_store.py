@@ -0,0 +1,80 @@
+"""Convert the embedding store to compact vector storage and/or build a PQ index.
+
+--dtype rewrites the store's chunk and sentence vectors as float16 (2x
+smaller) or int8 with a float32 scale per vector (about 4x smaller); texts,
+metadata and the IVF and lexical indexes are unchanged. --pq builds
+pq_index.npz for VECTOR_INDEX=pq: n_subspaces bytes per vector (48 bytes
+is 32x smaller than float32), re-ranked against the store's vectors
+(PQ_RERANK). Vectors are read as float32, so any store can be converted
+again. Run python_scripts/benchmark_index.py for the recall of each mode.
+embed_all_data.py keeps the converted dtype when it rebuilds the store.
+
+Usage: python python_scripts/quantize_store.py [--dtype float32|float16|int8] [--pq 48]
+"""
+import sys
+import shutil
+import argparse
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+from api.embedding_store import EmbeddingStore, StoreWriter, swap_in, STORE_DIR, BUILD_DIR, PQ_INDEX_FILE
+from api.vector_index import dequantize, save_pq_index, STORAGE_DTYPES
+
+# Chunks copied per batch (bounds peak memory)
+BATCH_SIZE = 4096
+
+def store_size(path):
+    return sum(f.stat().st_size for f in Path(path).iterdir())
+
+def vector_rows(store, start, end):
+    """float32 chunk vectors start:end of a store."""
+    scales = None if store.embedding_scales is None else store.embedding_scales[start:end]
+    return dequantize(store.embeddings[start:end], scales)
+
+def convert(store, dtype):
+    """Write a copy of store with dtype vectors to BUILD_DIR and swap it in."""
+    shutil.rmtree(BUILD_DIR, ignore_errors=True)
+    with_sentences = store.sentences is not None
+    writer = StoreWriter(BUILD_DIR, dim=store.embeddings.shape[1], dtype=dtype,
+                         normalized=store.normalized, with_sentences=with_sentences)
+    count = len(store.embeddings)
+    for start in range(0, count, BATCH_SIZE):
+        end = min(start + BATCH_SIZE, count)
+        sentences, sentence_embeddings = None, None
+        if with_sentences:
+            offsets = store.chunk_sentence_offsets
+            sentences = [[store.sentences[s] for s in range(offsets[c], offsets[c + 1])] for c in range(start, end)]
+            scales = store.sentence_scales
+            first, last = offsets[start], offsets[end]
+            sentence_embeddings = dequantize(store.sentence_embeddings[first:last],
+                                             None if scales is None else scales[first:last])
+        writer.append(vector_rows(store, start, end), [store.chunks[c] for c in range(start, end)],
+                      [store.metadata[c] for c in range(start, end)], sentences, sentence_embeddings)
+    writer.close()
+    swap_in(BUILD_DIR, STORE_DIR)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dtype", choices=STORAGE_DTYPES, help="new storage type of the store's vectors")
+    parser.add_argument("--pq", type=int, metavar="N_SUBSPACES", help="build a PQ index with this many subspaces")
+    args = parser.parse_args()
+    if not args.dtype and not args.pq:
+        parser.error("nothing to do: pass --dtype and/or --pq")
+
+    store = EmbeddingStore(STORE_DIR)
+    if args.dtype:
+        before = store_size(STORE_DIR)
+        convert(store, args.dtype)
+        store = EmbeddingStore(STORE_DIR)
+        print(f"✅ Store converted from {before / 2**20:.1f} MB to "
+              f"{store_size(STORE_DIR) / 2**20:.1f} MB ({args.dtype}, {len(store.embeddings)} chunks)")
+
+    if args.pq:
+        if not store.normalized:
+            sys.exit("❌ PQ needs a store with normalized vectors (rebuild it with embed_all_data.py)")
+        code_bytes = save_pq_index(PQ_INDEX_FILE, vector_rows(store, 0, len(store.embeddings)), n_subspaces=args.pq)
+        print(f"✅ PQ index with {args.pq} subspaces ({code_bytes / 2**20:.2f} MB of codes) saved to {PQ_INDEX_FILE}")
+
+if __name__ == "__main__":
+    main()
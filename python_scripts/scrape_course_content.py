@@ -1,9 +1,12 @@
 import re
 import os
+import sys
 import json
-import time
+import hashlib
+import argparse
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import google.generativeai as genai
 from dotenv import load_dotenv
 load_dotenv()
@@ -27,51 +30,65 @@ REPO_PATH = ROOT_DIR / 'tools-in-data-science-public'
 # Output directory and file
 OUTPUT_DIR = ROOT_DIR / 'data' / 'course-content'
 OUTPUT_FILE = OUTPUT_DIR / 'course_content.json'
+# Per-file fingerprints and status of the last run, to skip unchanged files
+# (reported by embed_all_data.py --incremental)
+MANIFEST_FILE = OUTPUT_DIR / 'manifest.json'
+MAX_WORKERS = 8  # Files fingerprinted and processed concurrently
+
+# ========== IMAGE DESCRIPTIONS ==========
+# Shared, cached and rate-limited image description service
+sys.path.append(str(ROOT_DIR))
+from python_scripts.utils.image_description_service import ImageDescriptionService, canonical_key, ERROR_PREFIX
+image_service = ImageDescriptionService(model, requests_per_second=1)
+
+# Regex for Markdown images: ![alt](url)
+IMAGE_PATTERN = re.compile(r'!\[(.*?)\]\((.*?)\)')
+
+def git_blob_id(data):
+    """The id git gives this content (as in `git ls-files -s`), without needing git."""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+def fingerprint(file_path, previous):
+    """{"blob", "size", "mtime_ns"} of a file; the blob id of the previous
+    manifest entry is reused while size and mtime are unchanged."""
+    stat = file_path.stat()
+    entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if previous and all(previous.get(key) == value for key, value in entry.items()):
+        return {"blob": previous["blob"], **entry}
+    return {"blob": git_blob_id(file_path.read_bytes()), **entry}
+
+def load_previous_run():
+    """Load the manifest and records of the previous run"""
+    manifest = {"files": {}}
+    if MANIFEST_FILE.exists():
+        with open(MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    records = {}
+    if manifest["files"] and OUTPUT_FILE.exists():
+        with open(OUTPUT_FILE, 'r', encoding='utf-8') as f:
+            records = {record["file_path"]: record for record in json.load(f)}
+    return manifest, records
+
+def markdown_images(file_path):
+    """(image_url, alt_text) pairs of the images in a markdown file."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return [(url, alt) for alt, url in IMAGE_PATTERN.findall(f.read())]
 
-# ========== IMAGE DESCRIPTION CACHE ==========
-# Optional: cache Gemini responses to avoid duplicate requests
-CACHE_FILE = ROOT_DIR / 'data' / 'image_descriptions_cache.json'
-if CACHE_FILE.exists():
-    with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-        image_cache = json.load(f)
-else:
-    image_cache = {}
-
-def describe_image(alt_text, image_url):
-    """Get or generate a Gemini description for an image."""
-    cache_key = f"{alt_text}|{image_url}"
-    if cache_key in image_cache:
-        return image_cache[cache_key]
-    try:
-        prompt = f"Describe this educational image in detail for student assistance. Alt text: '{alt_text}'."
-        response = model.generate_content(prompt)
-        description = response.text.strip()
-        image_cache[cache_key] = description
-        # Save cache after every new description
-        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(image_cache, f, indent=2, ensure_ascii=False)
-        time.sleep(1)  # Rate limit
-        return description
-    except Exception as e:
-        return f"Image description unavailable: {str(e)}"
-
-def process_markdown(file_path, repo_root):
-    """Process markdown file: replace images with Gemini descriptions."""
+def process_markdown(file_path, repo_root, descriptions):
+    """Process markdown file: replace images with their Gemini descriptions."""
     with open(file_path, 'r', encoding='utf-8') as f:
         content = f.read()
 
-    # Regex for Markdown images: ![alt](url)
-    image_pattern = re.compile(r'!\[(.*?)\]\((.*?)\)')
-    images = image_pattern.findall(content)
+    images = IMAGE_PATTERN.findall(content)
 
     # Replace images with Gemini descriptions
     def replace_image(match):
         alt_text = match.group(1)
         image_url = match.group(2)
-        description = describe_image(alt_text, image_url)
+        description = descriptions[canonical_key(image_url, alt_text)]
         return f"[Image Description: {description}]"
 
-    processed_content = image_pattern.sub(replace_image, content)
+    processed_content = IMAGE_PATTERN.sub(replace_image, content)
 
     # Build correct GitHub URL (handles subdirectories)
     relative_path = file_path.relative_to(repo_root)
@@ -87,23 +104,65 @@ def process_markdown(file_path, repo_root):
     }
 
 def main():
+    parser = argparse.ArgumentParser(description="Convert the course markdown files to course_content.json.")
+    parser.add_argument("--full", action="store_true",
+                        help="reprocess every file, e.g. after changing how images are described")
+    args = parser.parse_args()
+
     # Ensure output directory exists
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-
-    processed_files = []
-
-    for md_file in REPO_PATH.glob('**/*.md'):
-        # Skip README.md and config files
-        if md_file.name.lower() == 'readme.md':
-            continue
-        processed = process_markdown(md_file, REPO_PATH)
-        processed_files.append(processed)
-        print(f"Processed: {md_file}")
-
-    # Save all processed content to JSON
+    manifest, records = load_previous_run()
+    previous_files = manifest["files"]
+
+    # Skip README.md and config files; sorted, so unchanged output stays byte-identical
+    md_files = sorted(f for f in REPO_PATH.glob('**/*.md') if f.name.lower() != 'readme.md')
+    paths = [str(f.relative_to(REPO_PATH)) for f in md_files]
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        fingerprints = list(executor.map(fingerprint, md_files, [previous_files.get(path) for path in paths]))
+
+        # A file is reprocessed when its content changed, its record is missing,
+        # one of its images could not be described last time, or with --full
+        files = {}
+        changed = []
+        for md_file, path, entry in zip(md_files, paths, fingerprints):
+            previous = previous_files.get(path)
+            record = records.get(path)
+            if previous is None:
+                status = "added"
+            elif (args.full or previous["blob"] != entry["blob"] or record is None
+                  or ERROR_PREFIX in record["content"]):
+                status = "changed"
+            else:
+                status = "unchanged"
+            files[path] = {**entry, "status": status}
+            if status != "unchanged":
+                changed.append(md_file)
+
+        # Describe the images of changed files up front: deduplicated, cached and concurrent
+        descriptions = image_service.describe_many(
+            [image for md_file in changed for image in markdown_images(md_file)]
+        )
+        for processed in executor.map(lambda md_file: process_markdown(md_file, REPO_PATH, descriptions), changed):
+            records[processed["file_path"]] = processed
+            print(f"Processed: {processed['file_path']}")
+
+    processed_files = [records[path] for path in paths]
+    for path, entry in files.items():
+        entry["processed_at"] = records[path]["processed_at"]
+    removed = sorted(path for path in manifest["files"] if path not in files)
+
+    # Save all processed content to JSON, then the manifest that describes it
     with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
         json.dump(processed_files, f, indent=2, ensure_ascii=False)
+    with open(MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump({"generated_at": datetime.now().isoformat(), "files": files, "removed": removed}, f, indent=2)
+
+    counts = {status: sum(entry["status"] == status for entry in files.values())
+              for status in ("added", "changed", "unchanged")}
     print(f"\nAll done! Output saved to {OUTPUT_FILE}")
+    print(f"🔁 {counts['added']} files added, {counts['changed']} changed, "
+          f"{counts['unchanged']} unchanged, {len(removed)} removed")
 
 if __name__ == "__main__":
     main()
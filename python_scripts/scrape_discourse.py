@@ -1,8 +1,11 @@
 import json
 import time
 import os
+import sys
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 import google.generativeai as genai
@@ -11,11 +14,14 @@ from datetime import datetime, timezone
 # Load environment variables
 load_dotenv()
 
-# Configuration
-DISCOURSE_URL = "https://discourse.onlinedegree.iitm.ac.in"
+# Configuration (DISCOURSE_URL can point at a local fake server for testing)
+DISCOURSE_URL = os.getenv('DISCOURSE_URL', "https://discourse.onlinedegree.iitm.ac.in")
 CATEGORY_PATH = "courses/tds-kb/34"
 START_DATE = datetime(2025, 1, 1, tzinfo=timezone.utc)
 END_DATE = datetime(2025, 4, 14, tzinfo=timezone.utc)
+MAX_WORKERS = 8  # Concurrent topic fetches
+REQUESTS_PER_SECOND = 4  # Shared rate limit for all Discourse requests
+IMAGE_REQUESTS_PER_SECOND = 0.5  # Rate limit for Gemini image descriptions
 
 # Get credentials
 DISCOURSE_T = os.getenv('DISCOURSE_T')
@@ -33,73 +39,64 @@ model = genai.GenerativeModel('gemini-1.5-flash')
 
 # Path setup
 ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT_DIR))
+from python_scripts.utils.rate_limit import TokenBucket
+from python_scripts.utils.image_description_service import ImageDescriptionService, canonical_key
+
 OUTPUT_DIR = ROOT_DIR / 'data' / 'discourse-posts'
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-CACHE_FILE = ROOT_DIR / 'data' / 'image_descriptions_cache.json'
+OUTPUT_FILE = OUTPUT_DIR / 'discourse_posts.json'
+# Per-topic last_posted_at/bumped_at from the previous run, to skip unchanged topics
+STATE_FILE = OUTPUT_DIR / 'scrape_state.json'
 
-# Load or initialize image description cache
-if CACHE_FILE.exists():
-    with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-        image_cache = json.load(f)
-else:
-    image_cache = {}
+rate_limiter = TokenBucket(REQUESTS_PER_SECOND)
+image_service = ImageDescriptionService(model, requests_per_second=IMAGE_REQUESTS_PER_SECOND)
 
 def create_session():
-    """Create authenticated session with cookies"""
+    """Create authenticated session with cookies and a connection pool sized for the workers"""
     session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
     session.cookies.update({
         '_t': DISCOURSE_T,
         '_forum_session': DISCOURSE_FORUM_SESSION
     })
     return session
 
-def get_image_description(image_url, alt_text=""):
-    """Get image description from Gemini with caching and rate limit handling"""
-    cache_key = f"{image_url}|{alt_text}"
-    if cache_key in image_cache:
-        return image_cache[cache_key]
-    try:
-        response = model.generate_content(
-            f"Describe this educational image in detail for student assistance. Alt text: '{alt_text}'. Image URL: {image_url}"
-        )
-        description = response.text.strip()
-        image_cache[cache_key] = description
-        # Save cache after every new entry
-        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(image_cache, f, indent=2, ensure_ascii=False)
-        time.sleep(2)  # Add delay to avoid hitting rate limits
-        return description
-    except Exception as e:
-        error_msg = f"Image description unavailable: {str(e)}"
-        image_cache[cache_key] = error_msg
-        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(image_cache, f, indent=2, ensure_ascii=False)
-        return error_msg
-
-def process_post(post):
-    """Process post content and replace images with Gemini descriptions"""
-    soup = BeautifulSoup(post['cooked'], 'html.parser')
-    for img in soup.find_all('img'):
-        img_url = img['src']
-        alt_text = img.get('alt', '')
-        if img_url.startswith('/'):
-            img_url = f"{DISCOURSE_URL}{img_url}"
-        description = get_image_description(img_url, alt_text)
-        img.replace_with(f"[Image Description: {description}]")
-    return {
-        "id": post['id'],
-        "topic_id": post['topic_id'],
-        "username": post['username'],
-        "created_at": post['created_at'],
-        "url": f"{DISCOURSE_URL}/t/{post['topic_id']}/{post['post_number']}",
-        "content": str(soup)
-    }
+def image_url(img):
+    """Absolute URL of an <img> tag"""
+    url = img['src']
+    return f"{DISCOURSE_URL}{url}" if url.startswith('/') else url
+
+def process_posts(posts):
+    """Process posts and replace images with Gemini descriptions (described in one batch)"""
+    soups = [BeautifulSoup(post['cooked'], 'html.parser') for post in posts]
+    descriptions = image_service.describe_many(
+        [(image_url(img), img.get('alt', '')) for soup in soups for img in soup.find_all('img')]
+    )
+    processed = []
+    for post, soup in zip(posts, soups):
+        for img in soup.find_all('img'):
+            description = descriptions[canonical_key(image_url(img), img.get('alt', ''))]
+            img.replace_with(f"[Image Description: {description}]")
+        processed.append({
+            "id": post['id'],
+            "topic_id": post['topic_id'],
+            "username": post['username'],
+            "staff": bool(post.get('staff') or post.get('moderator') or post.get('admin')),
+            "created_at": post['created_at'],
+            "url": f"{DISCOURSE_URL}/t/{post['topic_id']}/{post['post_number']}",
+            "content": str(soup)
+        })
+    return processed
 
 def safe_request(session, url, max_retries=5, initial_delay=1):
     """Handle requests with exponential backoff"""
     retries = 0
     while retries < max_retries:
         try:
+            rate_limiter.acquire()
             response = session.get(url, timeout=30)
             response.raise_for_status()
             return response
@@ -110,74 +107,125 @@ def safe_request(session, url, max_retries=5, initial_delay=1):
             retries += 1
     raise Exception(f"❌ Failed after {max_retries} retries for URL: {url}")
 
+def load_previous_run():
+    """Load posts and per-topic state saved by the previous run"""
+    state = {}
+    if STATE_FILE.exists():
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    posts_by_topic = {}
+    if state and OUTPUT_FILE.exists():
+        with open(OUTPUT_FILE, 'r', encoding='utf-8') as f:
+            for post in json.load(f):
+                posts_by_topic.setdefault(str(post['topic_id']), []).append(post)
+    else:
+        state = {}  # Posts are missing, so the state cannot be trusted
+    return state, posts_by_topic
+
+def topic_version(topic):
+    """Fields that change whenever a topic gets new or edited posts"""
+    return {
+        "last_posted_at": topic.get('last_posted_at'),
+        "bumped_at": topic.get('bumped_at')
+    }
+
+def fetch_topic(session, topic_id):
+    """Fetch the raw posts of a topic (runs in a worker thread)"""
+    posts_url = f"{DISCOURSE_URL}/t/{topic_id}.json"
+    posts_data = safe_request(session, posts_url).json()
+    return posts_data.get('post_stream', {}).get('posts', [])
+
+def save_progress(topic_order, posts_by_topic, state, output_file):
+    """Write posts (in topic listing order) and the per-topic state"""
+    all_posts = [post for topic_id in topic_order for post in posts_by_topic.get(topic_id, [])]
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(all_posts, f, indent=2, ensure_ascii=False)
+    with open(STATE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    return len(all_posts)
+
 def scrape_discourse():
-    """Main scraping function with error handling and progress saving"""
+    """Main scraping function: fetches new or changed topics concurrently and saves progress"""
     session = create_session()
-    all_posts = []
+    state, posts_by_topic = load_previous_run()
+    topic_order = {}  # Topic ids in listing order (dict as an ordered set)
     page = 0
+    completed = False
+    stats = {"fetched": 0, "unchanged": 0}
 
     try:
-        while True:
-            topics_url = f"{DISCOURSE_URL}/c/{CATEGORY_PATH}.json?page={page}"
-            print(f"\n🔍 Page {page + 1}: {topics_url}")
-            
-            response = safe_request(session, topics_url)
-            data = response.json()
-
-            topic_list = data.get('topic_list', {})
-            if not isinstance(topic_list, dict):
-                raise ValueError("Unexpected API response format")
-            
-            topics = topic_list.get('topics', [])
-            print(f"📚 Found {len(topics)} topics")
-            
-            if not topics:
-                break
-
-            # Process topics
-            for topic in topics:
-                topic_id = topic['id']
-                created_at = datetime.fromisoformat(
-                    topic['created_at'].replace('Z', '+00:00')
-                ).astimezone(timezone.utc)
-                
-                if not (START_DATE <= created_at <= END_DATE):
-                    continue
-
-                # Get topic posts
-                posts_url = f"{DISCOURSE_URL}/t/{topic_id}.json"
-                print(f"  🔍 Processing topic {topic_id}")
-                
-                posts_response = safe_request(session, posts_url)
-                posts_data = posts_response.json()
-                
-                # Process all posts in topic
-                for post in posts_data.get('post_stream', {}).get('posts', []):
-                    processed_post = process_post(post)
-                    all_posts.append(processed_post)
-                
-                time.sleep(0.5)  # Rate limit between topics
-
-            # Save progress after each page
-            with open(OUTPUT_DIR / 'discourse_posts_temp.json', 'w', encoding='utf-8') as f:
-                json.dump(all_posts, f, indent=2, ensure_ascii=False)
-            print(f"💾 Saved {len(all_posts)} posts (temp file)")
-
-            # Check for more pages
-            if not topic_list.get('more_topics_url'):
-                break
-                
-            page += 1
-            time.sleep(1)  # Rate limit between pages
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            while True:
+                topics_url = f"{DISCOURSE_URL}/c/{CATEGORY_PATH}.json?page={page}"
+                print(f"\n🔍 Page {page + 1}: {topics_url}")
+
+                response = safe_request(session, topics_url)
+                data = response.json()
+
+                topic_list = data.get('topic_list', {})
+                if not isinstance(topic_list, dict):
+                    raise ValueError("Unexpected API response format")
+
+                topics = topic_list.get('topics', [])
+                print(f"📚 Found {len(topics)} topics")
+
+                if not topics:
+                    break
+
+                # Fetch new or changed topics concurrently
+                futures = {}
+                for topic in topics:
+                    topic_id = str(topic['id'])
+                    created_at = datetime.fromisoformat(
+                        topic['created_at'].replace('Z', '+00:00')
+                    ).astimezone(timezone.utc)
+
+                    if not (START_DATE <= created_at <= END_DATE) or topic_id in topic_order:
+                        continue
+                    topic_order[topic_id] = None
+
+                    if state.get(topic_id) == topic_version(topic) and topic_id in posts_by_topic:
+                        stats["unchanged"] += 1
+                        continue
+                    futures[topic_id] = (topic, executor.submit(fetch_topic, session, topic_id))
+
+                # Process the page's posts together, so its images are described in one batch
+                raw_posts = []
+                for topic_id, (topic, future) in futures.items():
+                    print(f"  🔍 Processing topic {topic_id}")
+                    raw_posts += future.result()
+                fetched = {topic_id: [] for topic_id in futures}
+                for post in process_posts(raw_posts):
+                    fetched[str(post['topic_id'])].append(post)
+                # Replace saved posts only once the whole page succeeded, so a
+                # failure keeps the previous posts of every topic on it
+                posts_by_topic.update(fetched)
+                for topic_id, (topic, _) in futures.items():
+                    state[topic_id] = topic_version(topic)
+                    stats["fetched"] += 1
+
+                # Save progress after each page
+                count = save_progress(topic_order, posts_by_topic, state, OUTPUT_DIR / 'discourse_posts_temp.json')
+                print(f"💾 Saved {count} posts (temp file)")
+
+                # Check for more pages
+                if not topic_list.get('more_topics_url'):
+                    break
+
+                page += 1
+        completed = True
 
     except Exception as e:
         print(f"\n❌ Error: {str(e)}")
     finally:
-        # Save results to correct location
-        output_file = OUTPUT_DIR / 'discourse_posts.json'
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(all_posts, f, indent=2, ensure_ascii=False)
-        print(f"\n💾 Saved {len(all_posts)} posts to {output_file}")
+        # After a failed run, keep topics from the previous run that were not reached
+        if not completed:
+            for topic_id in posts_by_topic:
+                topic_order.setdefault(topic_id, None)
+        state = {topic_id: version for topic_id, version in state.items() if topic_id in topic_order}
+        count = save_progress(topic_order, posts_by_topic, state, OUTPUT_FILE)
+        print(f"\n💾 Saved {count} posts to {OUTPUT_FILE}")
+        print(f"🔁 Fetched {stats['fetched']} topics, skipped {stats['unchanged']} unchanged")
 
 if __name__ == "__main__":
     scrape_discourse()
@@ -0,0 +1,206 @@
+import re
+import zlib
+import numpy as np
+from bs4 import BeautifulSoup
+from python_scripts.utils.text_processing import split_sentences
+
+# Structured chunks hold whole paragraphs up to CHUNK_WORDS words; a chunk
+# shorter than MIN_CHUNK_WORDS continues into the next section
+CHUNK_WORDS = 500
+MIN_CHUNK_WORDS = 250
+
+# Fixed-window chunking (the original chunker)
+WINDOW_SIZE = 500  # words (approximate)
+WINDOW_OVERLAP = 100  # words
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE_RE = re.compile(r"^\s*(```|~~~)")
+BLOCK_TAGS = ["p", "div", "li", "pre", "blockquote", "h1", "h2", "h3", "h4", "h5", "h6", "table", "tr"]
+
+def chunk_text(text, chunk_size=WINDOW_SIZE, overlap=WINDOW_OVERLAP):
+    """Fixed windows of chunk_size words, overlapping by overlap words."""
+    words = text.split()
+    chunks = []
+    start = 0
+    while start < len(words):
+        end = min(start + chunk_size, len(words))
+        chunk = " ".join(words[start:end])
+        chunks.append(chunk)
+        if end == len(words):
+            break
+        start += chunk_size - overlap
+    return chunks
+
+def markdown_sections(text):
+    """Split Markdown into [(heading trail, [paragraphs])].
+
+    Paragraphs are separated by blank lines; a fenced code block is one
+    paragraph. Each heading starts a section and is its first paragraph.
+    """
+    sections = [([], [])]
+    headings = []
+    paragraph = []
+    in_fence = False
+
+    def flush():
+        if paragraph:
+            sections[-1][1].append("\n".join(paragraph).strip())
+            paragraph.clear()
+
+    for line in text.splitlines():
+        if FENCE_RE.match(line):
+            if not in_fence:
+                flush()
+            paragraph.append(line)
+            in_fence = not in_fence
+            if not in_fence:
+                flush()
+            continue
+        if in_fence:
+            paragraph.append(line)
+            continue
+        heading = HEADING_RE.match(line)
+        if heading:
+            flush()
+            level = len(heading.group(1))
+            headings = [h for h in headings if h[0] < level] + [(level, heading.group(2))]
+            sections.append(([title for _, title in headings], [line.strip()]))
+        elif not line.strip():
+            flush()
+        else:
+            paragraph.append(line)
+    flush()
+    return [(trail, [p for p in paragraphs if p]) for trail, paragraphs in sections if any(paragraphs)]
+
+def html_paragraphs(html):
+    """Plain-text paragraphs of a Discourse post.
+
+    Quoted replies (aside.quote) are dropped, as they repeat another post;
+    code blocks are kept as text.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    for elem in soup.select("aside.quote, img"):
+        elem.decompose()
+    for br in soup.find_all("br"):
+        br.replace_with("\n")
+    for elem in soup.find_all(BLOCK_TAGS):
+        elem.insert_before("\n\n")
+        elem.insert_after("\n\n")
+    paragraphs = []
+    for paragraph in re.split(r"\n\s*\n", soup.get_text()):
+        paragraph = re.sub(r"[ \t]+", " ", paragraph).strip()
+        if paragraph:
+            paragraphs.append(paragraph)
+    return paragraphs
+
+def split_long(paragraph, max_words):
+    """Split a paragraph longer than max_words at sentence (or line, for code) boundaries."""
+    code = bool(FENCE_RE.match(paragraph))
+    units = []
+    for unit in paragraph.splitlines() if code else split_sentences(paragraph):
+        words = unit.split()
+        if len(words) > max_words:
+            # A single sentence longer than the limit is cut into word windows
+            units.extend(" ".join(words[i:i + max_words]) for i in range(0, len(words), max_words))
+        else:
+            units.append(unit)
+    joiner = "\n" if code else " "
+    pieces, current, size = [], [], 0
+    for unit in units:
+        n_words = len(unit.split())
+        if current and size + n_words > max_words:
+            pieces.append(joiner.join(current))
+            current, size = [], 0
+        current.append(unit)
+        size += n_words
+    if current:
+        pieces.append(joiner.join(current))
+    return pieces
+
+def pack_sections(sections, max_words=CHUNK_WORDS, min_words=MIN_CHUNK_WORDS):
+    """Greedily pack paragraphs into chunks of up to max_words words.
+
+    A chunk does not cross into the next section unless it is still shorter
+    than min_words. A chunk starting inside a section is prefixed with the
+    section's heading trail ("Docker > Install"), so it keeps its context.
+    """
+    chunks = []
+    current, size = [], 0
+
+    def flush():
+        nonlocal current, size
+        if current:
+            chunks.append("\n\n".join(current))
+        current, size = [], 0
+
+    for trail, paragraphs in sections:
+        if size >= min_words:
+            flush()
+        for paragraph in paragraphs:
+            pieces = split_long(paragraph, max_words) if len(paragraph.split()) > max_words else [paragraph]
+            for piece in pieces:
+                piece_size = len(piece.split())
+                if current and size + piece_size > max_words:
+                    flush()
+                if not current and trail and not HEADING_RE.match(piece):
+                    current.append(" > ".join(trail))
+                    size += len(current[0].split())
+                current.append(piece)
+                size += piece_size
+    flush()
+    return chunks
+
+def structured_chunks(text, text_format="markdown", max_words=CHUNK_WORDS, min_words=MIN_CHUNK_WORDS):
+    """Chunk Markdown (course pages) or HTML (Discourse posts) along headings and paragraphs.
+
+    Returns plain-text chunks; HTML is stripped here, once, at index time.
+    """
+    if text_format == "html":
+        sections = [([], html_paragraphs(text))]
+    else:
+        sections = markdown_sections(text)
+    return pack_sections(sections, max_words, min_words)
+
+class NearDuplicateFilter:
+    """Detects chunks that nearly repeat an earlier chunk (copied templates,
+    re-posted answers, pasted course text).
+
+    Each text gets a MinHash signature over its word shingles; LSH banding
+    finds earlier signatures sharing a band, and a text is a duplicate if
+    the estimated Jaccard similarity with one of them is >= threshold.
+    Only texts that were kept are remembered, so the first copy wins.
+    """
+
+    # Prime above the 32-bit shingle hashes; (a * h + b) stays below 2**64
+    PRIME = (1 << 32) + 15
+
+    def __init__(self, threshold=0.8, num_perm=64, bands=16, shingle_size=5, seed=0):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 31, num_perm, dtype=np.uint64)
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.buckets = {}  # (band, band bytes) -> [kept text ids]
+        self.signatures = []
+
+    def signature(self, text):
+        words = re.findall(r"\w+", text.lower())
+        k = self.shingle_size
+        shingles = {" ".join(words[i:i + k]) for i in range(max(len(words) - k + 1, 1))}
+        hashes = np.array([zlib.crc32(shingle.encode("utf-8")) for shingle in shingles], dtype=np.uint64)
+        return ((hashes[:, None] * self.a + self.b) % self.PRIME).min(axis=0)
+
+    def is_duplicate(self, text):
+        """True if text nearly repeats a kept text; otherwise remember it and return False."""
+        signature = self.signature(text)
+        keys = [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+        candidates = {i for key in keys for i in self.buckets.get(key, ())}
+        for i in candidates:
+            if np.mean(self.signatures[i] == signature) >= self.threshold:
+                return True
+        for key in keys:
+            self.buckets.setdefault(key, []).append(len(self.signatures))
+        self.signatures.append(signature)
+        return False
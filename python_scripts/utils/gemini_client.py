@@ -0,0 +1,28 @@
+import os
+import threading
+from dotenv import load_dotenv
+
+_lock = threading.Lock()
+_genai = None
+
+def get_genai():
+    """Import and configure google.generativeai once, on first use.
+
+    The import takes most of a second, so callers only pay for it when they
+    actually talk to Gemini. Raises ValueError if GEMINI_API_KEY is not set.
+    """
+    global _genai
+    with _lock:
+        if _genai is None:
+            load_dotenv()
+            api_key = os.getenv("GEMINI_API_KEY")
+            if not api_key:
+                raise ValueError("GEMINI_API_KEY not found in .env")
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            _genai = genai
+    return _genai
+
+def generative_model(model_name):
+    """Create a Gemini model with the shared configuration."""
+    return get_genai().GenerativeModel(model_name)
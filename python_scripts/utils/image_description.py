@@ -1,20 +1,18 @@
-import os
 import base64
-from dotenv import load_dotenv
-import google.generativeai as genai
+from functools import lru_cache
+from python_scripts.utils.gemini_client import generative_model
 
-# Load environment variables from .env
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in .env")
+PROMPT = "Describe this educational image in detail for student assistance."
 
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel("gemini-2.0-flash")
+@lru_cache(maxsize=None)
+def get_model():
+    """Gemini model for image descriptions, created on first use."""
+    return generative_model("gemini-2.0-flash")
 
-def describe_image_from_base64(base64_str, mime_type):
+async def describe_image_from_base64_async(base64_str, mime_type):
     """
-    Generate a detailed description for a base64-encoded image using Gemini.
+    Generate a detailed description for a base64-encoded image using Gemini,
+    without blocking the event loop.
     Args:
         base64_str (str): The base64-encoded image string (no header).
         mime_type (str): The image MIME type (e.g., 'image/png', 'image/jpeg', 'image/webp').
@@ -22,8 +20,8 @@ def describe_image_from_base64(base64_str, mime_type):
         str: Gemini-generated description.
     """
     image_bytes = base64.b64decode(base64_str)
-    response = model.generate_content([
-        "Describe this educational image in detail for student assistance.",
+    response = await get_model().generate_content_async([
+        PROMPT,
         {"mime_type": mime_type, "data": image_bytes}
     ])
     return response.text.strip()
@@ -0,0 +1,115 @@
+import json
+import time
+import sqlite3
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from python_scripts.utils.rate_limit import TokenBucket
+
+ROOT_DIR = Path(__file__).resolve().parent.parent.parent
+CACHE_DB = ROOT_DIR / 'data' / 'image_descriptions.sqlite'
+# Old JSON cache, imported into the SQLite cache on first use
+LEGACY_CACHE_FILE = ROOT_DIR / 'data' / 'image_descriptions_cache.json'
+
+PROMPT = "Describe this educational image in detail for student assistance. Alt text: '{alt}'. Image URL: {url}"
+ERROR_PREFIX = "Image description unavailable"
+
+def canonical_key(image_url, alt_text=""):
+    """Cache key shared by all scrapers: '<url>|<alt text>', whitespace-trimmed."""
+    return f"{image_url.strip()}|{' '.join(alt_text.split())}"
+
+def _looks_like_url(text):
+    return "://" in text or text.startswith("/")
+
+def legacy_key_to_canonical(key):
+    """Convert 'url|alt' (Discourse) and 'alt|url' (course) keys to the canonical key."""
+    first, _, rest = key.partition("|")
+    if _looks_like_url(first):
+        return canonical_key(first, rest)
+    alt, _, url = key.rpartition("|")
+    return canonical_key(url, alt)
+
+class DescriptionCache:
+    """SQLite-backed image description cache; writes are batched into one transaction."""
+
+    def __init__(self, path=CACHE_DB, legacy_file=LEGACY_CACHE_FILE):
+        is_new = not Path(path).exists()
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS descriptions ("
+            "key TEXT PRIMARY KEY, description TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        if is_new and legacy_file and Path(legacy_file).exists():
+            self.import_legacy(legacy_file)
+
+    def import_legacy(self, legacy_file):
+        with open(legacy_file, 'r', encoding='utf-8') as f:
+            legacy = json.load(f)
+        # Failed descriptions were cached too; leave those out so they are retried
+        self.put_many({
+            legacy_key_to_canonical(key): description
+            for key, description in legacy.items()
+            if not description.startswith(ERROR_PREFIX)
+        })
+        print(f"📥 Imported {len(legacy)} legacy image descriptions")
+
+    def get_many(self, keys):
+        """Return {key: description} for the keys that are cached."""
+        found = {}
+        keys = list(keys)
+        for start in range(0, len(keys), 500):  # stay under SQLite's variable limit
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.db.execute(
+                f"SELECT key, description FROM descriptions WHERE key IN ({placeholders})", batch
+            )
+            found.update(rows)
+        return found
+
+    def put_many(self, descriptions):
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO descriptions (key, description, created_at) VALUES (?, ?, ?)",
+                [(key, description, now) for key, description in descriptions.items()]
+            )
+
+class ImageDescriptionService:
+    """Describes images with Gemini: deduplicated, cached, concurrent and rate limited."""
+
+    def __init__(self, model, cache=None, requests_per_second=1.0, max_workers=4, flush_every=50):
+        self.model = model
+        self.cache = cache or DescriptionCache()
+        self.rate_limiter = TokenBucket(requests_per_second)
+        self.max_workers = max_workers
+        self.flush_every = flush_every
+
+    def _generate(self, image_url, alt_text):
+        self.rate_limiter.acquire()
+        try:
+            response = self.model.generate_content(PROMPT.format(alt=alt_text, url=image_url))
+            return response.text.strip(), True
+        except Exception as e:
+            return f"{ERROR_PREFIX}: {str(e)}", False
+
+    def describe_many(self, images):
+        """Describe (image_url, alt_text) pairs; returns {canonical key: description}."""
+        unique = {canonical_key(url, alt): (url, alt) for url, alt in images}
+        descriptions = self.cache.get_many(unique)
+        missing = {key: image for key, image in unique.items() if key not in descriptions}
+        if not missing:
+            return descriptions
+
+        print(f"🖼️ Describing {len(missing)} new images ({len(unique) - len(missing)} cached)")
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._generate, *image): key for key, image in missing.items()}
+            for future in as_completed(futures):
+                description, ok = future.result()
+                descriptions[futures[future]] = description
+                if ok:  # Errors are returned but not cached, so they are retried next run
+                    pending[futures[future]] = description
+                if len(pending) >= self.flush_every:
+                    self.cache.put_many(pending)
+                    pending = {}
+        self.cache.put_many(pending)
+        return descriptions
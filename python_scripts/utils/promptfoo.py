@@ -0,0 +1,54 @@
+import yaml
+from pathlib import Path
+from urllib.parse import urlparse
+
+ROOT_DIR = Path(__file__).resolve().parent.parent.parent
+PROMPTFOO_FILES = [
+    ROOT_DIR / "project-tds-virtual-ta-promptfoo.yaml",
+    ROOT_DIR / "backup.yaml"
+]
+
+def normalize_url(url):
+    """Comparable key for a link: 'topic:<id>' for Discourse, 'page:<slug>' for course pages.
+
+    Expected links (".../t/ga5-question-8-clarification/155939",
+    "https://tds.s-anand.net/#/docker") and chunk URLs (".../t/155939/3",
+    ".../blob/main/docker.md") then map to the same key.
+    """
+    parsed = urlparse(url.strip())
+    if "/t/" in parsed.path:
+        segments = [s for s in parsed.path.split("/t/", 1)[1].split("/") if s]
+        if segments and not segments[0].isdigit():
+            segments = segments[1:]  # skip the topic slug
+        if segments:
+            return f"topic:{segments[0]}"
+    page = parsed.fragment if parsed.fragment.startswith("/") else parsed.path
+    slug = Path(page.strip("/")).stem.lower()
+    return f"page:{slug}" if slug else url
+
+def load_tests(paths=PROMPTFOO_FILES):
+    """Read promptfoo tests as [{"question", "image", "expected_urls"}].
+
+    Expected URLs come from the `link` var and from `contains` assertions on
+    the links. Questions repeated across files are kept once.
+    """
+    tests = {}
+    for path in paths:
+        if not Path(path).exists():
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+        for test in config.get("tests", []):
+            test_vars = test.get("vars", {})
+            question = test_vars.get("question", "").strip()
+            if not question:
+                continue
+            expected = set()
+            if test_vars.get("link"):
+                expected.add(test_vars["link"])
+            for check in test.get("assert", []):
+                if check.get("type") == "contains" and "links" in check.get("transform", ""):
+                    expected.add(check["value"])
+            entry = tests.setdefault(question, {"question": question, "image": test_vars.get("image"), "expected_urls": set()})
+            entry["expected_urls"] |= expected
+    return [dict(test, expected_urls=sorted(test["expected_urls"])) for test in tests.values()]
@@ -0,0 +1,40 @@
+import time
+import asyncio
+import threading
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter.
+
+    Allows bursts of up to `capacity` calls, refilled at `rate` tokens per
+    second. acquire() blocks until a token is available; acquire_async()
+    waits without blocking the event loop.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _take(self, tokens):
+        """Take tokens if available; otherwise return the seconds to wait."""
+        with self.lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        while wait := self._take(tokens):
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens=1):
+        while wait := self._take(tokens):
+            await asyncio.sleep(wait)
@@ -0,0 +1,20 @@
+import numpy as np
+from api.vector_index import save_ivf_index, save_pq_index
+from api.lexical_index import save_lexical_index
+from api.embedding_store import IVF_INDEX_FILE, LEXICAL_INDEX_FILE, PQ_INDEX_FILE
+
+def build_indexes(store):
+    """Build the indexes served next to the store in EMBED_DIR (embed_all_data.py, convert_store.py)."""
+    # Approximate (IVF) vector index for VECTOR_INDEX=ivf
+    n_lists = save_ivf_index(IVF_INDEX_FILE, store.embeddings)
+    print(f"✅ IVF index with {n_lists} lists saved to {IVF_INDEX_FILE}")
+
+    # BM25 index over the same chunks for hybrid retrieval
+    n_terms = save_lexical_index(LEXICAL_INDEX_FILE, store.chunks)
+    print(f"✅ Lexical index with {n_terms} terms saved to {LEXICAL_INDEX_FILE}")
+
+    # Rebuild the PQ index (python_scripts/quantize_store.py --pq) so it matches the new chunks
+    if PQ_INDEX_FILE.exists():
+        n_subspaces = np.load(PQ_INDEX_FILE)["codes"].shape[1]
+        save_pq_index(PQ_INDEX_FILE, store.embeddings, n_subspaces=n_subspaces)
+        print(f"✅ PQ index with {n_subspaces} subspaces saved to {PQ_INDEX_FILE}")
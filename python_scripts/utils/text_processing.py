@@ -0,0 +1,19 @@
+import re
+from bs4 import BeautifulSoup
+
+# Sentence boundary: end of sentence punctuation followed by whitespace,
+# skipping common abbreviations like "e.g." and "Mr."
+SENTENCE_SPLIT_RE = re.compile(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?)\s')
+
+def clean_html(html):
+    """Convert HTML to clean plain text."""
+    soup = BeautifulSoup(html, "html.parser")
+    # Remove code blocks and images (already processed)
+    for elem in soup.find_all(['pre', 'code', 'img']):
+        elem.decompose()
+    return soup.get_text(separator=" ", strip=True)
+
+def split_sentences(text):
+    """Split plain text into non-empty, stripped sentences."""
+    sentences = [s.strip() for s in SENTENCE_SPLIT_RE.split(text)]
+    return [s for s in sentences if s]